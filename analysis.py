@@ -0,0 +1,120 @@
+#!/usr/bin/python3
+"""
+    This module works out how much a gait asks of the air supply before
+    it's played: how many channels are open on each step, how much they
+    add up to, and each channel's duty cycle. It also points out intervals
+    that are out of order or overlap, which read_channel() gets wrong.
+"""
+
+# Global setting for the most channels that should be open at once. None means no limit
+MAX_ACTIVE_CHANNELS = None
+# Global setting for the most total load (the sum of every channel's duty cycle, from
+# 0 to 1 each) that should be asked for on one step. None means no limit
+MAX_TOTAL_LOAD = None
+
+import numpy # install package by typing: pip install numpy
+from core import CompactTimeline, compile_timeline, scale_frames
+
+class GaitAnalysis:
+    """
+    Holds the load profile of one cycle of a gait at a given multiplier.
+    """
+
+    def __init__(self, amplitudes, multiplier):
+        """
+        Works out the profile from a compiled timeline.
+            :param amplitudes: is the matrix returned by compile_timeline(),
+                or a resampled version of it.
+            :param multiplier: is what the run multiplies amplitudes by.
+        """
+        self.multiplier = multiplier
+        # the duty cycle of every channel on every step, from 0 to 1
+        duty = scale_frames(amplitudes, multiplier)
+
+        # per step
+        self.active = numpy.count_nonzero(amplitudes, axis=1)
+        self.load = duty.sum(axis=1)
+        # per channel, averaged over the cycle
+        self.duty = duty.mean(axis=0) if len(duty) else numpy.zeros(amplitudes.shape[1])
+
+        self.peak_active = int(self.active.max()) if len(self.active) else 0
+        self.peak_load = float(self.load.max()) if len(self.load) else 0.0
+        self.peak_step = int(self.load.argmax()) if len(self.load) else 0
+        self.mean_load = float(self.load.mean()) if len(self.load) else 0.0
+
+    def warnings(self, max_active=None, max_load=None):
+        """
+        Returns a list of messages about steps that ask too much of the air supply.
+            :param max_active: is the most channels that should be open at once.
+                Defaults to MAX_ACTIVE_CHANNELS.
+            :param max_load: is the most total load for one step. Defaults to MAX_TOTAL_LOAD.
+        """
+        max_active = MAX_ACTIVE_CHANNELS if max_active is None else max_active
+        max_load = MAX_TOTAL_LOAD if max_load is None else max_load
+        messages = []
+        if max_active is not None:
+            over = numpy.flatnonzero(self.active > max_active)
+            if len(over):
+                messages.append("{} steps open more than {} channels at once (up to {}, first on step {})".format(
+                    len(over), max_active, self.peak_active, over[0]))
+        if max_load is not None:
+            over = numpy.flatnonzero(self.load > max_load)
+            if len(over):
+                messages.append("{} steps have a total load over {} (up to {:.2f} on step {})".format(
+                    len(over), max_load, self.peak_load, self.peak_step))
+        return messages
+
+    def summary(self):
+        """
+        Returns a one-line summary of the profile.
+        """
+        return "at most {} channels open at once, total load peaks at {:.2f} on step {} (mean {:.2f})".format(
+            self.peak_active, self.peak_load, self.peak_step, self.mean_load)
+
+def analyze_timeline(timeline, steps, multiplier=1.0):
+    """
+    Returns the GaitAnalysis of a parsed timeline.
+        :param timeline: is the 2D array of intervals to analyze.
+        :param steps: is the number of steps in one cycle.
+        :param multiplier: is what the run multiplies amplitudes by.
+    """
+    return GaitAnalysis(compile_timeline(timeline, steps), multiplier)
+
+def interval_problems(timeline, steps):
+    """
+    Returns a list of (channel, message) for intervals that are listed out of order,
+    overlap another interval on the same channel, or run past the end of the cycle.
+    Playback handles all of these (see core.normalize_intervals()), but read_channel()
+    doesn't, and they're usually a mistake in the file.
+        :param timeline: is the CompactTimeline or 2D array of intervals to check.
+        :param steps: is the number of steps in one cycle.
+    """
+    timeline = CompactTimeline.from_lists(timeline)
+    if not len(timeline.intervals):
+        return []
+    # every interval in one array, with the channel it's on
+    channels = timeline.channels()
+    starts = timeline.intervals["start"].astype(numpy.int64)
+    ends = starts + timeline.intervals["duration"]
+
+    # compare each interval to the one listed before it on the same channel
+    same_channel = channels[1:] == channels[:-1]
+    unsorted = same_channel & (starts[1:] < starts[:-1])
+    # in order of start, an interval overlaps if it starts before the latest end so far.
+    # offsetting each channel above the last makes the running maximum restart per channel
+    order = numpy.lexsort((starts, channels))
+    offset = channels.astype(numpy.int64) * (int(ends.max()) + 1)
+    latest_end = numpy.maximum.accumulate((offset + ends)[order]) - offset[order]
+    overlapping = same_channel & (starts[order][1:] < latest_end[:-1])
+    past_end = ends > steps
+
+    problems = []
+    # the first two compare pairs, so they start from each channel's second interval
+    for name, flags, skip in (("listed out of order", unsorted, 1),
+                              ("overlaps another", overlapping, 1),
+                              ("runs past the end of the cycle", past_end, 0)):
+        flagged, counts = numpy.unique(channels[skip:][flags], return_counts=True)
+        for chan, count in zip(flagged.tolist(), counts.tolist()):
+            problems.append((chan, "{} interval{} {}".format(count, "" if count == 1 else "s", name)))
+    problems.sort(key=lambda problem: problem[0])
+    return problems
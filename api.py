@@ -0,0 +1,185 @@
+#!/usr/bin/python3
+"""
+    This module plays gaits from other Python programs without any
+    prompts, so experiments can be scripted. It only prints what the
+    session's log level allows, which is nothing by default.
+
+        import api
+        with api.open_device(simulated=True) as session:
+            metrics = api.play(session, "gaits/walk.gait", 1.0, 0.5, cycles=10)
+            api.play(session, "gaits/run.gait", 0.5, 0.5, wait=False)
+            time.sleep(3)
+            api.stop(session)
+
+    Run it directly to play a batch of gaits one after another. The
+    metrics of each run are printed as a line of JSON.
+
+        ./api.py gaits/walk.gait gaits/run.gait --cycle-time 1.0 --multiplier 0.5 --cycles 10
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+from cache import load_timeline
+from compose import Gait
+from output import PWM_board
+from session import PlaybackSession, CYCLE_BOUNDARY
+from tracelog import SILENT, LOG_LEVELS
+
+def load(filename, strict=False):
+    """
+    Returns (timeline, steps) from a gait file, from the parse cache if it hasn't
+    changed. Raises ValueError if it has no valid intervals.
+        :param filename: is the path to the gait file.
+        :param strict: is whether to raise ValueError for any parse error too,
+            instead of leaving the bad intervals out like the menus do.
+    """
+    timeline, steps, errors = load_timeline(filename)
+    if strict and errors:
+        line_num, message = errors[0]
+        raise ValueError("{} line {}: {} ({} errors)".format(filename, line_num, message, len(errors)))
+    if not timeline:
+        raise ValueError("{} has no valid intervals".format(filename))
+    return timeline, steps
+
+def open_device(simulated=None, layout=None, log_level=SILENT, **options):
+    """
+    Returns a PlaybackSession connected to the boards. Close it when done to shut
+    off every output, or use it in a with statement. Raises OSError if the boards
+    can't be connected.
+        :param simulated: is whether to use simulated boards. Defaults to output.SIMULATED,
+            or True if the I2C library isn't installed.
+        :param layout: is an optional list of (first channel, bus, address) for each board.
+            Defaults to the same layout the menus use. See PWM_board.find_layout().
+        :param log_level: is how much the session prints, one of tracelog.LOG_LEVELS.
+        :param options: are passed on to PlaybackSession, like crossfade_time or record.
+            Unlike the menus, the metrics of each run aren't saved unless save_metrics=True.
+    """
+    options.setdefault("save_metrics", False)
+    session = PlaybackSession(PWM_board(simulated=simulated, layout=layout), log_level=log_level, **options)
+    if not session.connect():
+        raise OSError("couldn't connect to the boards")
+    return session
+
+def gait_source(gait):
+    """
+    Returns (timeline, steps, filename) for anything play() accepts as a gait.
+    The filename is None if it didn't come from a file. A compose.Gait is passed
+    on as the timeline, so the session plays its remembered frames instead of
+    turning it into intervals and compiling them again.
+        :param gait: is a gait filename, a compose.Gait, or (timeline, steps).
+    """
+    if isinstance(gait, Gait):
+        return gait, gait.steps, None
+    if isinstance(gait, (str, os.PathLike)):
+        timeline, steps = load(gait)
+        return timeline, steps, os.fspath(gait)
+    timeline, steps = gait
+    return timeline, steps, None
+
+def play(session, gait, cycle_time, multiplier, cycles=None, duration=None, wait=True,
+         boundary=CYCLE_BOUNDARY):
+    """
+    Plays a gait on a session. Waits until it's done and returns the Metrics of
+    the run, or with wait=False, starts it in the background and returns None.
+    If the session is already playing in the background, the new gait and
+    settings take over at the next boundary instead.
+        :param session: is the PlaybackSession to play on, from open_device().
+        :param gait: is a gait filename, a compose.Gait, or (timeline, steps).
+        :param cycle_time: is how long each cycle takes, in seconds.
+        :param multiplier: is what to multiply amplitudes by.
+        :param cycles: is an optional number of cycles to play before stopping.
+        :param duration: is an optional number of seconds to play before stopping.
+        :param wait: is whether to play in the calling thread until it's done.
+            At least one of cycles or duration is needed to wait.
+        :param boundary: is when a change to a playing session takes over,
+            session.STEP_BOUNDARY or session.CYCLE_BOUNDARY.
+    """
+    if not cycle_time > 0:
+        raise ValueError("the cycle time has to be more than 0")
+    if wait and cycles is None and duration is None:
+        raise ValueError("give cycles or duration to wait for, or play with wait=False and call stop()")
+    # a run from play(wait=False) that hasn't set playing yet still counts
+    running = session.playing or (session.thread is not None and session.thread.is_alive())
+    if wait and running:
+        raise RuntimeError("the session is already playing. Stop it first, or play with wait=False")
+    timeline, steps, filename = gait_source(gait)
+
+    # load() works out the frames with whatever settings are current,
+    # so set them first to only do it once
+    with session.lock:
+        session.cycle_time = cycle_time
+        session.multiplier = multiplier
+    session.load(timeline, steps, filename, boundary)
+
+    if not wait:
+        # does nothing if it's already playing, since the change was queued
+        session.start(cycles, duration)
+        return None
+    metrics = session.play(cycles, duration)
+    if metrics is None:
+        raise OSError("couldn't connect to the boards")
+    return metrics
+
+def stop(session, hold=None):
+    """
+    Stops a session playing in the background and waits for it. Returns the
+    Metrics of the run, or None if nothing has been played.
+        :param session: is the PlaybackSession to stop.
+        :param hold: is whether to leave the outputs where they are.
+            Defaults to the session's hold_on_stop.
+    """
+    session.stop(hold)
+    return session.metrics
+
+def main():
+    """
+    Plays each gait on the command line in turn on one connection to the boards,
+    and prints the metrics of each run as a line of JSON. Exits with status 1 if
+    any gait couldn't be played.
+    """
+    parser = argparse.ArgumentParser(description="Play gaits without any prompts.")
+    parser.add_argument("gaits", nargs="+", help="gait files to play, in order")
+    parser.add_argument("--cycle-time", type=float, required=True, help="seconds per cycle")
+    parser.add_argument("--multiplier", type=float, required=True, help="amplitude multiplier")
+    parser.add_argument("--cycles", type=int, help="cycles to play each gait for")
+    parser.add_argument("--duration", type=float, help="seconds to play each gait for")
+    parser.add_argument("--simulated", action="store_true", help="play on simulated boards")
+    parser.add_argument("--log-level", choices=LOG_LEVELS, default=SILENT,
+                        help="what playback prints, to stderr")
+    parser.add_argument("--strict", action="store_true", help="skip gaits with any parse errors")
+    args = parser.parse_args()
+    if args.cycles is None and args.duration is None:
+        parser.error("give --cycles, --duration, or both")
+    if not args.cycle_time > 0:
+        parser.error("--cycle-time has to be more than 0")
+
+    results = sys.stdout
+    failed = False
+    # anything playback prints goes to stderr, so stdout is only the results
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            session = open_device(simulated=True if args.simulated else None, log_level=args.log_level)
+        except OSError as error:
+            print(error)
+            sys.exit(1)
+        with session:
+            for filename in args.gaits:
+                try:
+                    if args.strict:
+                        load(filename, strict=True)
+                    metrics = play(session, filename, args.cycle_time, args.multiplier,
+                                   args.cycles, args.duration)
+                except ValueError as error:
+                    print(error)
+                    failed = True
+                    continue
+                results.write(json.dumps({"gait": filename, "metrics": metrics.to_dict()}) + "\n")
+                results.flush()
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+#!/usr/bin/python3
+"""
+    This module times the hot paths of the program on generated gaits,
+    so changes to them can be compared against a baseline. Run it
+    directly; it doesn't touch any real hardware.
+
+        ./benchmark.py [--size small|large] [--repeat N] [--output results.json]
+"""
+
+# Global setting for the sizes of generated gaits, as (channels, steps)
+BENCHMARK_SIZES = {
+    "small": (32, 256),
+    "large": (2048, 1024),
+}
+# Global setting for how many intervals each channel gets in a sparse gait
+SPARSE_INTERVALS = 4
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from core import read_channel, do_cycle, compile_timeline, scale_frames
+from parse import read_timeline
+from visualization import print_timeline
+from scheduler import Scheduler
+# the boards here are always simulated, so the I2C library is never imported
+import output
+import simulation
+
+def generate_gait(channels, steps, pattern, seed=0):
+    """
+    Returns the lines of a generated gait file.
+        :param channels: is the number of channels (lines) to make.
+        :param steps: is the step count of the timeline.
+        :param pattern: is "dense" for a new interval on every step of every
+            channel, or "sparse" for SPARSE_INTERVALS spread over each channel.
+        :param seed: is the random seed, so runs are repeatable.
+    """
+    rand = random.Random(seed)
+    lines = ["# generated by benchmark.py", "steps: {}".format(steps)]
+    for _ in range(0, channels):
+        if pattern == "dense":
+            intervals = [(start, 1, rand.randint(0, 10)) for start in range(0, steps)]
+        else:
+            starts = sorted(rand.sample(range(0, steps), min(SPARSE_INTERVALS, steps)))
+            intervals = [(start, rand.randint(1, max(1, steps // (2 * SPARSE_INTERVALS))),
+                          rand.randint(1, 10)) for start in starts]
+        lines.append(", ".join("{} {} {}".format(*interval) for interval in intervals))
+    return lines
+
+def time_best(function, repeat):
+    """
+    Returns the shortest time in seconds that a function took over several runs.
+        :param function: is the function to call with no arguments.
+        :param repeat: is how many times to run it.
+    """
+    best = None
+    for _ in range(0, repeat):
+        start = time.perf_counter()
+        function()
+        duration = time.perf_counter() - start
+        if best is None or duration < best:
+            best = duration
+    return best
+
+def walk_channels(timeline, steps):
+    """
+    Reads every channel at every step with read_channel, the way playback used to.
+        :param timeline: is the 2D array of intervals to read.
+        :param steps: is the number of steps in one cycle.
+    """
+    cursors = [0] * len(timeline)
+    for curr_step in range(0, steps):
+        for chan in range(0, len(timeline)):
+            _, cursors[chan] = read_channel(timeline, chan, cursors[chan], curr_step)
+
+def simulated_board(channels):
+    """
+    Returns a connected PWM_board with enough simulated boards for the given
+    channel count, on its own simulated bus. The bus only adds up the time
+    transactions would take, so the timings are just the cost of send() itself.
+        :param channels: is the number of channels that will be sent.
+    """
+    bus = simulation.SimulatedBus(realtime=False)
+    board = output.PWM_board(simulated=True, board_count=(channels + 15) // 16)
+    board.connect()
+    for pca in board.boards:
+        pca._device.bus = bus
+    bus.reset()
+    return board, bus
+
+def run_case(name, pattern, channels, steps, repeat, folder):
+    """
+    Returns the benchmark results for one generated gait.
+        :param name: is the size name the gait was made from.
+        :param pattern: is "dense" or "sparse".
+        :param channels: is the number of channels in the gait.
+        :param steps: is the step count of the gait.
+        :param repeat: is how many times to time each path.
+        :param folder: is where to write the generated gait file.
+    """
+    filename = os.path.join(folder, "{}_{}.gait".format(name, pattern))
+    with open(filename, "w") as file:
+        file.write("\n".join(generate_gait(channels, steps, pattern)) + "\n")
+
+    timeline, steps, _ = read_timeline(filename)
+    intervals = sum(len(channel) for channel in timeline)
+    amplitudes = compile_timeline(timeline, steps)
+    frames = scale_frames(amplitudes, 1.0)
+    params = {"size": name, "pattern": pattern, "channels": channels,
+              "steps": steps, "intervals": intervals}
+
+    def play():
+        # a zero step time means the scheduler never sleeps
+        scheduler = Scheduler(0.0)
+        scheduler.start()
+        do_cycle(board, amplitudes, frames, scheduler)
+
+    def send_all():
+        # start from unknown board state so every frame is compared and written
+        board.shadow = [[None] * 16 for _ in board.shadow]
+        for frame in frames:
+            board.send(frame)
+
+    board, bus = simulated_board(channels)
+    results = []
+    with open(os.devnull, "w") as null, contextlib.redirect_stdout(null):
+        timings = [
+            ("parse.read_timeline", lambda: read_timeline(filename), intervals),
+            ("core.compile_timeline", lambda: compile_timeline(timeline, steps), steps),
+            ("core.read_channel", lambda: walk_channels(timeline, steps), steps),
+            ("core.do_cycle", play, steps),
+            ("visualization.print_timeline", lambda: print_timeline(timeline, steps), steps),
+            ("output.PWM_board.send", send_all, steps),
+        ]
+        for path, function, items in timings:
+            # only count the bus traffic of the send() runs
+            bus.reset()
+            seconds = time_best(function, repeat)
+            results.append({"name": path, "params": params, "seconds": seconds,
+                            "items": items, "seconds_per_item": seconds / items})
+
+    # what the writes would have cost on a real bus, for the send() runs above
+    results[-1]["transactions"] = bus.transactions // repeat
+    results[-1]["bus_seconds"] = bus.busy_time / repeat
+    return results
+
+def git_revision():
+    """
+    Returns the current git commit hash, or None if it can't be found.
+    """
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    """
+    Runs the benchmarks chosen on the command line and prints or saves the results.
+    """
+    parser = argparse.ArgumentParser(description="Time the hot paths on generated gaits.")
+    parser.add_argument("--size", choices=sorted(BENCHMARK_SIZES), action="append",
+                        help="gait size to run. Can be given more than once. Defaults to all")
+    parser.add_argument("--pattern", choices=["dense", "sparse"], action="append",
+                        help="interval pattern to run. Can be given more than once. Defaults to both")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per timing, best is kept")
+    parser.add_argument("--output", help="JSON file to save results to. Defaults to stdout")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for name in args.size or sorted(BENCHMARK_SIZES):
+            channels, steps = BENCHMARK_SIZES[name]
+            for pattern in args.pattern or ["dense", "sparse"]:
+                print("running {} {} ({} channels x {} steps)...".format(
+                    name, pattern, channels, steps), file=sys.stderr)
+                results += run_case(name, pattern, channels, steps, args.repeat, folder)
+
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/python3
+"""
+    This module keeps parsed gaits in a compact binary cache, so
+    opening a gait that hasn't changed skips the parser entirely.
+
+    Cached files are named after a hash of the gait file's contents
+    and hold a small header followed by two int32 arrays: where each
+    channel's intervals start, then every interval as (start,
+    duration, amplitude). Any parse errors come last, as JSON.
+    Loading one memory-maps the arrays straight into a CompactTimeline,
+    so a cached gait takes almost no time or memory to open.
+"""
+
+# Global setting for the folder compiled gaits are cached in. None turns the cache off
+CACHE_FOLDER = ".gait_cache"
+# Global setting for how many bytes of cached gaits to keep. The ones used longest ago
+# are deleted past this, since every edit of a gait leaves its old cache file behind
+CACHE_SIZE_LIMIT = 64 * 1024 * 1024
+# Marks the start of a cache file
+CACHE_MAGIC = b"GAIT"
+# Bump this whenever the cache format or the parser's output changes
+CACHE_VERSION = 3
+
+import hashlib
+import json
+import os
+import struct
+import numpy # install package by typing: pip install numpy
+from core import CompactTimeline, INTERVAL_DTYPE
+from parse import read_timeline, file_exists
+
+# magic, version, steps, channel count, interval count, length of the errors JSON
+HEADER = struct.Struct("<4sHIIII")
+
+def load_timeline(filename, verbose=False):
+    """
+    Returns the same (timeline, steps, errors) as read_timeline(), but from the cache
+    when the file hasn't changed since it was last parsed.
+        :param filename: is the path to the timeline file.
+        :param verbose: is an optional flag. When true, the file is always parsed
+            so the extra parsing information can be printed.
+    """
+    if verbose or not CACHE_FOLDER or not file_exists(filename):
+        return read_timeline(filename, verbose)
+
+    with open(filename, "rb") as file:
+        key = hashlib.sha1(file.read()).hexdigest()
+    path = cache_path(key)
+
+    cached = read_cache(path)
+    if cached is not None:
+        # so pruning keeps the gaits that are still used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return cached
+
+    timeline, steps, errors = read_timeline(filename, verbose)
+    if write_cache(path, timeline, steps, errors):
+        prune_cache()
+    return timeline, steps, errors
+
+def cache_path(key):
+    """
+    Returns where the cache file for a content hash goes.
+        :param key: is the hex digest of the gait file's contents.
+    """
+    return os.path.join(CACHE_FOLDER, "{}-v{}.bin".format(key, CACHE_VERSION))
+
+def write_cache(path, timeline, steps, errors):
+    """
+    Saves a parsed timeline to a cache file. Returns whether it was saved. Does nothing
+    if it can't be written, or if a value like the step count doesn't fit the format.
+        :param path: is the cache file to write.
+        :param timeline: is the CompactTimeline or 2D array of intervals to save.
+        :param steps: is the number of steps in one cycle.
+        :param errors: is the list of (line number, message) the parser returned.
+    """
+    timeline = CompactTimeline.from_lists(timeline)
+    offsets = timeline.offsets.astype("<i4")
+    intervals = timeline.intervals
+    error_json = json.dumps(errors).encode() if errors else b""
+    try:
+        header = HEADER.pack(CACHE_MAGIC, CACHE_VERSION, steps, len(timeline), len(intervals), len(error_json))
+    except struct.error:
+        # the parser doesn't limit the step count, so it can be too big for the header
+        return False
+
+    try:
+        os.makedirs(CACHE_FOLDER, exist_ok=True)
+        # write to a temporary file first so a half-written cache is never read
+        temp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(temp_path, "wb") as file:
+            file.write(header)
+            file.write(offsets.tobytes())
+            file.write(intervals.tobytes())
+            file.write(error_json)
+        os.replace(temp_path, path)
+    except OSError:
+        return False
+    return True
+
+def prune_cache(limit=None):
+    """
+    Deletes the cached gaits used longest ago until the rest fit in the size limit.
+    Does nothing to files it can't get to.
+        :param limit: is the most bytes to keep. Defaults to CACHE_SIZE_LIMIT.
+    """
+    limit = CACHE_SIZE_LIMIT if limit is None else limit
+    cached = []
+    try:
+        for entry in os.scandir(CACHE_FOLDER):
+            # only gaits, not the catalog or anything else kept there
+            if entry.name.endswith(".bin") and entry.is_file():
+                info = entry.stat()
+                cached.append((info.st_mtime, info.st_size, entry.path))
+    except OSError:
+        return
+
+    total = sum(size for _, size, _ in cached)
+    for _, size, path in sorted(cached):
+        if total <= limit:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+def read_cache(path):
+    """
+    Returns (timeline, steps, errors) from a cache file, or None if there
+    isn't a valid one.
+        :param path: is the cache file to read.
+    """
+    try:
+        with open(path, "rb") as file:
+            header = file.read(HEADER.size)
+            if len(header) != HEADER.size:
+                return None
+            magic, version, steps, channels, count, error_length = HEADER.unpack(header)
+            if magic != CACHE_MAGIC or version != CACHE_VERSION:
+                return None
+            file.seek(HEADER.size + 4 * (channels + 1 + 3 * count))
+            error_json = file.read(error_length)
+    except OSError:
+        return None
+
+    if len(error_json) != error_length:
+        return None
+    errors = [tuple(error) for error in json.loads(error_json)] if error_length else []
+
+    if count == 0:
+        return CompactTimeline.from_lists([[]] * channels), steps, errors
+    try:
+        offsets = numpy.memmap(path, dtype="<i4", mode="r", offset=HEADER.size,
+                               shape=(channels + 1,))
+        intervals = numpy.memmap(path, dtype=INTERVAL_DTYPE, mode="r",
+                                 offset=HEADER.size + offsets.nbytes, shape=(count,))
+    except (OSError, ValueError):
+        return None
+
+    # the intervals stay memory-mapped, so only the parts that are read get loaded
+    return CompactTimeline(intervals, offsets), steps, errors
@@ -0,0 +1,230 @@
+#!/usr/bin/python3
+"""
+    This module keeps a catalog of every gait in a folder: its step and
+    channel counts, how many intervals and parse errors it has, and its
+    peak load. Files are parsed in a pool of processes, and the catalog
+    is saved so only files that changed are parsed again. Run it
+    directly to check every gait in a folder at once.
+
+        ./catalog.py [folder]
+"""
+
+# Global setting for how many processes parse files at once. None uses one per CPU
+CATALOG_WORKERS = None
+# Global setting for the fewest changed files worth starting the process pool for
+POOL_THRESHOLD = 4
+# Bump this whenever the metadata in the catalog changes
+CATALOG_VERSION = 1
+# File extensions that hold gaits
+GAIT_EXTENSIONS = (".txt", ".gait")
+
+import concurrent.futures
+import hashlib
+import json
+import os
+import sys
+import cache
+from cache import load_timeline
+from core import compile_timeline
+from analysis import GaitAnalysis, interval_problems
+
+def describe_file(path):
+    """
+    Returns a dictionary of metadata about one gait file. Runs in the worker processes.
+    If the file can't be read or parsed at all, like when it isn't text, that's
+    recorded as its only error instead of raised, so one bad file can't stop the
+    rest of the folder from being cataloged.
+        :param path: is the gait file to parse.
+    """
+    try:
+        return parse_metadata(path)
+    except Exception as error:
+        return {
+            "hash": None,
+            "steps": 0,
+            "channels": 0,
+            "intervals": 0,
+            # line 0, since it's about the whole file
+            "errors": [[0, "couldn't read the file: {}".format(error)]],
+            "problems": [],
+            "peak_active": 0,
+            "peak_load": 0.0,
+        }
+
+def parse_metadata(path):
+    """
+    Returns a dictionary of metadata about one gait file. Raises any error
+    from reading or parsing it.
+        :param path: is the gait file to parse.
+    """
+    with open(path, "rb") as file:
+        content_hash = hashlib.sha1(file.read()).hexdigest()
+    # goes through the parse cache, so the files are ready to open afterwards too
+    timeline, steps, errors = load_timeline(path)
+    metadata = {
+        "hash": content_hash,
+        "steps": steps,
+        "channels": len(timeline),
+        "intervals": len(timeline.intervals),
+        "errors": [list(error) for error in errors],
+        "problems": [list(problem) for problem in interval_problems(timeline, steps)] if timeline else [],
+        "peak_active": 0,
+        "peak_load": 0.0,
+    }
+    if timeline:
+        # at a multiplier of 1, so it can be scaled to any run
+        analysis = GaitAnalysis(compile_timeline(timeline, steps), 1.0)
+        metadata["peak_active"] = analysis.peak_active
+        metadata["peak_load"] = analysis.peak_load
+    return metadata
+
+def file_stat(path):
+    """
+    Returns something that changes whenever a file is saved.
+        :param path: is the file to check.
+    """
+    info = os.stat(path)
+    return [info.st_mtime_ns, info.st_size]
+
+class Catalog:
+    """
+    The metadata of every gait file in one folder, by filename.
+    """
+
+    def __init__(self, folder="gaits", path=None):
+        """
+        Makes a catalog and loads what was saved last time, if anything.
+        Call update() to bring it up to date with the folder.
+            :param folder: is the folder of gait files.
+            :param path: is where the catalog is saved. Defaults to a file in the
+                parse cache folder, or None (not saved) if the cache is off.
+        """
+        self.folder = folder
+        if path is None and cache.CACHE_FOLDER:
+            key = hashlib.sha1(os.path.abspath(folder).encode()).hexdigest()[:16]
+            path = os.path.join(cache.CACHE_FOLDER, "catalog-{}.json".format(key))
+        self.path = path
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        """
+        Reads the saved catalog. Leaves it empty if there isn't a valid one.
+        """
+        if not self.path:
+            return
+        try:
+            with open(self.path) as file:
+                saved = json.load(file)
+        except (OSError, ValueError):
+            return
+        if saved.get("version") == CATALOG_VERSION:
+            self.entries = saved.get("entries", {})
+
+    def save(self):
+        """
+        Writes the catalog so the next update only parses files that changed.
+        Does nothing if it can't be written.
+        """
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # write to a temporary file first so a half-written catalog is never read
+            temp_path = "{}.{}.tmp".format(self.path, os.getpid())
+            with open(temp_path, "w") as file:
+                json.dump({"version": CATALOG_VERSION, "entries": self.entries}, file)
+            os.replace(temp_path, self.path)
+        except OSError:
+            pass
+
+    def update(self, workers=None):
+        """
+        Brings the catalog up to date with the folder, parsing new and changed
+        files in a pool of processes, and saves it. Returns the list of filenames
+        that were parsed.
+            :param workers: is how many processes to use. Defaults to CATALOG_WORKERS.
+        """
+        names = sorted(name for name in os.listdir(self.folder) if name.endswith(GAIT_EXTENSIONS))
+        # forget files that are gone
+        self.entries = {name: entry for name, entry in self.entries.items() if name in names}
+
+        changed = []
+        for name in names:
+            path = os.path.join(self.folder, name)
+            try:
+                stat = file_stat(path)
+            except OSError:
+                continue
+            entry = self.entries.get(name)
+            if entry is None or entry["stat"] != stat:
+                changed.append((name, path, stat))
+
+        if len(changed) >= POOL_THRESHOLD:
+            workers = CATALOG_WORKERS if workers is None else workers
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+                described = list(pool.map(describe_file, [path for _, path, _ in changed],
+                                          chunksize=max(1, len(changed) // 64)))
+        else:
+            described = [describe_file(path) for _, path, _ in changed]
+
+        for (name, _, stat), metadata in zip(changed, described):
+            metadata["stat"] = stat
+            self.entries[name] = metadata
+
+        if changed:
+            self.save()
+        return [name for name, _, _ in changed]
+
+    def files(self):
+        """
+        Returns the sorted list of filenames in the catalog.
+        """
+        return sorted(self.entries)
+
+    def describe(self, name):
+        """
+        Returns a short description of a file for menus.
+            :param name: is the filename in the catalog.
+        """
+        entry = self.entries[name]
+        if not entry["channels"]:
+            return "no valid intervals"
+        text = "{} channels, {} steps, peak load {:.1f}".format(
+            entry["channels"], entry["steps"], entry["peak_load"])
+        if entry["errors"]:
+            text += ", {} errors".format(len(entry["errors"]))
+        return text
+
+    def invalid(self):
+        """
+        Returns the sorted list of filenames with parse errors or no valid intervals.
+        """
+        return [name for name in self.files()
+                if self.entries[name]["errors"] or not self.entries[name]["channels"]]
+
+def main():
+    """
+    Checks every gait in a folder and prints what's wrong with each. Exits with
+    status 1 if any file has errors.
+    """
+    folder = sys.argv[1] if len(sys.argv) > 1 else "gaits"
+    catalog = Catalog(folder)
+    parsed = catalog.update()
+    print("{} files, {} parsed again".format(len(catalog.entries), len(parsed)))
+
+    for name in catalog.files():
+        entry = catalog.entries[name]
+        print(" {}\t{}".format(name, catalog.describe(name)))
+        for line_num, message in entry["errors"]:
+            print("\t\tline {}: {}".format(line_num, message) if line_num else "\t\t" + message)
+        for channel, message in entry["problems"]:
+            print("\t\tchannel {}: {}".format(channel, message))
+
+    invalid = catalog.invalid()
+    if invalid:
+        print("{} files have errors".format(len(invalid)))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
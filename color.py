@@ -0,0 +1,71 @@
+#!/usr/bin/python3
+"""
+    This module colors console output. ansicolor is only imported the
+    first time something is colored, so scripts that never print in
+    color don't pay for it, and text is left plain if it isn't installed.
+"""
+
+# Global setting for coloring console output
+COLOR = True
+
+# the ansicolor module once it's been imported, False if it isn't installed
+ansicolor = None
+
+def paint(name, text, bold=False):
+    """
+    Returns text in a color, or as it is if color is off or unavailable.
+        :param name: is the name of the ansicolor function, like "red".
+        :param text: is what to color.
+        :param bold: is whether to make it bold too.
+    """
+    global ansicolor
+    if ansicolor is None:
+        try:
+            import ansicolor # install package by typing: pip install ansicolor
+        except ImportError:
+            ansicolor = False
+    if not COLOR or ansicolor is False:
+        return str(text)
+    return getattr(ansicolor, name)(text, bold=bold)
+
+def red(text, bold=False):
+    """
+    Returns text in red. See paint().
+    """
+    return paint("red", text, bold)
+
+def green(text, bold=False):
+    """
+    Returns text in green. See paint().
+    """
+    return paint("green", text, bold)
+
+def blue(text, bold=False):
+    """
+    Returns text in blue. See paint().
+    """
+    return paint("blue", text, bold)
+
+def yellow(text, bold=False):
+    """
+    Returns text in yellow. See paint().
+    """
+    return paint("yellow", text, bold)
+
+def black(text, bold=False):
+    """
+    Returns text in black (dark grey on most terminals). See paint().
+    """
+    return paint("black", text, bold)
+
+def magenta(text, bold=False):
+    """
+    Returns text in magenta. See paint().
+    """
+    return paint("magenta", text, bold)
+
+def white(text, bold=False):
+    """
+    Returns text in white. See paint().
+    """
+    return paint("white", text, bold)
@@ -0,0 +1,359 @@
+#!/usr/bin/python3
+"""
+    This module builds gaits from other gaits in code, without writing
+    and parsing text files. Compositions are only worked out when their
+    frames are needed, and compiled frames are remembered, so sweeping
+    over many variants of one gait only compiles the base gait once.
+
+        from compose import load_gait
+        walk = load_gait("gaits/walk.gait")
+        variant = (walk.shift(3, channels=[0, 1, 2]) + walk.mirror([0, 1], [2, 3])).repeat(2)
+        timeline, steps = variant.timeline(), variant.steps
+"""
+
+# Global setting for how many compiled compositions are remembered
+COMPOSE_CACHE_SIZE = 256
+
+from collections import OrderedDict
+import hashlib
+import numpy # install package by typing: pip install numpy
+from core import CompactTimeline, compile_timeline, STEPS_IN_AMPLITUDE
+from cache import load_timeline
+
+# compiled frames of recent compositions, by key, oldest first
+compiled = OrderedDict()
+
+class Gait:
+    """
+    A gait that hasn't been worked out yet. Every operation returns a new Gait
+    and leaves this one as it is. Call frames() or timeline() to work it out.
+    """
+
+    def __init__(self, key, steps, channels):
+        """
+        Makes a gait. Use load_gait(), from_timeline(), or the operations instead.
+            :param key: is a tuple that's the same for any two gaits built the same way.
+            :param steps: is the number of steps in one cycle.
+            :param channels: is the number of channels.
+        """
+        self.key = key
+        self.steps = steps
+        self.channels = channels
+
+    def build(self):
+        """
+        Returns the compiled matrix of this gait. Each kind of Gait overrides this.
+        """
+        raise NotImplementedError
+
+    def frames(self):
+        """
+        Returns the matrix with a row for each step and a column for each channel,
+        like compile_timeline(). The same composition is only worked out once,
+        so the matrix is read-only.
+        """
+        if self.key in compiled:
+            compiled.move_to_end(self.key)
+            return compiled[self.key]
+
+        amplitudes = self.build()
+        amplitudes.setflags(write=False)
+        compiled[self.key] = amplitudes
+        if len(compiled) > COMPOSE_CACHE_SIZE:
+            compiled.popitem(last=False)
+        return amplitudes
+
+    def timeline(self):
+        """
+        Returns the gait as a CompactTimeline that playback and the visualizer
+        can use, with one interval for each run of equal values.
+        """
+        # each channel's steps in a row, one channel after another
+        values = numpy.ascontiguousarray(self.frames().T).ravel()
+        if not len(values):
+            return CompactTimeline.from_lists([[]] * self.channels)
+        # where each run starts, and how long it is. Every channel's first step starts
+        # a run, so no run carries over from one channel to the next
+        changes = numpy.ones(len(values), dtype=bool)
+        changes[1:] = values[1:] != values[:-1]
+        changes[::self.steps] = True
+        firsts = numpy.flatnonzero(changes)
+        durations = numpy.diff(numpy.append(firsts, len(values)))
+        # runs of zero are left out, since that's the default anyway
+        kept = values[firsts] != 0
+        channels, starts = numpy.divmod(firsts[kept], self.steps)
+        return CompactTimeline.from_columns(channels, starts, durations[kept], values[firsts][kept], self.channels)
+
+    def to_lines(self):
+        """
+        Returns the lines of a gait file for this gait, to save it.
+        """
+        lines = ["steps: {}".format(self.steps)]
+        for intervals in self.timeline():
+            lines.append(", ".join("{} {} {}".format(*interval) for interval in intervals))
+        return lines
+
+    def then(self, other):
+        """
+        Returns this gait followed by another. The one with fewer channels
+        has the rest held at zero.
+            :param other: is the gait to play after this one.
+        """
+        return Concat(self, other)
+
+    def repeat(self, count):
+        """
+        Returns this gait played several times in a row as one cycle.
+            :param count: is how many times to play it.
+        """
+        return Repeat(self, count)
+
+    def shift(self, offset, channels=None):
+        """
+        Returns this gait with some channels moved later in the cycle. Since the
+        cycle repeats, whatever moves past the end wraps around to the start.
+            :param offset: is how many steps later. Negative moves them earlier.
+            :param channels: is the list of channels to move. Defaults to all of them.
+        """
+        return Shift(self, offset, channels)
+
+    def mirror(self, left, right):
+        """
+        Returns this gait with two groups of channels swapped, like the
+        left and right side of a robot.
+            :param left: is the list of channels on one side.
+            :param right: is the list of matching channels on the other side.
+        """
+        return Mirror(self, left, right)
+
+    def stretch(self, factor):
+        """
+        Returns this gait with more or fewer steps in each cycle, so it plays
+        slower or faster at the same cycle time.
+            :param factor: is what to multiply the number of steps by.
+        """
+        return Stretch(self, factor)
+
+    def scale(self, factor):
+        """
+        Returns this gait with every amplitude multiplied, rounded, and kept
+        within STEPS_IN_AMPLITUDE. Amplitudes that were already above it are
+        left above it, scaled but not cut down.
+            :param factor: is what to multiply amplitudes by.
+        """
+        return Scale(self, factor)
+
+    def __len__(self):
+        """
+        Returns the number of channels, the same as the length of a timeline.
+        """
+        return self.channels
+
+    def __add__(self, other):
+        """
+        Same as then(): walk + run plays walk, then run.
+        """
+        return self.then(other)
+
+    def __mul__(self, count):
+        """
+        Same as repeat(): walk * 3 plays walk three times.
+        """
+        return self.repeat(count)
+
+class Timeline(Gait):
+    """
+    A gait made from a timeline of intervals.
+    """
+
+    def __init__(self, timeline, steps):
+        """
+        Makes a gait from a parsed timeline.
+            :param timeline: is the CompactTimeline or 2D array of intervals.
+            :param steps: is the number of steps in one cycle.
+        """
+        timeline = CompactTimeline.from_lists(timeline)
+        self.intervals = timeline
+        # two timelines with the same intervals compile the same way
+        content = hashlib.sha1(timeline.offsets.tobytes())
+        content.update(timeline.intervals.tobytes())
+        Gait.__init__(self, ("timeline", steps, content.hexdigest()), steps, len(timeline))
+
+    def build(self):
+        """
+        Returns the compiled matrix of this gait.
+        """
+        return compile_timeline(self.intervals, self.steps)
+
+class Concat(Gait):
+    """
+    One gait followed by another.
+    """
+
+    def __init__(self, first, second):
+        """
+        Makes the gait. Use Gait.then() instead.
+            :param first: is the gait that plays first.
+            :param second: is the gait that plays after it.
+        """
+        Gait.__init__(self, ("concat", first.key, second.key),
+                      first.steps + second.steps, max(first.channels, second.channels))
+        self.first = first
+        self.second = second
+
+    def build(self):
+        """
+        Returns the compiled matrix of this gait.
+        """
+        amplitudes = numpy.zeros((self.steps, self.channels), dtype=int)
+        amplitudes[:self.first.steps, :self.first.channels] = self.first.frames()
+        amplitudes[self.first.steps:, :self.second.channels] = self.second.frames()
+        return amplitudes
+
+class Repeat(Gait):
+    """
+    A gait played several times in a row.
+    """
+
+    def __init__(self, gait, count):
+        """
+        Makes the gait. Use Gait.repeat() instead.
+            :param gait: is the gait to repeat.
+            :param count: is how many times to play it.
+        """
+        if count < 1:
+            raise ValueError("count must be at least 1")
+        Gait.__init__(self, ("repeat", count, gait.key), gait.steps * count, gait.channels)
+        self.gait = gait
+        self.count = count
+
+    def build(self):
+        """
+        Returns the compiled matrix of this gait.
+        """
+        return numpy.tile(self.gait.frames(), (self.count, 1))
+
+class Shift(Gait):
+    """
+    A gait with some channels moved later in the cycle.
+    """
+
+    def __init__(self, gait, offset, channels=None):
+        """
+        Makes the gait. Use Gait.shift() instead.
+            :param gait: is the gait to change.
+            :param offset: is how many steps later.
+            :param channels: is the list of channels to move, or None for all of them.
+        """
+        channels = None if channels is None else tuple(channels)
+        Gait.__init__(self, ("shift", offset, channels, gait.key), gait.steps, gait.channels)
+        self.gait = gait
+        self.offset = offset
+        self.moved = channels
+
+    def build(self):
+        """
+        Returns the compiled matrix of this gait.
+        """
+        amplitudes = numpy.array(self.gait.frames())
+        if self.moved is None:
+            return numpy.roll(amplitudes, self.offset, axis=0)
+        moved = list(self.moved)
+        amplitudes[:, moved] = numpy.roll(amplitudes[:, moved], self.offset, axis=0)
+        return amplitudes
+
+class Mirror(Gait):
+    """
+    A gait with two groups of channels swapped.
+    """
+
+    def __init__(self, gait, left, right):
+        """
+        Makes the gait. Use Gait.mirror() instead.
+            :param gait: is the gait to change.
+            :param left: is the list of channels on one side.
+            :param right: is the list of matching channels on the other side.
+        """
+        if len(left) != len(right):
+            raise ValueError("both sides need the same number of channels")
+        Gait.__init__(self, ("mirror", tuple(left), tuple(right), gait.key), gait.steps, gait.channels)
+        self.gait = gait
+        self.left = list(left)
+        self.right = list(right)
+
+    def build(self):
+        """
+        Returns the compiled matrix of this gait.
+        """
+        amplitudes = numpy.array(self.gait.frames())
+        amplitudes[:, self.left + self.right] = amplitudes[:, self.right + self.left]
+        return amplitudes
+
+class Stretch(Gait):
+    """
+    A gait with more or fewer steps in each cycle.
+    """
+
+    def __init__(self, gait, factor):
+        """
+        Makes the gait. Use Gait.stretch() instead.
+            :param gait: is the gait to change.
+            :param factor: is what to multiply the number of steps by.
+        """
+        if factor <= 0:
+            raise ValueError("factor must be positive")
+        steps = max(1, int(round(gait.steps * factor)))
+        Gait.__init__(self, ("stretch", steps, gait.key), steps, gait.channels)
+        self.gait = gait
+
+    def build(self):
+        """
+        Returns the compiled matrix of this gait.
+        """
+        # each new step takes the value of the old step it falls in
+        source = numpy.arange(self.steps) * self.gait.steps // self.steps
+        return self.gait.frames()[source]
+
+class Scale(Gait):
+    """
+    A gait with every amplitude multiplied.
+    """
+
+    def __init__(self, gait, factor):
+        """
+        Makes the gait. Use Gait.scale() instead.
+            :param gait: is the gait to change.
+            :param factor: is what to multiply amplitudes by.
+        """
+        Gait.__init__(self, ("scale", factor, gait.key), gait.steps, gait.channels)
+        self.gait = gait
+        self.factor = factor
+
+    def build(self):
+        """
+        Returns the compiled matrix of this gait.
+        """
+        amplitudes = self.gait.frames()
+        scaled = numpy.rint(amplitudes * self.factor).astype(int)
+        # only amplitudes that were in range are kept in range, so one that was already
+        # above STEPS_IN_AMPLITUDE isn't cut down, and scale(1.0) changes nothing
+        in_range = amplitudes <= STEPS_IN_AMPLITUDE
+        return numpy.where(in_range, numpy.clip(scaled, 0, STEPS_IN_AMPLITUDE), numpy.maximum(scaled, 0))
+
+def from_timeline(timeline, steps):
+    """
+    Returns a Gait made from a parsed timeline.
+        :param timeline: is the CompactTimeline or 2D array of intervals.
+        :param steps: is the number of steps in one cycle.
+    """
+    return Timeline(timeline, steps)
+
+def load_gait(filename):
+    """
+    Returns a Gait made from a gait file. Raises ValueError if the file has no valid intervals.
+        :param filename: is the path to the gait file.
+    """
+    timeline, steps, _ = load_timeline(filename)
+    if not timeline:
+        raise ValueError("{} has no valid intervals".format(filename))
+    return Timeline(timeline, steps)
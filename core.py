@@ -9,69 +9,469 @@
 
 # Global setting for amplitude granularity
 STEPS_IN_AMPLITUDE = 10
+# Global setting for only waking up playback on steps where a channel changes
+SPARSE_PLAYBACK = False
 
-import time
+from bisect import bisect_right
 from collections import namedtuple
+import heapq
+import numpy # install package by typing: pip install numpy
+from scheduler import clock, sleep_until
 
 # Make data structure used for each interval in the timeline
 Interval = namedtuple("Interval", "start duration amplitude")
+# Layout of each interval in a CompactTimeline, 12 bytes apiece
+INTERVAL_DTYPE = numpy.dtype([("start", "<i4"), ("duration", "<i4"), ("amplitude", "<i4")])
+# The largest start, duration, or amplitude an interval can hold
+MAX_INTERVAL_VALUE = 2 ** 31 - 1
+
+class CompactTimeline:
+    """
+    A timeline held as one array of intervals instead of a list of Interval
+    namedtuples for each channel. Each channel's intervals are next to each
+    other in the array, in the order they were listed, and offsets says where
+    each channel's run of them starts. It acts like the 2D array it replaces:
+    len() is the number of channels, and indexing or looping over it gives
+    each channel's intervals as a slice of the array, with start, duration,
+    and amplitude fields.
+    """
+
+    def __init__(self, intervals, offsets):
+        """
+        Makes a timeline from arrays that are already built. Use from_lists()
+        or from_columns() to build one from something else.
+            :param intervals: is the array of every interval, with INTERVAL_DTYPE.
+                It can be memory-mapped.
+            :param offsets: is where each channel starts in intervals, with one
+                more at the end for where the last channel stops.
+        """
+        self.intervals = intervals
+        # small enough to always copy, even when the intervals are memory-mapped
+        self.offsets = numpy.array(offsets, dtype=numpy.int64)
+        # the same as a list, since slicing with Python ints is several times quicker
+        self.bounds = self.offsets.tolist()
+
+    @classmethod
+    def from_lists(cls, timeline):
+        """
+        Returns a CompactTimeline made from a 2D array of intervals. A
+        CompactTimeline is returned as it is.
+            :param timeline: is the 2D array of intervals, or anything like
+                it with (start, duration, amplitude) for each interval.
+        """
+        if isinstance(timeline, cls):
+            return timeline
+        offsets = numpy.zeros(len(timeline) + 1, dtype=numpy.int64)
+        offsets[1:] = numpy.cumsum([len(intervals) for intervals in timeline])
+        intervals = numpy.array([tuple(interval) for channel in timeline for interval in channel],
+                                dtype=INTERVAL_DTYPE)
+        return cls(intervals, offsets)
+
+    @classmethod
+    def from_columns(cls, channels, starts, durations, amplitudes, channel_count):
+        """
+        Returns a CompactTimeline made from one array for each field.
+            :param channels: is the channel of each interval. It must be sorted.
+            :param starts: is the start of each interval.
+            :param durations: is the duration of each interval.
+            :param amplitudes: is the amplitude of each interval.
+            :param channel_count: is the number of channels, counting empty ones.
+        """
+        intervals = numpy.empty(len(starts), dtype=INTERVAL_DTYPE)
+        intervals["start"] = starts
+        intervals["duration"] = durations
+        intervals["amplitude"] = amplitudes
+        offsets = numpy.zeros(channel_count + 1, dtype=numpy.int64)
+        offsets[1:] = numpy.cumsum(numpy.bincount(channels, minlength=channel_count))
+        return cls(intervals, offsets)
+
+    def __len__(self):
+        """
+        Returns the number of channels.
+        """
+        return len(self.bounds) - 1
+
+    def __getitem__(self, channel):
+        """
+        Returns a channel's intervals as a read-only slice of the array.
+            :param channel: is the channel number.
+        """
+        if channel < 0:
+            channel += len(self)
+        if not 0 <= channel < len(self):
+            raise IndexError("channel {} is out of range".format(channel))
+        return self.intervals[self.bounds[channel]:self.bounds[channel + 1]]
+
+    def __iter__(self):
+        """
+        Loops over each channel's intervals.
+        """
+        for channel in range(0, len(self)):
+            yield self.intervals[self.bounds[channel]:self.bounds[channel + 1]]
+
+    def counts(self):
+        """
+        Returns an array of how many intervals each channel has.
+        """
+        return numpy.diff(self.offsets)
+
+    def channels(self):
+        """
+        Returns an array of the channel each interval is on.
+        """
+        return numpy.repeat(numpy.arange(len(self)), self.counts())
+
+    def to_lists(self):
+        """
+        Returns the timeline as a 2D array of Interval namedtuples.
+        """
+        rows = self.intervals.tolist()
+        bounds = self.bounds
+        return [list(map(Interval._make, rows[bounds[chan]:bounds[chan + 1]]))
+                for chan in range(0, len(self))]
 
 # runs through one cycle of the timeline
-def do_cycle(device, timeline, steps, total_time, multiplier):
+def do_cycle(device, amplitudes, frames, scheduler, pipeline=None, metrics=None, start_step=0,
+             interrupt=None, trace=None, recorder=None):
     """
     Runs through one cycle of the gait.
         :param device: is the output device
-        :param timeline: is the 2D array of intervals to read.
-        :param total_time: is the time it should take to complete the cycle.
-        :param multiplier: is the maximum amplitude outputted.
+        :param amplitudes: is the compiled timeline, traced as each step is run.
+        :param frames: is the compiled timeline scaled for the device.
+        :param scheduler: decides when each step is output. It keeps
+            counting steps from one cycle to the next.
+        :param pipeline: is an optional started OutputPipeline. When given, frames
+            are queued for its writer threads instead of written here.
+        :param metrics: is an optional Metrics to record timings in.
+        :param start_step: is an optional step to start from, for resuming mid-cycle.
+        :param interrupt: is an optional threading.Event. Setting it ends the cycle
+            early, before the next step is output.
+        :param trace: is an optional started TraceLog to record each step in.
+        :param recorder: is an optional Recorder to record each frame written in.
+            With a pipeline, give it to the pipeline instead.
+    Returns the step the cycle stopped at, which is len(frames) if it finished.
     """
-    # set the index on each channel to 0
-    curr_index = [0] * len(timeline)
+    cycle_start = clock()
 
     # run through timeline
-    for curr_step in range(0, steps):
-        step_start_time = time.time()
-        # start row with time stamp
-        print(curr_step, "\t", sep='', end='')
+    for curr_step in range(start_step, len(frames)):
+        if interrupt is not None and interrupt.is_set():
+            return curr_step
+        tick = scheduler.next_tick()
 
-        amplitudes = []
+        # the writer threads wait for the deadline themselves, so only wait
+        # here if writing directly. Drop the step if it's too late
+        if pipeline is None and not scheduler.wait(tick, interrupt):
+            if interrupt is not None and interrupt.is_set():
+                # this step wasn't output, so hand its tick out again on resuming
+                scheduler.tick = tick
+                return curr_step
+            continue
 
-        # find value of each channel
-        for chan in range(0, len(timeline)):
-            # return value and update channel's current index
-            amp, curr_index[chan] = read_channel(timeline, chan, curr_index[chan], curr_step)
-            amplitudes.append(amp)
+        # each step is just a row of the precomputed frames
+        if pipeline is not None:
+            if not pipeline.queue_frame(tick, frames[curr_step], interrupt, curr_step, amplitudes[curr_step]):
+                scheduler.tick = tick
+                return curr_step
+        elif metrics is None and recorder is None:
+            write_out(device, frames[curr_step])
+        else:
+            write_start = clock()
+            write_out(device, frames[curr_step])
+            write_end = clock()
+            if metrics is not None:
+                metrics.lateness.record(write_start - scheduler.deadline(tick))
+                metrics.writes.record(write_end - write_start)
+            if recorder is not None:
+                recorder.record(tick, scheduler.deadline(tick), write_start, write_end, frames[curr_step])
 
-        # set all values at once
-        write_out(device, amplitudes, multiplier)
+        # logged after the write, so it can't hold it up
+        if trace is not None:
+            trace.record(tick, scheduler.deadline(tick), curr_step, amplitudes[curr_step])
 
-        sleep_time = (total_time/steps) - (time.time() - step_start_time)
-        if sleep_time > 0:
-            time.sleep(sleep_time)
+    # with a pipeline, this is only when the cycle was queued, so its writers time cycles instead
+    if metrics is not None and pipeline is None:
+        metrics.cycles.record(clock() - cycle_start)
+    return len(frames)
 
+# runs through one cycle, but only stops on steps where something changes
+def do_sparse_cycle(device, amplitudes, frames, events, scheduler, pipeline=None,
+                    metrics=None, first_cycle=False, interrupt=None, trace=None, recorder=None):
+    """
+    Runs through one cycle of the gait, sleeping straight through steps where
+    nothing changes and writing only the channels that do.
+        :param device: is the output device
+        :param amplitudes: is the compiled timeline, traced as each event is run.
+        :param frames: is the compiled timeline scaled for the device.
+        :param events: is the list returned by frame_events(frames).
+        :param scheduler: decides when each step is output. It keeps
+            counting steps from one cycle to the next.
+        :param pipeline: is an optional started OutputPipeline. When given, frames
+            are queued for its writer threads instead of written here.
+        :param metrics: is an optional Metrics to record timings in.
+        :param first_cycle: is whether this is the first cycle of a run. If so,
+            every channel is written on the first step, changed or not.
+        :param interrupt: is an optional threading.Event. Setting it ends the cycle
+            early, before the next event is output. The rest of the cycle can be
+            played with do_cycle(), starting from the step returned.
+        :param trace: is an optional started TraceLog to record each event in.
+        :param recorder: is an optional Recorder to record each frame written in.
+            With a pipeline, give it to the pipeline instead.
+    Returns the step the cycle stopped at, which is len(frames) if it finished.
+    Like do_cycle(), it only returns once the cycle's time is up, even if nothing
+    changes after its last event.
+    """
+    cycle_start = clock()
+    # the steps of this cycle are base, base + 1, and so on
+    base = scheduler.advance(len(frames))
+    # channels whose change was dropped for being late, to send with the next event
+    missed = []
+    # the last step that was output or queued
+    last_step = -1
+
+    if first_cycle:
+        all_channels = numpy.arange(frames.shape[1])
+        events = [(0, all_channels)] + [event for event in events if event[0] != 0]
+    elif pipeline is not None and (not events or events[0][0] != 0):
+        # the writers time each cycle from its first step, so it's always queued.
+        # They skip channels that didn't change, so it costs nothing on the bus
+        events = [(0, numpy.arange(0))] + events
+
+    for curr_step, channels in events:
+        tick = base + curr_step
+        if interrupt is not None and interrupt.is_set():
+            # the steps from here on weren't output, so hand them out again on resuming
+            scheduler.tick = tick
+            return curr_step
+
+        # the pipeline sends whole frames, and its writers skip unchanged channels anyway
+        if pipeline is not None:
+            if not pipeline.queue_frame(tick, frames[curr_step], interrupt, curr_step, amplitudes[curr_step]):
+                scheduler.tick = tick
+                return curr_step
+            if trace is not None:
+                trace.record(tick, scheduler.deadline(tick), curr_step, amplitudes[curr_step])
+            last_step = curr_step
+            continue
+
+        if not scheduler.wait(tick, interrupt):
+            if interrupt is not None and interrupt.is_set():
+                scheduler.tick = tick
+                return curr_step
+            missed.append(channels)
+            continue
+        if missed:
+            channels = numpy.union1d(numpy.concatenate(missed), channels)
+            missed = []
+
+        write_start = clock()
+        device.send_channels(channels.tolist(), frames[curr_step])
+        write_end = clock()
+        if metrics is not None:
+            metrics.lateness.record(write_start - scheduler.deadline(tick))
+            metrics.writes.record(write_end - write_start)
+        if recorder is not None:
+            recorder.record(tick, scheduler.deadline(tick), write_start, write_end, frames[curr_step])
+        if trace is not None:
+            trace.record(tick, scheduler.deadline(tick), curr_step, amplitudes[curr_step])
+        last_step = curr_step
+
+    # sleep through the rest of the cycle, so the next one starts on time. With a
+    # pipeline, wake a step early so the next cycle's first frame is queued before it's due.
+    # Not scheduler.wait(), since nothing is output then, so it can't be late
+    end_tick = base + len(frames) - (1 if pipeline is not None else 0)
+    if not sleep_until(scheduler.deadline(end_tick), scheduler.spin_time, interrupt):
+        # stop at the first step that isn't due yet, and after anything already queued
+        first_deadline, step_time = scheduler.slot(base)
+        due = int((clock() - first_deadline) / step_time) + 1 if step_time > 0 else len(frames)
+        stopped_at = max(last_step + 1, due)
+        if stopped_at < len(frames):
+            scheduler.tick = base + stopped_at
+            return stopped_at
+
+    if metrics is not None and pipeline is None:
+        metrics.cycles.record(clock() - cycle_start)
+    return len(frames)
+
+def frame_events(frames):
+    """
+    Returns a list of (step, channels) for every step where at least one channel
+    changes, with an array of the channels that change. Since cycles repeat,
+    the first step is compared to the last.
+        :param frames: is the compiled timeline, scaled or not.
+    """
+    changed = frames != numpy.roll(frames, 1, axis=0)
+    return [(step, numpy.flatnonzero(changed[step]))
+            for step in numpy.flatnonzero(changed.any(axis=1)).tolist()]
+
+def compile_timeline(timeline, steps):
+    """
+    Returns a matrix with a row for each step and a column for each channel,
+    holding the amplitude specified in the timeline at that point.
+        :param timeline: is the CompactTimeline or 2D array of intervals to read.
+        :param steps: is the number of steps in one cycle.
+    """
+    timeline = CompactTimeline.from_lists(timeline)
+    amplitudes = numpy.zeros((steps, len(timeline)), dtype=int)
+    if not len(timeline.intervals):
+        return amplitudes
+
+    channels = timeline.channels()
+    starts = timeline.intervals["start"].astype(numpy.int64)
+    ends = starts + timeline.intervals["duration"]
+    values = timeline.intervals["amplitude"].astype(int)
+
+    # channels with an interval that starts before the one listed before it ends
+    # need normalize_intervals(). The rest can all be filled in at once
+    overlapping = channels[1:][(channels[1:] == channels[:-1]) & (starts[1:] < ends[:-1])]
+    tangled = numpy.unique(overlapping)
+    simple = ~numpy.isin(channels, tangled) & (values != 0)
+
+    # mark where each interval starts and stops on a matrix of changes, then add them up
+    # down each column. Intervals on a channel don't overlap, so the sum is the amplitude
+    changes = numpy.zeros((steps + 1, len(timeline)), dtype=int)
+    numpy.add.at(changes, (numpy.minimum(starts[simple], steps), channels[simple]), values[simple])
+    numpy.add.at(changes, (numpy.minimum(ends[simple], steps), channels[simple]), -values[simple])
+    numpy.cumsum(changes[:-1], axis=0, out=amplitudes)
+
+    # normalized intervals never overlap, so they can be filled in any order
+    for channel in tangled.tolist():
+        index = ChannelIndex(timeline[channel])
+        for start, end, amplitude in zip(index.starts, index.ends, index.amplitudes):
+            amplitudes[start:end, channel] = amplitude
+
+    return amplitudes
+
+def scale_frames(amplitudes, multiplier):
+    """
+    Returns the compiled timeline re-scaled from the internal representation
+    to the values sent to the device.
+        :param amplitudes: is the matrix returned by compile_timeline().
+        :param multiplier: is the maximum amplitude outputted.
+    """
+    return amplitudes * (float(multiplier) / float(STEPS_IN_AMPLITUDE))
+
+def normalize_intervals(intervals):
+    """
+    Returns a channel's intervals as three lists (starts, ends, amplitudes) of
+    segments that are sorted and don't overlap. Where intervals overlap, the one
+    that starts later wins until it ends, and then the earlier one picks back up.
+    If two start on the same step, the one listed later wins. Segments with an
+    amplitude of zero are left out, since that's the default anyway.
+        :param intervals: is the list of intervals on one channel, in any order,
+            or the channel's slice of a CompactTimeline.
+    """
+    if isinstance(intervals, numpy.ndarray):
+        starts = intervals["start"].astype(numpy.int64)
+        ends = starts + intervals["duration"]
+        if numpy.all(ends[:-1] <= starts[1:]):
+            kept = (intervals["amplitude"] != 0) & (intervals["duration"] != 0)
+            return starts[kept].tolist(), ends[kept].tolist(), intervals["amplitude"][kept].tolist()
+        # only channels with overlaps need the sweep below
+        intervals = list(map(Interval._make, intervals.tolist()))
+
+    # most channels are already sorted without overlaps, so they can skip the sweep
+    if all(first.start + first.duration <= second.start
+           for first, second in zip(intervals, intervals[1:])):
+        kept = [interval for interval in intervals if interval.amplitude and interval.duration]
+        return ([interval.start for interval in kept],
+                [interval.start + interval.duration for interval in kept],
+                [interval.amplitude for interval in kept])
+
+    # rank each interval by start, keeping the listed order for ties.
+    # a higher rank wins over anything it overlaps
+    ranked = sorted(intervals, key=lambda interval: interval.start)
+    points = sorted({point for interval in ranked
+                     for point in (interval.start, interval.start + interval.duration)})
+
+    starts, ends, amplitudes = [], [], []
+    active = []
+    next_rank = 0
+    for num, point in enumerate(points[:-1]):
+        # add everything that has started by now
+        while next_rank < len(ranked) and ranked[next_rank].start <= point:
+            interval = ranked[next_rank]
+            heapq.heappush(active, (-next_rank, interval.start + interval.duration, interval.amplitude))
+            next_rank += 1
+
+        # drop the winner while it has ended. Losers that ended are dropped once they're on top
+        while active and active[0][1] <= point:
+            heapq.heappop(active)
+
+        amplitude = active[0][2] if active else 0
+        if not amplitude:
+            continue
+        # join onto the last segment if it carries straight on
+        if ends and ends[-1] == point and amplitudes[-1] == amplitude:
+            ends[-1] = points[num + 1]
+        else:
+            starts.append(point)
+            ends.append(points[num + 1])
+            amplitudes.append(amplitude)
+
+    return starts, ends, amplitudes
+
+class ChannelIndex:
+    """
+    Looks up the amplitude of one channel at any step in O(log n), from any
+    position, so playback can start anywhere or jump around.
+    """
+
+    def __init__(self, intervals):
+        """
+        Builds the index from a channel's intervals.
+            :param intervals: is the list of intervals on one channel, in any order,
+                or the channel's slice of a CompactTimeline. See normalize_intervals()
+                for how overlaps are handled.
+        """
+        self.starts, self.ends, self.amplitudes = normalize_intervals(intervals)
+
+    def amplitude_at(self, step):
+        """
+        Returns the amplitude of the channel at a step.
+            :param step: is the step on the timeline to evaluate.
+        """
+        # find the last segment that starts at or before this step
+        pos = bisect_right(self.starts, step) - 1
+        if pos >= 0 and step < self.ends[pos]:
+            return self.amplitudes[pos]
+        return 0
+
+def index_timeline(timeline):
+    """
+    Returns a ChannelIndex for each channel of a timeline.
+        :param timeline: is the CompactTimeline or 2D array of intervals to index.
+    """
+    return [ChannelIndex(intervals) for intervals in timeline]
 
 # return value on the selected channel given the time
 def read_channel(timeline, channel_id, curr_index, curr_time):
     """
-    Returns the current amplitude specified in the timeline.
-        :param timeline: is the 2D array of intervals to read.
+    Returns the current amplitude specified in the timeline. This only moves
+    forward and expects the channel's intervals to be sorted without overlaps,
+    so use ChannelIndex for anything else.
+        :param timeline: is the CompactTimeline or 2D array of intervals to read.
         :param channel_id: is the ID number of the pneumatic valve channel.
         :param curr_index: is the index in the timeline to start reading from.
         :param curr_time: is the time on the timeline to evaluate.
     """
+    intervals = timeline[channel_id]
+    # a CompactTimeline's channels are arrays, where item() reads a whole row quickest
+    compact = isinstance(intervals, numpy.ndarray)
+
     # while not past last interval
-    while curr_index < len(timeline[channel_id]):
+    while curr_index < len(intervals):
 
         # get interval to check
-        curr_interval = timeline[channel_id][curr_index]
+        start, duration, amplitude = intervals[curr_index].item() if compact else intervals[curr_index]
 
         # if we're past the starting point
-        if curr_time >= curr_interval.start:
+        if curr_time >= start:
             # if currently in the interval's duration
-            if curr_time - curr_interval.start < curr_interval.duration:
+            if curr_time - start < duration:
 
                 # return the interval's amplitude and index (since it might have incremented)
-                return (curr_interval.amplitude, curr_index)
+                return (amplitude, curr_index)
 
             else: # not in duration
 
@@ -88,18 +488,11 @@ def read_channel(timeline, channel_id, curr_index, curr_time):
     # after last interval in timeline
     return 0, curr_index
 
-def write_out(device, values, multiplier):
+def write_out(device, frame):
     """
-    Prints stuff to the console and writes to device pins if available.
+    Writes to device pins if available. Nothing is printed here, since console
+    output on every step can make steps late; see tracelog.py instead.
         :param device: is the device to output to.
-        :param values: the stuff to print.
-        :param multiplier: scales the output values, but only to the device. Unscaled
-            numbers are printed to the screen.
-    """
-    print(values)
-    scaled_values = []
-    # re-scales data from internal representation to external input representation.
-    for value in values:
-        value = float(value) * float(multiplier) / float(STEPS_IN_AMPLITUDE)
-        scaled_values.append(value)
-    device.send(scaled_values)
+        :param frame: is the scaled frame that is sent to the device.
+    """
+    device.send(frame)
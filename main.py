@@ -3,16 +3,17 @@
     Author: Gabriel Kulp
     Created: 1/19/2017
 
-    This module is the entry point. It's the only one that
-    executes code on its own.
+    This module is the entry point for the interactive menus. Nothing
+    runs when it's imported; see api.py for playing gaits from other
+    programs without prompts.
 """
 import os
 import sys
-import time
-from core import do_cycle
 from visualization import print_timeline, add_quotes
-from parse import read_timeline
-from output import PWM_board
+from cache import load_timeline
+from session import PlaybackSession
+from analysis import GaitAnalysis, interval_problems
+from catalog import Catalog
 
 def start():
     """
@@ -39,8 +40,27 @@ def start():
         print("Multiplier not specified.")
         multiplier = choose_multiplier()
 
+    # one connection to the boards for the whole time the program runs.
+    # closing it shuts off every output, so make sure that happens on the way out
+    session = PlaybackSession()
+    try:
+        menu_loop(session, filename, timeline, steps, cycle_time, multiplier)
+    finally:
+        session.close()
+
+def menu_loop(session, filename, timeline, steps, cycle_time, multiplier):
+    """
+    Plays the gait, then keeps asking the user what to do next until they quit.
+    Between runs the boards stay connected and hold their last values.
+        :param session: is the PlaybackSession to play on.
+        :param filename: is the path of the gait file.
+        :param timeline: is the gait to follow
+        :param steps: is the number of steps in one cycle.
+        :param cycle_time: is how long each cycle takes.
+        :param multiplier: is what to multipy amplitudes by.
+    """
     # Python doesn't have a do-while, so execute before entering the menu loop.
-    execute_gaits(filename, timeline, steps, cycle_time, multiplier)
+    timeline, steps = execute_gaits(session, filename, timeline, steps, cycle_time, multiplier)
 
     while True:
         print("\n\nWhat next?\n")
@@ -54,17 +74,17 @@ def start():
         # Python also doesn't have switch statements. Oh well.
         menu = input("(1-6) ").strip()
         if menu == '1':
-            execute_gaits(filename, timeline, steps, cycle_time, multiplier)
+            timeline, steps = execute_gaits(session, filename, timeline, steps, cycle_time, multiplier)
             continue
         elif menu == '2':
             print("Previous:", multiplier)
             multiplier = choose_multiplier()
-            execute_gaits(filename, timeline, steps, cycle_time, multiplier)
+            timeline, steps = execute_gaits(session, filename, timeline, steps, cycle_time, multiplier)
             continue
         elif menu == '3':
             print("Previous:", cycle_time)
             cycle_time = choose_cycle_time()
-            execute_gaits(filename, timeline, steps, cycle_time, multiplier)
+            timeline, steps = execute_gaits(session, filename, timeline, steps, cycle_time, multiplier)
             continue
         elif menu == '4':
             timeline, steps, filename = choose_timeline(verbose=False)
@@ -91,6 +111,8 @@ def handle_argv():
             print("\t./main.py [filename [cycle_time multiplier]]")
             print("\nFor editor/visualizer mode:")
             print("\t./main.py -e [filename]")
+            print("\nTo play gaits without any prompts:")
+            print("\t./api.py filename... --cycle-time seconds --multiplier value --cycles count")
             print("\nTo print this message, use:")
             print("\t./main.py -h")
             sys.exit(0)
@@ -121,7 +143,8 @@ def handle_argv():
             elif len(sys.argv) == 4:
                 cycle_time = float(sys.argv[2])
                 multiplier = float(sys.argv[3])
-                if cycle_time < 0:
+                # a cycle has to take some time
+                if cycle_time <= 0:
                     bad_input = True
         # if the user didn't spcify 0, 1, or 3 arguments...
         elif len(sys.argv) != 1:
@@ -145,15 +168,43 @@ def start_visualizer(filename=None):
     """
     print("Choose a file to edit/visualize:")
     while True:
-        timeline, steps, filename = choose_timeline(filename, verbose=True)
+        timeline, steps, filename = choose_timeline(filename, verbose=True, show=False)
 
         if not timeline:
             print("file not found: {}".format(add_quotes(filename)))
+            # ask for a different file instead of reading the same one forever
+            filename = None
             continue
 
+        view = print_timeline(timeline, steps)
         print("Finished reading file: {}\n".format(add_quotes(filename)))
-        print("Press enter to reload, type r to switch to run mode,")
-        usr = input("type o to view a different file, or type q to quit: ").strip().lower()
+
+        # page through and zoom the timeline until the user wants something else
+        while True:
+            print("Type n/p for the next/previous page, +/- to zoom in/out, c to toggle compression,")
+            print("w to write the timeline to a file (.html or text), or press enter to reload,")
+            usr = input("type r to switch to run mode, o to view a different file, or q to quit: ").strip().lower()
+            if usr in ('n', 'p', '+', '-', 'c'):
+                if usr == 'n':
+                    view.page(1)
+                elif usr == 'p':
+                    view.page(-1)
+                elif usr == '+':
+                    view.set_zoom(view.zoom // 2)
+                elif usr == '-':
+                    view.set_zoom(view.zoom * 2)
+                else:
+                    view.compress = not view.compress
+                view.show()
+            elif usr == 'w':
+                path = input("File to write: ").strip()
+                try:
+                    view.save(path)
+                    print("Saved to", add_quotes(path))
+                except OSError as error:
+                    print("Couldn't save:", error)
+            else:
+                break
 
         if usr == 'r':
             break
@@ -168,7 +219,7 @@ def start_visualizer(filename=None):
     print("\n")
     return filename, timeline, steps
 
-def choose_timeline(filename=None, folder="gaits", verbose=None):
+def choose_timeline(filename=None, folder="gaits", verbose=None, show=True):
     """
     Returns a timeline from a file.
         :param filename: is an optional argument. When specified,
@@ -178,6 +229,8 @@ def choose_timeline(filename=None, folder="gaits", verbose=None):
         :param verbose: is an optional argument. When not None,
             the user will not be asked about verbosity and this
             value will be used.
+        :param show: is an optional argument. When False, the timeline
+            isn't printed.
     """
     # if the function was passed filename = None...
     if not filename:
@@ -188,27 +241,43 @@ def choose_timeline(filename=None, folder="gaits", verbose=None):
         verbose = input("Show extra parsing info? (y/N): ").strip().lower()
         verbose = (verbose == "y" or verbose == "yes")
 
-    timeline, steps, errors = read_timeline(filename, verbose)
+    # unchanged files come straight from the cache instead of being parsed again
+    timeline, steps, errors = load_timeline(filename, verbose)
 
     if errors:
         print("finished parsing with errors")
+        # the verbose walkthrough already showed them in context
+        if not verbose:
+            for line_num, message in errors:
+                print("\tline {}: {}".format(line_num, message))
     if verbose and not errors:
         print("finished parsing with no errors")
 
     if not timeline:
         if verbose is None:
             print("Timeline is empty. There is nothing to do.")
-        return None, None
+        return None, None, filename
+
+    # playback handles these fine, but they're usually a mistake
+    problems = interval_problems(timeline, steps)
+    if problems:
+        print("intervals to check:")
+        for channel, message in problems:
+            print("\tchannel {}: {}".format(channel, message))
 
-    print_timeline(timeline, steps)
+    if show:
+        print_timeline(timeline, steps)
 
     return timeline, steps, filename
 
 def choose_cycle_time():
     """
-    Returns a valid cycle time from the user.
+    Returns a valid cycle time from the user. It has to be more than 0.
     """
-    return get_positive_float("Seconds per cycle: ")
+    while True:
+        cycle_time = get_positive_float("Seconds per cycle: ")
+        if cycle_time > 0:
+            return cycle_time
 
 def choose_multiplier():
     """
@@ -223,17 +292,16 @@ def choose_file(folder):
         :param folder: is the folder to look in. Must be at the same
             directory level as this script file. No need for ./ at the start.
     """
-    # make a list of all the files the user chooses from
-    files = []
-    for file in os.listdir(folder):
-        if file.endswith((".txt", ".gait")):
-            files.append(file)
+    # the catalog only parses files that changed since it was last updated
+    catalog = Catalog(folder)
+    catalog.update()
+    files = catalog.files()
 
     print("\nPlease select a file from the {} folder:".format(folder))
 
     # print file selection list
     for num, file in enumerate(files):
-        print(" {}\t{}".format(num + 1, file))
+        print(" {}\t{}\t({})".format(num + 1, file, catalog.describe(file)))
 
     print(" {}\t[Manually specify]\n".format(len(files) + 1))
 
@@ -258,42 +326,44 @@ def choose_file(folder):
 
     return "{}/{}".format(folder, files[choice - 1])
 
-def execute_gaits(filename, timeline, steps, cycle_time, multiplier):
+def execute_gaits(session, filename, timeline, steps, cycle_time, multiplier):
     """
-    Runs through the gait until stopped by user.
+    Runs through the gait until stopped by user. If the file changes while it's
+    running, the new version takes over at the start of the next cycle.
+    Returns the timeline and steps that were playing at the end.
+        :param session: is the PlaybackSession that holds the board connection.
         :param filename: is the path to display to display.
         :param timeline: is the gait to follow
         :param cycle_time: is how long each cycle takes.
         :param multiplier: is what to multipy amplitudes by.
     """
-    board = PWM_board()
-    print("Attempting to connect...")
-    if board.connect():
-        print("Connected!")
-    else:
-        print("Error connecting!")
-        return
+    # the boards stay connected between runs, so only the gait and settings change
+    session.load(timeline, steps, filename)
+    session.set_cycle_time(cycle_time)
+    session.set_multiplier(multiplier)
+    if not session.connect():
+        return timeline, steps
+
+    prepared = session.prepare()
+    if prepared is None:
+        print("Nothing to play. Pick a gait, cycle time and multiplier first.")
+        return timeline, steps
+
+    # catch steps that ask too much of the air supply before they're played
+    analysis = GaitAnalysis(prepared[2], multiplier)
+    print("\nLoad profile:", analysis.summary())
+    for message in analysis.warnings():
+        print("WARNING:", message)
 
     print("\nReading from", add_quotes(filename))
     print("Cycle time is", cycle_time, end='')
     print(", multiplier is", int(multiplier * 100), end='')
     input("%. Press enter to start, then Ctrl-C to stop.")
-    start_time = time.time()
 
-    # allows catching Ctrl-C without exiting program
-    try:
-        cycle = 0
-        while True:
-            print("\nCycle #{} at time {}s".format(cycle + 1, time.time() - start_time))
-            do_cycle(board, timeline, steps, cycle_time, multiplier)
-            cycle += 1
-    except KeyboardInterrupt:
-        print("\nStopping playback...", end='')
-        board.clear()
-        print("done.\n")
-
-    # connection is closed when not running
-    board.disconnect()
+    session.play()
+    # a reload while playing may have changed the gait
+    timeline, steps = session.prepared[:2]
+    return timeline, steps
 
 def get_positive_float(message):
     """
@@ -309,9 +379,11 @@ def get_positive_float(message):
         if value >= 0:
             return value
 
-# the actual entry point!
-try:
-    start()
-# prints a message when quitting. not strictly necessary...
-except KeyboardInterrupt:
-    print("\nForce quit")
+# the actual entry point! Only when run, so importing this (or starting the
+# catalog's worker processes, which import it on some platforms) doesn't start the menus
+if __name__ == "__main__":
+    try:
+        start()
+    # prints a message when quitting. not strictly necessary...
+    except KeyboardInterrupt:
+        print("\nForce quit")
@@ -0,0 +1,196 @@
+#!/usr/bin/python3
+"""
+    This module measures how well playback keeps to its schedule.
+    Timings go into fixed-size histograms, so recording them is
+    cheap enough to leave on for every run.
+"""
+
+# Global setting for where run metrics are saved. None turns saving off.
+# A relative folder is kept next to the program, wherever it's run from
+METRICS_FOLDER = "metrics"
+# Global setting for saving the metrics of every run. Sessions from api.open_device()
+# only save them when asked, since a library call shouldn't leave files behind
+SAVE_METRICS = True
+# Global setting for the smallest histogram bucket (seconds). Each bucket is double the last
+HISTOGRAM_RESOLUTION = 0.000001
+# Global setting for the number of histogram buckets
+HISTOGRAM_BUCKETS = 28
+
+from bisect import bisect_left
+import csv
+import json
+import os
+import signal
+import threading
+import time
+
+# the folder the program is in, so files are saved in the same place wherever it's run from
+PROGRAM_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+class Histogram:
+    """
+    Counts durations into buckets that double in size. Also keeps the exact count,
+    total, smallest, and largest value.
+    """
+
+    def __init__(self):
+        # upper bound of each bucket. Anything bigger goes in one last overflow bucket
+        self.bounds = [HISTOGRAM_RESOLUTION * 2 ** n for n in range(0, HISTOGRAM_BUCKETS)]
+        self.counts = [0] * (HISTOGRAM_BUCKETS + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.lock = threading.Lock()
+
+    def record(self, value):
+        """
+        Adds a value to the histogram.
+            :param value: is the duration to count, in seconds.
+        """
+        bucket = bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[bucket] += 1
+            self.count += 1
+            self.total += value
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+
+    def percentile(self, fraction):
+        """
+        Returns the upper bound of the bucket holding the given fraction of values,
+        or the largest value if that's smaller. Returns None when empty.
+            :param fraction: is between 0 and 1, so 0.99 is the 99th percentile.
+        """
+        if not self.count:
+            return None
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        """
+        Returns a summary of the histogram that can be saved as JSON.
+        """
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.percentile(0.5),
+            "p99": self.percentile(0.99),
+            "buckets": [[bound, count] for bound, count
+                        in zip(self.bounds + [None], self.counts) if count],
+        }
+
+class Metrics:
+    """
+    Holds all the timing histograms for one playback run.
+    """
+
+    def __init__(self):
+        # how far past its deadline each step was actually written
+        self.lateness = Histogram()
+        # how long each full cycle took
+        self.cycles = Histogram()
+        # how long write_out took on each step
+        self.writes = Histogram()
+        # how long PWM_board.send_board took, for each board
+        self.sends = {}
+        self.overruns = 0
+        self.started = time.time()
+
+    def record_send(self, board_num, duration):
+        """
+        Records how long one board's I2C write took.
+            :param board_num: is the index of the board.
+            :param duration: is the length of the write in seconds.
+        """
+        histogram = self.sends.get(board_num)
+        if histogram is None:
+            histogram = self.sends.setdefault(board_num, Histogram())
+        histogram.record(duration)
+
+    def histograms(self):
+        """
+        Returns a dictionary of every histogram by name.
+        """
+        named = {"step_lateness": self.lateness, "cycle_time": self.cycles, "write_out": self.writes}
+        for board_num in sorted(self.sends):
+            named["send_board_{}".format(board_num)] = self.sends[board_num]
+        return named
+
+    def to_dict(self):
+        """
+        Returns everything recorded so far in a form that can be saved as JSON.
+        """
+        return {
+            "started": self.started,
+            "duration": time.time() - self.started,
+            "overruns": self.overruns,
+            "histograms": {name: histogram.to_dict()
+                           for name, histogram in self.histograms().items()},
+        }
+
+    def summary(self):
+        """
+        Returns a one-line description of the run's timing.
+        """
+        if not self.lateness.count:
+            return "No writes recorded."
+        return "{} writes, {} overruns, lateness mean {:.6f}s, p99 {:.6f}s, max {:.6f}s".format(
+            self.lateness.count, self.overruns, self.lateness.total / self.lateness.count,
+            self.lateness.percentile(0.99), self.lateness.max)
+
+    def dump_json(self, path):
+        """
+        Saves everything recorded so far to a JSON file.
+            :param path: is the file to write.
+        """
+        with open(path, "w") as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+    def dump_csv(self, path):
+        """
+        Saves every histogram bucket to a CSV file, one row per bucket.
+            :param path: is the file to write.
+        """
+        with open(path, "w", newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(["histogram", "upper_bound", "count"])
+            for name, histogram in self.histograms().items():
+                for bound, count in zip(histogram.bounds + ["inf"], histogram.counts):
+                    if count:
+                        writer.writerow([name, bound, count])
+
+def metrics_path(filename, extension, folder=None):
+    """
+    Returns a path in the metrics folder named after a gait and the current time.
+        :param filename: is the gait file the run played.
+        :param extension: is the file extension to use, like ".json".
+        :param folder: is the folder to use. Defaults to METRICS_FOLDER. A relative
+            folder is in PROGRAM_FOLDER.
+    """
+    folder = METRICS_FOLDER if folder is None else folder
+    folder = os.path.join(PROGRAM_FOLDER, folder)
+    os.makedirs(folder, exist_ok=True)
+    name = os.path.splitext(os.path.basename(str(filename)))[0]
+    return os.path.join(folder, "{}-{}{}".format(name, time.strftime("%Y%m%d-%H%M%S"), extension))
+
+def dump_on_signal(metrics, path):
+    """
+    Saves the metrics as JSON whenever the process gets SIGUSR1, so a run can be
+    checked without stopping it. Does nothing where SIGUSR1 doesn't exist.
+    Returns the previous handler so it can be put back afterwards.
+        :param metrics: is the Metrics to save.
+        :param path: is the file to write.
+    """
+    if not hasattr(signal, "SIGUSR1"):
+        return None
+    return signal.signal(signal.SIGUSR1, lambda signum, frame: metrics.dump_json(path))
@@ -13,15 +13,59 @@
 OUTPUT_SCALE = 2048
 # Global setting for PWM output frequency
 OUTPUT_FREQUENCY = 30
-# Global setting for number of consecutive-addressed chained boards
+# Global setting for number of consecutive-addressed chained boards.
+# Only used when there's no board map file and no buses to probe
 BOARD_COUNT = 2
+# Global setting for the board map file, which says which bus, address and channels
+# each board has. Used when the file exists
+BOARD_MAP = "boards.map"
+# Global setting for the I2C buses to search for boards when there's no board map file.
+# Empty means use BOARD_COUNT boards from 0x40 on the default bus
+PROBE_BUSES = []
+# Global setting for using simulated boards (see simulation.py) instead of real ones
+SIMULATED = False
 
-try:
-    import Adafruit_PCA9685
-    CAPABLE = True
-except ImportError:
-    print("I2C library not installed. Enabling fake output.")
-    CAPABLE = False
+# PCA9685 registers. Each channel has 4 LED registers (ON_L, ON_H, OFF_L, OFF_H)
+# starting at LED0_ON_L, so channel n starts at LED0_ON_L + 4 * n.
+MODE1 = 0x00
+MODE1_AUTO_INCREMENT = 0x20
+MODE2 = 0x01
+ALLCALLADR = 0x05
+LED0_ON_L = 0x06
+PRE_SCALE = 0xFE
+# What a PCA9685 holds in registers nothing here writes to, which tells it apart from
+# other chips when probing: its all-call address register, the reserved bits of MODE2
+# (always 0), and the prescaler (never below 3)
+ALLCALLADR_RESET = 0xE0
+MODE2_RESERVED = 0xE0
+MIN_PRESCALE = 3
+# An SMBus block write holds at most 32 bytes, which is 8 channels' registers
+MAX_BLOCK_CHANNELS = 8
+# Addresses a PCA9685 can be set to. 0x70 is the all-call address every board answers to
+PCA9685_ADDRESSES = [address for address in range(0x40, 0x80) if address != 0x70]
+# Channels on each board
+BOARD_CHANNELS = 16
+
+import os
+import time
+
+# the Adafruit_PCA9685 module once it's been imported, False if it isn't installed
+Adafruit_PCA9685 = None
+
+def i2c_library():
+    """
+    Returns the Adafruit_PCA9685 module, or None if it isn't installed. It's only
+    imported the first time real boards are needed, so simulated runs and scripts
+    that never connect start faster.
+    """
+    global Adafruit_PCA9685
+    if Adafruit_PCA9685 is None:
+        try:
+            import Adafruit_PCA9685
+        except ImportError:
+            print("I2C library not installed. Using simulated boards.")
+            Adafruit_PCA9685 = False
+    return Adafruit_PCA9685 or None
 
 class PWM_board:
     """
@@ -29,60 +73,282 @@ class PWM_board:
     """
 
     # setting to [] allows declaration of an Arduino without connecting to it
-    def __init__(self):
+    def __init__(self, simulated=None, board_count=None, layout=None):
+        """
+        Makes a PWM_board that isn't connected yet.
+            :param simulated: is whether to use simulated boards. Defaults to SIMULATED,
+                or True if the I2C library isn't installed.
+            :param board_count: is how many boards to connect to when there's no layout.
+                Defaults to BOARD_COUNT.
+            :param layout: is an optional list of (first channel, bus, address) for each
+                board. Defaults to the board map file, probing, or BOARD_COUNT boards,
+                in that order. See find_layout().
+        """
+        self.simulated = (SIMULATED or i2c_library() is None) if simulated is None else simulated
+        self.board_count = BOARD_COUNT if board_count is None else board_count
+        self.layout = layout
         self.boards = []
+        # the first channel of each connected board
+        self.first_channels = []
+        # the bus of each connected board
+        self.board_buses = []
+        # (board index, pin) for each channel number, worked out once when connecting
+        self.channel_pins = {}
+        # the last values each board received, or None if unknown
+        self.shadow = []
+        # optional Metrics to record how long each board's writes take
+        self.metrics = None
+
+    def find_layout(self):
+        """
+        Returns the list of (first channel, bus, address) to connect to. Comes from the
+        board map file if there is one, then from probing PROBE_BUSES, and otherwise
+        is board_count boards addressed from 0x40 on the default bus.
+        """
+        if self.layout is not None:
+            return self.layout
+        if BOARD_MAP and os.path.isfile(BOARD_MAP):
+            return read_board_map(BOARD_MAP)
+        if PROBE_BUSES:
+            found = probe_boards(PROBE_BUSES, self.simulated)
+            return [(num * BOARD_CHANNELS, bus, address) for num, (bus, address) in enumerate(found)]
+        return [(x * BOARD_CHANNELS, None, 0x040 + x) for x in range(0, self.board_count)]
 
     def connect(self):
         """
-        Starts a new connection to I2C boards. Assumes addresses start at 0x040 and increment
+        Starts a new connection to I2C boards, laid out as find_layout() says.
         """
-        if not CAPABLE:
-            return True
+        if self.simulated:
+            from simulation import SimulatedPCA9685 as make_board
+        elif i2c_library() is None:
+            return False
+        else:
+            make_board = i2c_library().PCA9685
 
-        for x in range(0, BOARD_COUNT):
+        self.boards = []
+        self.first_channels = []
+        self.board_buses = []
+        self.channel_pins = {}
+        self.shadow = []
+        try:
+            layout = self.find_layout()
+        except (OSError, ValueError) as error:
+            print("Couldn't read the board layout:", error)
+            return False
+
+        for x, (first_channel, bus, address) in enumerate(layout):
             try:
-                self.boards.append(Adafruit_PCA9685.PCA9685(address=0x040 + x))
+                # leave the bus out to get the library's default one
+                if bus is None:
+                    self.boards.append(make_board(address=address))
+                else:
+                    self.boards.append(make_board(address=address, busnum=bus))
                 self.boards[x].set_pwm_freq(OUTPUT_FREQUENCY)
+                # let one write fill the registers of several channels in a row.
+                # set_pwm_freq() restores MODE1, so this has to come after it.
+                device = self.boards[x]._device
+                device.write8(MODE1, device.readU8(MODE1) | MODE1_AUTO_INCREMENT)
+                self.shadow.append([None] * BOARD_CHANNELS)
             # catch connection failures
             except:
                 return False
+            self.first_channels.append(first_channel)
+            self.board_buses.append(bus)
+            for pin in range(0, BOARD_CHANNELS):
+                self.channel_pins[first_channel + pin] = (x, pin)
         return True
 
+    def boards_by_bus(self):
+        """
+        Returns a dictionary from each bus to the list of its connected boards' indexes.
+        Boards on one bus have to take turns, but separate buses can be written at once.
+        """
+        buses = {}
+        for board_num, bus in enumerate(self.board_buses):
+            buses.setdefault(bus, []).append(board_num)
+        return buses
+
     def disconnect(self):
         """
         Sends zeros and deletes boards
         """
-        if not CAPABLE:
-            return True
-
         # try to send abort command. if it fails, move on
         try:
             self.clear()
         except:
             pass
         self.boards = []
+        self.first_channels = []
+        self.board_buses = []
+        self.channel_pins = {}
+        self.shadow = []
         return True
 
     def send(self, amplitudes):
         """
-        Sends an array of amplitudes to the connected devices.
+        Sends an array of amplitudes to the connected devices. Only channels
+        that changed since the last send are written.
             :param amplitudes: is the array to send.
         """
-        if not CAPABLE:
-            return
+        for board_num in range(0, len(self.boards)):
+            self.send_board(board_num, amplitudes)
 
-        for num, amplitude in enumerate(amplitudes):
-            channel = num % 16
-            board = (num - channel) // 16
-            self.boards[int(board)].set_pwm(int(channel), 0, int(amplitude * OUTPUT_SCALE))
+    def send_channels(self, channels, amplitudes):
+        """
+        Sends only some of the channels in an array of amplitudes.
+            :param channels: is the sorted list of channel numbers to send.
+            :param amplitudes: is the array for all boards.
+        """
+        pins_by_board = {}
+        for channel in channels:
+            # channels no board is mapped to are left out
+            if channel in self.channel_pins:
+                board_num, pin = self.channel_pins[channel]
+                pins_by_board.setdefault(board_num, []).append(pin)
+
+        for board_num, pins in pins_by_board.items():
+            self.send_board(board_num, amplitudes, pins)
+
+    def send_board(self, board_num, amplitudes, pins=None):
+        """
+        Writes the channels of one board that differ from what it last received.
+        Neighbouring channels that changed together are written in one block.
+        Each board can be sent from its own thread.
+            :param board_num: is the index of the board in self.boards.
+            :param amplitudes: is the array for all boards. Only this board's channels are sent.
+            :param pins: is an optional sorted list of this board's pins (0 to 15)
+                to send. Defaults to all of them.
+        """
+        send_start = time.perf_counter()
+        first_channel = self.first_channels[board_num]
+        row = amplitudes[first_channel:first_channel + BOARD_CHANNELS]
+        if pins is None:
+            pins = range(0, len(row))
+
+        shadow = self.shadow[board_num]
+        values = list(shadow)
+        changed = []
+        for pin in pins:
+            value = int(row[pin] * OUTPUT_SCALE)
+            if value != shadow[pin]:
+                values[pin] = value
+                changed.append(pin)
+
+        first = 0
+        while first < len(changed):
+            # grow the block while the next changed pin is right after this one
+            last = first
+            while (last + 1 < len(changed)
+                   and changed[last + 1] == changed[last] + 1
+                   and changed[last + 1] - changed[first] < MAX_BLOCK_CHANNELS):
+                last += 1
+
+            pin, end = changed[first], changed[last] + 1
+            self.write_block(self.boards[board_num], pin, values[pin:end])
+            # only remember values that actually made it to the board
+            shadow[pin:end] = values[pin:end]
+            first = last + 1
+
+        if self.metrics is not None:
+            self.metrics.record_send(board_num, time.perf_counter() - send_start)
+
+    @staticmethod
+    def write_block(board, pin, values):
+        """
+        Sets several consecutive channels of a board in a single I2C transaction.
+        Relies on the auto-increment mode turned on in connect().
+            :param board: is the PCA9685 to write to.
+            :param pin: is the first channel to set.
+            :param values: is the list of raw values for that channel and the ones after it.
+        """
+        data = []
+        for value in values:
+            # same registers set_pwm(pin, 0, value) would write, but all in one go
+            data += [0, 0, value & 0xFF, value >> 8]
+        board._device.writeList(LED0_ON_L + 4 * pin, data)
 
     def clear(self):
         """
         Shuts off all outputs.
         """
-        if not CAPABLE:
-            return
+        for board_num, board in enumerate(self.boards):
+            board.set_all_pwm(0, 0)
+            self.shadow[board_num] = [0] * BOARD_CHANNELS
+
+def read_board_map(filename):
+    """
+    Returns the list of (first channel, bus, address) in a board map file. Each
+    line is one board, as its first channel, bus number, and address, like:
+        0   1 0x40
+        16  1 0x41
+        32  3 0x40
+    Everything after a # is a comment. Raises ValueError if a line is invalid.
+        :param filename: is the path to the board map file.
+    """
+    layout = []
+    with open(filename) as file:
+        for line_num, line in enumerate(file, 1):
+            words = line.split("#", 1)[0].split()
+            if not words:
+                continue
+            try:
+                if len(words) != 3:
+                    raise ValueError
+                # int(x, 0) takes the address in hex or decimal
+                first_channel, bus, address = int(words[0]), int(words[1]), int(words[2], 0)
+            except ValueError:
+                raise ValueError("{} line {}: expected a channel, bus, and address".format(
+                    filename, line_num))
+            if first_channel < 0 or address not in PCA9685_ADDRESSES:
+                raise ValueError("{} line {}: invalid channel or address".format(filename, line_num))
+            layout.append((first_channel, bus, address))
+
+    # boards can't share channels, or a bus and address
+    layout.sort()
+    for (first, bus, address), (next_first, _, _) in zip(layout, layout[1:]):
+        if next_first < first + BOARD_CHANNELS:
+            raise ValueError("{}: boards at channels {} and {} overlap".format(filename, first, next_first))
+    if len(set((bus, address) for _, bus, address in layout)) != len(layout):
+        raise ValueError("{}: the same bus and address is listed twice".format(filename))
+    return layout
+
+def is_pca9685(read):
+    """
+    Returns whether the device at an address is a PCA9685, and not another chip
+    that happens to answer there, like an ADS1115 at 0x48, an MPU6050 at 0x68 or
+    a BME280 at 0x76. Only reads registers, so it's safe on any device. A PCA9685
+    whose all-call address was reprogrammed isn't recognized; list it in the
+    board map file instead.
+        :param read: is a function that reads one register, like a device's readU8.
+    """
+    try:
+        return (read(ALLCALLADR) == ALLCALLADR_RESET and not read(MODE2) & MODE2_RESERVED
+                and read(PRE_SCALE) >= MIN_PRESCALE)
+    # nothing answered at the address
+    except OSError:
+        return False
+
+def probe_boards(buses, simulated=False):
+    """
+    Returns the (bus, address) of every PCA9685 that answers on the given buses,
+    in order of bus then address. Other devices on the buses are left alone.
+        :param buses: is the list of I2C bus numbers to search.
+        :param simulated: is whether to search the simulated buses instead.
+    """
+    if simulated:
+        from simulation import probe_device as get_device
+    else:
+        # comes with Adafruit_PCA9685
+        from Adafruit_GPIO import I2C
+
+        def get_device(bus, address):
+            return I2C.get_i2c_device(address, busnum=bus)
+
+    def probe(bus, address):
+        try:
+            device = get_device(bus, address)
+        except OSError:
+            return False
+        return is_pca9685(device.readU8)
 
-        for board in self.boards:
-            for num in range(0,16):
-                board.set_pwm(num, 0, 0)
+    return [(bus, address) for bus in buses for address in PCA9685_ADDRESSES if probe(bus, address)]
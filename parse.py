@@ -9,78 +9,152 @@
 # Global setting for time granularity default
 DEFAULT_STEPS_IN_TIMELINE = 10
 
-from pathlib import Path
+from array import array
+from contextlib import nullcontext
+from pathlib import Path, PurePath
 import re
-from ansicolor import red, green, blue, yellow, black, magenta, white
-# install package by typing: pip install ansicolor
-from core import Interval
+import numpy # install package by typing: pip install numpy
+from color import red, green, blue, yellow, black, magenta, white
+from core import Interval, CompactTimeline, INTERVAL_DTYPE, MAX_INTERVAL_VALUE
 from visualization import interval_to_string, add_quotes
 
+# Finds the numbers in a line that might hold the step count
+STEPS_PATTERN = re.compile(r'\d+')
+
 # reads timeline from file. Check README.md for more details.
-def read_timeline(filename, verbose=False):
+def read_timeline(source, verbose=False):
     """
-    Reads a timeline of intervals from a text file. Returns the timeline and if there are errors.
-        :param filename: is the path to the timeline file.
+    Reads a timeline of intervals. Returns the timeline as a CompactTimeline, the step count,
+    and a list of (line number, message) for each error found. The list is empty if there are none.
+        :param source: is the path to the timeline file, or an open file or
+            any other iterable of lines.
         :param verbose: is an optional flag.
             When true, extra parsing information is printed to the console. Defaults to false.
     """
+    if verbose:
+        return read_timeline_verbose(source)
+
+    if not isinstance(source, (str, PurePath)):
+        return parse_lines(source)
+
+    if not file_exists(source):
+        return (CompactTimeline.from_lists([]), DEFAULT_STEPS_IN_TIMELINE,
+                [(0, "{} is not a file".format(source))])
+
+    with open(source) as lines:
+        return parse_lines(lines)
+
+def parse_lines(lines):
+    """
+    Builds a timeline from lines of text in a single pass, without printing anything.
+    Returns the same thing as read_timeline().
+        :param lines: is any iterable of lines, like an open file.
+    """
+    # every interval's numbers in a row, and where each channel's intervals start.
+    # The timeline is built straight from these without making an object for each interval
+    values = array("i")
+    offsets = [0]
+    steps = 0
+    errors = []
+
+    for num, line in enumerate(lines, 1):
+        # if you find the comment symbol, ignore everything after it
+        line = line.split("#", 1)[0]
+        if not line.strip():
+            continue
+
+        # a line with a single number before the first interval is the step count
+        if len(offsets) == 1 and steps == 0:
+            nums_in_line = STEPS_PATTERN.findall(line)
+            if len(nums_in_line) == 1:
+                steps = int(nums_in_line[0])
+                continue
+
+        for intv in line.split(","):
+            params = intv.split()
+            try:
+                # has to be exactly 3 whole numbers that aren't negative
+                if len(params) != 3:
+                    raise ValueError
+                new_interval = (int(params[0]), int(params[1]), int(params[2]))
+                if min(new_interval) < 0 or max(new_interval) > MAX_INTERVAL_VALUE:
+                    raise ValueError
+            except ValueError:
+                errors.append((num, "invalid interval \"{}\"".format(intv.strip())))
+                continue
+            values.extend(new_interval)
+
+        # lines with no valid intervals don't count as channels
+        if len(values) > 3 * offsets[-1]:
+            offsets.append(len(values) // 3)
+
+    if steps == 0:
+        steps = DEFAULT_STEPS_IN_TIMELINE
+
+    intervals = numpy.frombuffer(values, dtype=numpy.intc).astype(INTERVAL_DTYPE["start"]).view(INTERVAL_DTYPE)
+    return CompactTimeline(intervals, offsets), steps, errors
+
+def read_timeline_verbose(source):
+    """
+    Reads a timeline the same way read_timeline() does, but explains each step of
+    the parsing on the console. This is what the editor/visualizer shows.
+        :param source: is the path to the timeline file, or an open file or
+            any other iterable of lines.
+    """
     # make timeline array
     timeline = []
     steps = 0
 
     count, total = 0, 0
 
-    # Yes, this is the second part where this is checked. Gotta be sure.
-    if not file_exists(filename):
-        if verbose:
-            print(add_quotes(filename), "is not a file")
-        return False
+    errors = []
 
-    errors = False
+    if isinstance(source, (str, PurePath)):
+        # Yes, this is the second part where this is checked. Gotta be sure.
+        if not file_exists(source):
+            print(add_quotes(source), "is not a file")
+            return (CompactTimeline.from_lists([]), DEFAULT_STEPS_IN_TIMELINE,
+                    [(0, "{} is not a file".format(source))])
+        opened = open(source)
+    else:
+        opened = nullcontext(source)
 
-    with open(filename) as lines:
+    with opened as lines:
         for num, line in enumerate(lines):
             line = line.strip()
-            if verbose:
-                print("reading line {} >".format(num + 1), add_quotes(line))
+            print("reading line {} >".format(num + 1), add_quotes(line))
 
             if not line:
-                if verbose:
-                    print(black("Skipping blank line\n", bold=True))
+                print(black("Skipping blank line\n", bold=True))
                 continue
 
             if line.startswith("#"):
-                if verbose:
-                    print(black("Skipping comment line\n", bold=True))
+                print(black("Skipping comment line\n", bold=True))
                 continue
 
             # if you find the comment symbol, ignore everything after it
             comment_pos = line.find("#")
             if comment_pos != -1:
-                if verbose:
-                    print(black("\tRemoving comment > ", bold=True), end='')
-                    print(add_quotes(line[comment_pos:]))
-                    print(black("\tParsing remaining line > ", bold=True), end='')
-                    print(add_quotes(line[:comment_pos]))
+                print(black("\tRemoving comment > ", bold=True), end='')
+                print(add_quotes(line[comment_pos:]))
+                print(black("\tParsing remaining line > ", bold=True), end='')
+                print(add_quotes(line[:comment_pos]))
                 line = line[:comment_pos]
 
             if count == 0 and steps == 0:
                 found_steps = False
                 try:
-                    nums_in_line = re.findall(r'\d+', line)
+                    nums_in_line = STEPS_PATTERN.findall(line)
                     if len(nums_in_line) == 1:
                         steps = int(nums_in_line[0])
                         found_steps = True
                 except (ValueError, IndexError):
                     pass
-                if verbose:
-                    if found_steps:
-                        print(green("\tFound step count:", bold=True), steps)
-                    else:
-                        print(yellow("\tFailed to find step count before first interval.", bold=True))
-                        print(black("\t\tSetting step count to default:", bold=True), DEFAULT_STEPS_IN_TIMELINE)
                 if found_steps:
+                    print(green("\tFound step count:", bold=True), steps)
                     continue
+                print(yellow("\tFailed to find step count before first interval.", bold=True))
+                print(black("\t\tSetting step count to default:", bold=True), DEFAULT_STEPS_IN_TIMELINE)
 
             intvs = line.split(",")
             timeline.append([])
@@ -90,47 +164,42 @@ def read_timeline(filename, verbose=False):
                 intv = intv.strip()
 
                 # see if it's in the form [#] [#] [#]
-                if not parse_check_format(intv, verbose):
-                    errors = True
+                if not parse_check_format(intv, True):
+                    errors.append((num + 1, "invalid interval \"{}\"".format(intv)))
                     continue
 
                 params = intv.split()
 
                 # check that each number is legit
-                if not parse_check_numbers(params, verbose):
-                    errors = True
+                if not parse_check_numbers(params, True):
+                    errors.append((num + 1, "invalid interval \"{}\"".format(intv)))
                     continue
 
                 # use those valid numbers to make an interval
                 new_interval = Interval(int(params[0]), int(params[1]), int(params[2]))
 
-                if verbose:
-                    print(green("\t\tinterval >"), interval_to_string(new_interval))
+                print(green("\t\tinterval >"), interval_to_string(new_interval))
 
                 total = total + 1
                 timeline[count].append(new_interval)
 
             # if it's run through the line and not added any intervals...
             if not timeline[count]:
-                if verbose:
-                    print(yellow("no intervals found. Skipping line."))
+                print(yellow("no intervals found. Skipping line."))
                 del timeline[-1]
             else:
-                if verbose:
-                    print(green("intervals found:"), len(timeline[count]))
+                print(green("intervals found:"), len(timeline[count]))
                 count = count + 1
 
-            if verbose:
-                print() # newline
+            print() # newline
 
-    if verbose:
-        print("reached end of file.")
-        print("found {} intervals across {} channels.".format(total, len(timeline)))
+    print("reached end of file.")
+    print("found {} intervals across {} channels.".format(total, len(timeline)))
 
     if steps == 0:
         steps = DEFAULT_STEPS_IN_TIMELINE
 
-    return timeline, steps, errors
+    return CompactTimeline.from_lists(timeline), steps, errors
 
 def file_exists(filename):
     """
@@ -190,8 +259,9 @@ def parse_check_numbers(params, verbose=False):
                 print(add_quotes(param))
             return False
         else:
-            # int() allows negatives, but we don't want those
-            if num < 0:
+            # int() allows negatives, but we don't want those,
+            # and each number has to fit in a CompactTimeline
+            if num < 0 or num > MAX_INTERVAL_VALUE:
                 if verbose:
                     print(red("\t\tinvalid integer range > "), end='')
                     print(add_quotes(param))
@@ -226,4 +296,4 @@ def get_test_timeline():
     timeline[2].append(Interval(2, 3, 1))
     timeline[2].append(Interval(6, 2, 9))
 
-    return timeline
+    return CompactTimeline.from_lists(timeline)
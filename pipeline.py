@@ -0,0 +1,218 @@
+#!/usr/bin/python3
+"""
+    This module overlaps working out frames with writing them to the
+    boards. Frames are queued ahead of time, and a writer thread for
+    each I2C bus sends them out when their deadline comes.
+"""
+
+# Global setting for whether playback writes to the boards from background threads
+THREADED_OUTPUT = True
+# Global setting for how many frames can be queued ahead of the boards
+PIPELINE_DEPTH = 8
+
+import queue
+import threading
+from scheduler import clock
+
+class OutputPipeline:
+    """
+    Feeds frames to a writer thread for each bus. Each writer waits
+    for its frame's deadline, so a slow write on one bus doesn't
+    hold up the others or the code that works out the frames.
+    """
+
+    def __init__(self, device, scheduler, depth=None, metrics=None, recorder=None):
+        """
+        Makes a pipeline. Call start() before queueing frames.
+            :param device: is the connected PWM_board to write to.
+            :param scheduler: decides when each frame is written.
+            :param depth: is how many frames can wait in each queue. Defaults to PIPELINE_DEPTH.
+            :param metrics: is an optional Metrics to record how late each step starts
+                going out, and how long each cycle takes to go out.
+            :param recorder: is an optional Recorder to record each frame written in,
+                once for each writer.
+        """
+        self.device = device
+        self.scheduler = scheduler
+        self.metrics = metrics
+        self.recorder = recorder
+        self.depth = PIPELINE_DEPTH if depth is None else depth
+        self.queues = []
+        self.threads = []
+        self.stopped = threading.Event()
+        # the first exception from a writer thread, raised again by queue_frame()
+        self.error = None
+        # each step is timed once, by the first writer to send it. The lock
+        # keeps two writers from both timing the same step
+        self.lock = threading.Lock()
+        self.last_timed = -1
+        # when the first step of the current cycle went out
+        self.cycle_started = None
+        # the last (tick, step, amplitudes, frame) each writer sent, or None
+        self.written = []
+
+    def start(self):
+        """
+        Starts a writer thread for each bus.
+        """
+        # boards on one bus take turns anyway, so each bus gets a writer.
+        # with no boards connected, one writer still paces the frames
+        writers = [self.bus_writer(board_nums) for board_nums in self.device.boards_by_bus().values()]
+        if not writers:
+            writers = [self.device.send]
+
+        self.stopped.clear()
+        self.error = None
+        self.last_timed = -1
+        self.cycle_started = None
+        self.written = [None] * len(writers)
+        for num, write in enumerate(writers):
+            frames = queue.Queue(maxsize=self.depth)
+            thread = threading.Thread(target=self.run_writer, args=(write, frames, num), daemon=True)
+            self.queues.append(frames)
+            self.threads.append(thread)
+            thread.start()
+
+    def bus_writer(self, board_nums):
+        """
+        Returns a function that sends a frame to the boards on one bus.
+            :param board_nums: is the list of the boards' indexes in device.boards.
+        """
+        def write(frame):
+            for board_num in board_nums:
+                self.device.send_board(board_num, frame)
+        return write
+
+    def queue_frame(self, tick, frame, cancel=None, step=None, amplitudes=None):
+        """
+        Queues a frame for every writer. Blocks while the queues are full,
+        which keeps the caller from running too far ahead. Returns False if
+        it was cancelled before every writer had the frame.
+            :param tick: is the scheduler step the frame belongs to.
+            :param frame: is the scaled frame to send.
+            :param cancel: is an optional threading.Event. Setting it ends the wait early.
+            :param step: is the step of the cycle the frame is, so the writers can time
+                each cycle from when its step 0 goes out.
+            :param amplitudes: is the row of amplitudes the frame was scaled from, handed
+                back by last_written().
+        """
+        for frames in self.queues:
+            while True:
+                if self.error:
+                    raise self.error
+                if cancel is not None and cancel.is_set():
+                    return False
+                try:
+                    # time out now and then so a dead writer can't block us forever
+                    frames.put((tick, frame, step, amplitudes), timeout=0.01 if cancel is not None else 0.1)
+                    break
+                except queue.Full:
+                    continue
+        return True
+
+    def drain(self, cancel=None):
+        """
+        Waits until the writers have handled every queued frame, by writing it
+        or dropping it for being late.
+            :param cancel: is an optional threading.Event. Setting it ends the wait early.
+        """
+        for frames in self.queues:
+            with frames.all_tasks_done:
+                while frames.unfinished_tasks and not self.stopped.is_set():
+                    if cancel is not None and cancel.is_set():
+                        return
+                    frames.all_tasks_done.wait(0.01)
+
+    def run_writer(self, write, frames, num=0):
+        """
+        Writes each queued frame at its deadline until stopped. Runs in its own thread.
+            :param write: is the function that sends a frame.
+            :param frames: is the queue to take frames from.
+            :param num: is the number of this writer, for the recorder.
+        """
+        while not self.stopped.is_set():
+            try:
+                tick, frame, step, amplitudes = frames.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            try:
+                if self.write_frame(write, tick, frame, num, step):
+                    self.written[num] = (tick, step, amplitudes, frame)
+            finally:
+                # lets drain() know this frame is done with
+                frames.task_done()
+
+    def write_frame(self, write, tick, frame, num, step=None):
+        """
+        Writes one frame at its deadline, unless it's too late or the pipeline is stopping.
+        Returns whether it was written.
+            :param write: is the function that sends a frame.
+            :param tick: is the scheduler step the frame belongs to.
+            :param frame: is the scaled frame to send.
+            :param num: is the number of the writer, for the recorder.
+            :param step: is the step of the cycle the frame is, or None if unknown.
+        """
+        # a False wait means the frame is too late, or we're stopping
+        if not self.scheduler.wait(tick, self.stopped):
+            return False
+        if self.stopped.is_set():
+            return False
+        write_start = clock()
+        if self.metrics is not None:
+            self.time_step(tick, step, write_start)
+
+        try:
+            write(frame)
+        except Exception as error:
+            self.error = error
+            self.stopped.set()
+            return False
+        if self.recorder is not None:
+            self.recorder.record(tick, self.scheduler.deadline(tick), write_start, clock(), frame, num)
+        return True
+
+    def time_step(self, tick, step, write_start):
+        """
+        Records how late a step started going out, and how long the last cycle took
+        when it's the first step of a new one. Each step is only recorded by the first
+        writer to send it, so the histograms count steps, not steps times buses.
+            :param tick: is the scheduler step being written.
+            :param step: is the step of the cycle, or None if unknown.
+            :param write_start: is the clock() value when the write started.
+        """
+        cycle_time = None
+        with self.lock:
+            # a writer that's behind the others sends steps that were already timed
+            if tick <= self.last_timed:
+                return
+            self.last_timed = tick
+            if step == 0:
+                if self.cycle_started is not None:
+                    cycle_time = write_start - self.cycle_started
+                self.cycle_started = write_start
+        self.metrics.lateness.record(write_start - self.scheduler.deadline(tick))
+        if cycle_time is not None:
+            self.metrics.cycles.record(cycle_time)
+
+    def last_written(self):
+        """
+        Returns (tick, step, amplitudes, frame) for the newest frame that every
+        writer has sent, which is what the boards hold, or None if some writer
+        hasn't sent anything yet. Frames still queued are ahead of this, so after
+        stop() it's where playback really got to.
+        """
+        if not self.written or None in self.written:
+            return None
+        # the writer that's furthest behind
+        return min(self.written, key=lambda written: written[0])
+
+    def stop(self):
+        """
+        Stops the writers and throws away any frames still queued. Nothing is
+        written to the boards after this returns, so it's safe to clear them.
+        """
+        self.stopped.set()
+        for thread in self.threads:
+            thread.join()
+        self.queues = []
+        self.threads = []
@@ -0,0 +1,219 @@
+#!/usr/bin/python3
+"""
+    This module records every frame that playback sends to the boards,
+    with when it was due and when it was actually written, and saves
+    them as a compact binary log. Run it directly to replay a log on
+    the boards (or simulated ones), or to check its timing offline.
+
+        ./recorder.py replay recordings/walk-20170119-120000.rec [--simulated] [--speed 1.0]
+        ./recorder.py stats recordings/walk-20170119-120000.rec
+"""
+
+# Global setting for recording every run
+RECORD = False
+# Global setting for the folder recordings are saved in
+RECORD_FOLDER = "recordings"
+# Global setting for how many frames the recorder makes room for at a time
+RECORD_CHUNK = 16384
+
+# Marks the start of a recording file
+RECORD_MAGIC = b"PNRC"
+# Bump this whenever the recording format changes
+RECORD_VERSION = 2
+
+import argparse
+import contextlib
+import json
+import struct
+import sys
+import threading
+import time
+import numpy # install package by typing: pip install numpy
+from scheduler import clock, sleep_until
+
+# magic, version, channel count, frame count, length of the JSON details
+HEADER = struct.Struct("<4sHIII")
+
+def record_dtype(channels):
+    """
+    Returns the numpy dtype of one recorded frame.
+        :param channels: is the number of channels in each frame.
+    """
+    return numpy.dtype([
+        ("tick", "<i8"),        # the scheduler step it belongs to
+        ("deadline", "<f8"),    # when it was due, in seconds from the start of the recording
+        ("started", "<f8"),     # when the write started
+        ("finished", "<f8"),    # when the write finished
+        ("writer", "<i2"),      # which writer thread sent it (one for each bus), or 0
+        # the same float64 values playback sent, so a replay writes exactly the same registers
+        ("frame", "<f8", (channels,)),
+    ])
+
+class Recorder:
+    """
+    Holds recorded frames in preallocated arrays. Recording a frame copies it
+    into the next free row, so it's cheap enough for the real-time path, and
+    can be done from several writer threads at once.
+    """
+
+    def __init__(self, channels, chunk=None):
+        """
+        Makes an empty recorder. Times are recorded from when it's made.
+            :param channels: is the number of channels in each frame. Longer frames are cut short.
+            :param chunk: is how many frames to make room for at a time. Defaults to RECORD_CHUNK.
+        """
+        self.channels = channels
+        self.chunk = RECORD_CHUNK if chunk is None else chunk
+        self.dtype = record_dtype(channels)
+        self.started = clock()
+        self.wall_time = time.time()
+        self.details = {}
+        # how many rows have been handed out. The lock makes sure threads never get the same one
+        self.count = 0
+        self.chunks = [numpy.zeros(self.chunk, dtype=self.dtype)]
+        self.lock = threading.Lock()
+
+    def record(self, tick, deadline, started, finished, frame, writer=0):
+        """
+        Records one frame that was written.
+            :param tick: is the scheduler step it belongs to.
+            :param deadline: is the clock() value it was due at.
+            :param started: is the clock() value when the write started.
+            :param finished: is the clock() value when the write finished.
+            :param frame: is the scaled frame that was sent.
+            :param writer: is which writer thread sent it.
+        """
+        with self.lock:
+            row = self.count
+            self.count += 1
+            chunk_num, index = divmod(row, self.chunk)
+            # only happens once every chunk frames
+            if chunk_num >= len(self.chunks):
+                self.chunks.append(numpy.zeros(self.chunk, dtype=self.dtype))
+        entry = self.chunks[chunk_num][index]
+        entry["tick"] = tick
+        entry["deadline"] = deadline - self.started
+        entry["started"] = started - self.started
+        entry["finished"] = finished - self.started
+        entry["writer"] = writer
+        # a gait swapped in while recording can have a different number of channels
+        width = min(len(frame), self.channels)
+        entry["frame"][:width] = frame[:width]
+
+    def frames(self):
+        """
+        Returns every recorded frame as one structured array, in the order they were recorded.
+        """
+        return numpy.concatenate(self.chunks)[:self.count]
+
+    def save(self, path):
+        """
+        Writes the recording to a file.
+            :param path: is the file to write.
+        """
+        records = self.frames()
+        details = dict(self.details, wall_time=self.wall_time)
+        details_json = json.dumps(details).encode()
+        with open(path, "wb") as file:
+            file.write(HEADER.pack(RECORD_MAGIC, RECORD_VERSION, self.channels, len(records), len(details_json)))
+            file.write(details_json)
+            file.write(records.tobytes())
+
+def load_recording(path):
+    """
+    Returns (records, details) from a recording file, where records is a structured
+    array like Recorder.frames() and details is a dictionary about the run.
+    Raises ValueError if the file isn't a recording.
+        :param path: is the recording file to read.
+    """
+    with open(path, "rb") as file:
+        header = file.read(HEADER.size)
+        if len(header) != HEADER.size:
+            raise ValueError("{} is too short to be a recording".format(path))
+        magic, version, channels, count, details_length = HEADER.unpack(header)
+        if magic != RECORD_MAGIC or version != RECORD_VERSION:
+            raise ValueError("{} isn't a version {} recording".format(path, RECORD_VERSION))
+        details = json.loads(file.read(details_length).decode())
+    records = numpy.memmap(path, dtype=record_dtype(channels), mode="r",
+                           offset=HEADER.size + details_length, shape=(count,))
+    return records, details
+
+def replay_frames(records):
+    """
+    Returns the records with one frame for each step, the first one written,
+    sorted by step. With several writer threads, each step is recorded once per bus.
+        :param records: is the structured array from load_recording().
+    """
+    if not len(records):
+        return records
+    order = numpy.argsort(records["tick"], kind="stable")
+    ticks = records["tick"][order]
+    first = numpy.concatenate([[True], ticks[1:] != ticks[:-1]])
+    return records[order][first]
+
+def replay(records, device, speed=1.0):
+    """
+    Sends the recorded frames to a device with the same timing as the recorded
+    deadlines. Returns how many frames were sent.
+        :param records: is the structured array from load_recording().
+        :param device: is the connected PWM_board to send to.
+        :param speed: is how much faster than recorded to play. 2 plays twice as fast.
+    """
+    frames = replay_frames(records)
+    if not len(frames):
+        return 0
+    start = clock() - frames["deadline"][0] / speed
+    for entry in frames:
+        sleep_until(start + entry["deadline"] / speed)
+        device.send(entry["frame"])
+    return len(frames)
+
+def timing_stats(records):
+    """
+    Returns a dictionary of how closely the recorded writes kept to their deadlines.
+        :param records: is the structured array from load_recording().
+    """
+    lateness = records["started"] - records["deadline"]
+    durations = records["finished"] - records["started"]
+    stats = {"frames": len(records), "steps": len(numpy.unique(records["tick"]))}
+    for name, values in (("lateness", lateness), ("write_time", durations)):
+        if len(values):
+            stats[name] = {"mean": float(values.mean()), "max": float(values.max()),
+                           "p50": float(numpy.percentile(values, 50)),
+                           "p99": float(numpy.percentile(values, 99))}
+    return stats
+
+def main():
+    """
+    Replays a recording or prints its timing, as chosen on the command line.
+    """
+    parser = argparse.ArgumentParser(description="Replay a recorded run or check its timing.")
+    parser.add_argument("command", choices=["replay", "stats"])
+    parser.add_argument("recording", help="recording file to read")
+    parser.add_argument("--simulated", action="store_true", help="replay on simulated boards")
+    parser.add_argument("--speed", type=float, default=1.0, help="playback speed, 1 is as recorded")
+    args = parser.parse_args()
+
+    records, details = load_recording(args.recording)
+    if args.command == "stats":
+        json.dump(dict(details=details, **timing_stats(records)), sys.stdout, indent=2)
+        print()
+        return
+
+    from output import PWM_board
+    # output.py says so on stdout when it falls back to simulated boards
+    with contextlib.redirect_stdout(sys.stderr):
+        board = PWM_board(simulated=True if args.simulated else None)
+    if not board.connect():
+        print("Error connecting!")
+        sys.exit(1)
+    try:
+        sent = replay(records, board, args.speed)
+        print("Replayed {} frames.".format(sent))
+    except KeyboardInterrupt:
+        print("\nStopped.")
+    finally:
+        board.disconnect()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/python3
+"""
+    This module resamples compiled timelines to a higher frame rate,
+    so the outputs can ramp smoothly between amplitudes instead of
+    jumping from one to the next on each step.
+"""
+
+# Global setting for the frame rate of resampled playback (frames per second).
+# None plays the gait's own steps with no ramps
+RESAMPLE_RATE = None
+# Global setting for the shape of each ramp: "step" (no ramp), "linear", or "ease"
+RAMP_SHAPE = "linear"
+# Global setting for how much of a step each ramp takes, from 0 to 1
+RAMP_WIDTH = 0.5
+
+import numpy # install package by typing: pip install numpy
+
+def resample_frames(amplitudes, frame_count, shape=None, width=None):
+    """
+    Returns a compiled timeline resampled to a different number of frames per cycle.
+    At the start of each step, the value ramps from the last step's amplitude to the
+    new one. Since cycles repeat, the first step ramps from the last one.
+        :param amplitudes: is the matrix returned by compile_timeline().
+        :param frame_count: is the number of frames the cycle should have.
+        :param shape: is "step", "linear", or "ease". Defaults to RAMP_SHAPE.
+        :param width: is how much of a step each ramp takes, from 0 to 1.
+            Defaults to RAMP_WIDTH.
+    """
+    shape = RAMP_SHAPE if shape is None else shape
+    width = RAMP_WIDTH if width is None else width
+    if shape not in ("step", "linear", "ease"):
+        raise ValueError("unknown ramp shape: {}".format(shape))
+
+    steps = len(amplitudes)
+    # where each frame falls on the timeline, counted in steps
+    position = numpy.arange(frame_count) * (float(steps) / frame_count)
+    current = numpy.floor(position).astype(int)
+    if shape == "step" or width <= 0:
+        return amplitudes[current].astype(float)
+
+    # how far along its ramp each frame is, from 0 to 1
+    progress = numpy.clip((position - current) / width, 0.0, 1.0)
+    if shape == "ease":
+        # smoothstep: starts and ends the ramp gently
+        progress = progress * progress * (3.0 - 2.0 * progress)
+
+    previous = amplitudes[current - 1] # index -1 wraps around to the last step
+    return previous + (amplitudes[current] - previous) * progress[:, numpy.newaxis]
+
+def resampled_frame_count(cycle_time, steps, rate=None):
+    """
+    Returns how many frames a cycle needs to play at the given frame rate.
+    Never fewer than the timeline's steps, so no step gets skipped.
+        :param cycle_time: is how long each cycle takes, in seconds.
+        :param steps: is the number of steps in the compiled timeline.
+        :param rate: is the frame rate. Defaults to RESAMPLE_RATE.
+    """
+    rate = RESAMPLE_RATE if rate is None else rate
+    return max(steps, int(round(cycle_time * rate)))
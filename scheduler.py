@@ -0,0 +1,181 @@
+#!/usr/bin/python3
+"""
+    This module keeps playback on time. Every step of a run gets an
+    absolute deadline on a monotonic clock, so time lost on one step
+    doesn't push back every step after it.
+"""
+
+# Global setting for how long to busy-wait at the end of each sleep (seconds)
+SPIN_TIME = 0.002
+# Global setting for what to do when a step falls behind schedule
+OVERRUN_POLICY = "catch up"
+
+# Overrun policy: run late steps right away until playback is back on schedule
+OVERRUN_CATCH_UP = "catch up"
+# Overrun policy: drop any step whose time slot has already passed
+OVERRUN_SKIP = "skip"
+# Overrun policy: push every later deadline back by however late the step was
+OVERRUN_STRETCH = "stretch"
+
+import time
+import threading
+
+# time.perf_counter is monotonic and has the best resolution available
+clock = time.perf_counter
+
+def sleep_until(deadline, spin_time=SPIN_TIME, cancel=None):
+    """
+    Blocks until the clock reaches the deadline. Sleeps for most of
+    the wait, then spins for the last stretch for better accuracy.
+    Returns False if the wait was cancelled.
+        :param deadline: is the clock() value to wait for.
+        :param spin_time: is how many seconds before the deadline to start spinning.
+            Set to 0 to only sleep.
+        :param cancel: is an optional threading.Event. Setting it ends the wait early.
+    """
+    remaining = deadline - clock()
+    if remaining > spin_time:
+        if cancel is None:
+            time.sleep(remaining - spin_time)
+        elif cancel.wait(remaining - spin_time):
+            return False
+
+    # the OS can wake us up a bit late, so spin the rest of the way.
+    # sleep(0) lets other threads (like the pipeline's writers) run meanwhile
+    while clock() < deadline:
+        time.sleep(0)
+    return True
+
+class Scheduler:
+    """
+    Hands out absolute deadlines for each step of a run.
+    """
+
+    def __init__(self, step_time, policy=None, spin_time=None, metrics=None):
+        """
+        Makes a scheduler. Call start() when playback begins.
+            :param step_time: is how many seconds each step takes.
+            :param policy: is one of the OVERRUN_ values. Defaults to OVERRUN_POLICY.
+            :param spin_time: is passed to sleep_until(). Defaults to SPIN_TIME.
+            :param metrics: is an optional Metrics to count overruns in.
+        """
+        if policy is None:
+            policy = OVERRUN_POLICY
+        if policy not in (OVERRUN_CATCH_UP, OVERRUN_SKIP, OVERRUN_STRETCH):
+            raise ValueError("unknown overrun policy: {}".format(policy))
+
+        self.step_time = step_time
+        self.policy = policy
+        self.spin_time = SPIN_TIME if spin_time is None else spin_time
+        self.started = None
+        # a list of (first tick, its deadline, step time). There's a new one
+        # each time the step time changes, so earlier steps keep their deadlines
+        self.segments = []
+        self.tick = 0
+        self.overruns = 0
+        self.metrics = metrics
+        # the writer threads in pipeline.py can all wait on the same scheduler
+        self.lock = threading.Lock()
+        self.last_overrun = None
+
+    def start(self):
+        """
+        Sets the current time as the deadline of the first step.
+        """
+        self.started = clock()
+        self.segments = [(0, self.started, self.step_time)]
+        self.tick = 0
+        self.overruns = 0
+        self.last_overrun = None
+
+    def next_tick(self):
+        """
+        Returns the number of the next step in the run and moves past it.
+        """
+        tick = self.tick
+        self.tick += 1
+        return tick
+
+    def advance(self, count):
+        """
+        Returns the number of the next step in the run and moves past several
+        steps at once, for playback that doesn't wake up on every step.
+            :param count: is the number of steps to move past.
+        """
+        tick = self.tick
+        self.tick += count
+        return tick
+
+    def retime(self, step_time):
+        """
+        Changes the length of each step from the next step on. Steps that were
+        already handed out, and the next step itself, keep their deadlines.
+            :param step_time: is the new number of seconds each step takes.
+        """
+        with self.lock:
+            self.segments.append((self.tick, self.deadline(self.tick), step_time))
+            self.step_time = step_time
+
+    def slot(self, tick):
+        """
+        Returns the clock() value when a step should be output, and how long it lasts.
+            :param tick: is the number of the step since start() was called.
+        """
+        # almost always the newest segment, so search from the end
+        for first_tick, first_deadline, step_time in reversed(self.segments):
+            if tick >= first_tick:
+                return first_deadline + (tick - first_tick) * step_time, step_time
+        first_tick, first_deadline, step_time = self.segments[0]
+        return first_deadline + (tick - first_tick) * step_time, step_time
+
+    def deadline(self, tick):
+        """
+        Returns the clock() value when a step should be output.
+            :param tick: is the number of the step since start() was called.
+        """
+        return self.slot(tick)[0]
+
+    def elapsed(self):
+        """
+        Returns the number of seconds since start() was called.
+        """
+        return clock() - self.started
+
+    def wait(self, tick, cancel=None):
+        """
+        Waits for a step's deadline. Returns False if the step is so late that
+        the overrun policy says to drop it, or True if it should be output now.
+        Safe to call from several threads at once.
+            :param tick: is the number of the step since start() was called.
+            :param cancel: is an optional threading.Event. Setting it ends
+                the wait early, and then False is returned.
+        """
+        deadline = self.deadline(tick)
+
+        # on time, so wait for it
+        if clock() < deadline:
+            return sleep_until(deadline, self.spin_time, cancel)
+
+        with self.lock:
+            # check again, since another thread might have stretched the schedule
+            deadline, step_time = self.slot(tick)
+            now = clock()
+
+            # a little late, but still inside its own time slot
+            if step_time <= 0 or now < deadline + step_time:
+                return True
+
+            # the next step should already have started.
+            # count each late step once, even if several threads see it
+            if tick != self.last_overrun:
+                self.overruns += 1
+                self.last_overrun = tick
+                if self.metrics is not None:
+                    self.metrics.overruns += 1
+            if self.policy == OVERRUN_SKIP:
+                return False
+            if self.policy == OVERRUN_STRETCH:
+                delay = now - deadline
+                self.segments = [(first_tick, first_deadline + delay, step_time)
+                                 for first_tick, first_deadline, step_time in self.segments]
+            return True
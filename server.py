@@ -0,0 +1,462 @@
+#!/usr/bin/python3
+"""
+    This module lets other programs control playback over a local
+    socket while it runs. Each client sends one JSON command per line
+    and gets one JSON reply per line, and can subscribe to a status
+    message at the start of every cycle. Playback runs in its own
+    thread, so clients never hold up the real-time loop.
+
+        ./server.py [--unix pneunet.sock | --tcp 127.0.0.1:7070] [--simulated]
+
+    Commands look like {"cmd": "set_multiplier", "value": 0.5, "id": 3}.
+    The id is optional and is copied into the reply, which has "ok"
+    and either the results or an "error". The commands are:
+
+        load            file, [boundary]     parse a gait file and play it next
+        set_multiplier  value, [boundary]    change the amplitude multiplier
+        set_cycle_time  value, [boundary]    change the seconds per cycle
+        start           [cycles], [duration] start playing in the background
+        stop            [hold]               stop playing
+        pause                                stop, holding the outputs, and remember the step
+        resume          [cycles], [duration] carry on from where pause stopped
+        stream          name                 play frames another process writes to the
+                                             stream.FrameRing of that name, or null for the gait
+        status                               what's loaded and playing
+        subscribe / unsubscribe              get (or stop getting) an event message
+                                             when playback starts, starts a cycle, or stops,
+                                             and when a stream goes stale or fresh again
+
+    A boundary is "cycle" (the default) to change at the start of the
+    next cycle, or "step" to change at the very next step.
+"""
+
+# Global setting for the Unix socket the server listens on when no TCP address is given
+SERVER_SOCKET = "pneunet.sock"
+# Global setting for the TCP host and port to listen on instead, like ("127.0.0.1", 7070).
+# None uses SERVER_SOCKET. Only listen on a local address, since there's no authentication
+SERVER_TCP = None
+# Global setting for how many event messages can wait for a slow subscriber before
+# the oldest are dropped
+SUBSCRIBER_BACKLOG = 256
+# Global setting for the longest command line a client can send, in bytes
+MAX_COMMAND_LENGTH = 65536
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+from api import load
+from output import PWM_board
+from session import PlaybackSession, STEP_BOUNDARY, CYCLE_BOUNDARY
+from stream import FrameRing
+from tracelog import SILENT
+
+class CommandError(Exception):
+    """
+    A command that can't be carried out. Its message is sent back to the client.
+    """
+
+class ControlServer:
+    """
+    Serves commands for one PlaybackSession to any number of clients at once.
+    """
+
+    def __init__(self, session):
+        """
+        Makes a server for a session. Call start() to begin listening.
+            :param session: is the PlaybackSession to control. It's connected
+                when the server starts.
+        """
+        self.session = session
+        self.server = None
+        self.loop = None
+        self.socket_path = None
+        # a queue of event messages for each subscribed client
+        self.subscribers = set()
+        # the most recent cycle event, for status
+        self.last_cycle = None
+        # whether playback was stopped with pause, so resume knows where to carry on
+        self.paused = False
+        self.commands = {
+            "load": self.cmd_load,
+            "set_multiplier": self.cmd_set_multiplier,
+            "set_cycle_time": self.cmd_set_cycle_time,
+            "start": self.cmd_start,
+            "stop": self.cmd_stop,
+            "pause": self.cmd_pause,
+            "resume": self.cmd_resume,
+            "stream": self.cmd_stream,
+            "status": self.cmd_status,
+        }
+
+    async def start(self, path=None, address=None):
+        """
+        Connects the session and starts listening.
+            :param path: is the Unix socket to listen on. Defaults to SERVER_SOCKET.
+            :param address: is a (host, port) to listen on over TCP instead.
+                Defaults to SERVER_TCP.
+        """
+        self.loop = asyncio.get_running_loop()
+        if not await self.loop.run_in_executor(None, self.session.connect):
+            raise OSError("couldn't connect to the boards")
+        self.session.listeners.append(self.on_event)
+
+        address = SERVER_TCP if address is None and path is None else address
+        if address is not None:
+            host, port = address
+            self.server = await asyncio.start_server(self.handle_client, host, port, limit=MAX_COMMAND_LENGTH)
+        else:
+            self.socket_path = SERVER_SOCKET if path is None else path
+            # a socket file left over from a server that didn't shut down cleanly
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self.socket_path)
+            self.server = await asyncio.start_unix_server(self.handle_client, self.socket_path,
+                                                          limit=MAX_COMMAND_LENGTH)
+
+    def addresses(self):
+        """
+        Returns a list of where the server is listening, as text.
+        """
+        if self.socket_path is not None:
+            return [self.socket_path]
+        return ["{}:{}".format(*sock.getsockname()[:2]) for sock in self.server.sockets]
+
+    async def close(self):
+        """
+        Stops listening and stops playback. The session itself is left open.
+        """
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        if self.on_event in self.session.listeners:
+            self.session.listeners.remove(self.on_event)
+        await self.loop.run_in_executor(None, self.session.stop)
+        if self.session.source is not None:
+            self.session.source.close()
+            self.session.use_stream(None)
+        if self.socket_path is not None:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(self.socket_path)
+
+    async def handle_client(self, reader, writer):
+        """
+        Answers one client's commands until it disconnects.
+            :param reader: is the client's asyncio StreamReader.
+            :param writer: is the client's asyncio StreamWriter.
+        """
+        events = asyncio.Queue(maxsize=SUBSCRIBER_BACKLOG)
+        sender = asyncio.ensure_future(self.send_events(events, writer))
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError):
+                    self.send(writer, {"ok": False, "error": "command is too long"})
+                    break
+                except ConnectionError:
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                reply = await self.execute(line, events)
+                self.send(writer, reply)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.subscribers.discard(events)
+            sender.cancel()
+            writer.close()
+
+    async def execute(self, line, events):
+        """
+        Returns the reply to one line from a client.
+            :param line: is the bytes of the line, holding a JSON command.
+            :param events: is the client's event queue, for subscribing.
+        """
+        try:
+            request = json.loads(line)
+        except ValueError:
+            return {"ok": False, "error": "not valid JSON"}
+        if not isinstance(request, dict):
+            return {"ok": False, "error": "a command has to be a JSON object"}
+        reply = {"id": request["id"]} if "id" in request else {}
+
+        name = request.get("cmd")
+        try:
+            if name == "subscribe":
+                self.subscribers.add(events)
+                result = {}
+            elif name == "unsubscribe":
+                self.subscribers.discard(events)
+                result = {}
+            elif name in self.commands:
+                result = await self.commands[name](request)
+            else:
+                raise CommandError("unknown command: {}".format(name))
+        except CommandError as error:
+            reply.update(ok=False, error=str(error))
+            return reply
+        reply.update(ok=True, **result)
+        return reply
+
+    def send(self, writer, message):
+        """
+        Writes one message to a client as a line of JSON.
+            :param writer: is the client's asyncio StreamWriter.
+            :param message: is the dictionary to send.
+        """
+        if not writer.is_closing():
+            writer.write(json.dumps(message).encode() + b"\n")
+
+    async def send_events(self, events, writer):
+        """
+        Sends a client the event messages in its queue, for as long as it's connected.
+            :param events: is the client's event queue.
+            :param writer: is the client's asyncio StreamWriter.
+        """
+        with contextlib.suppress(ConnectionError):
+            while True:
+                self.send(writer, await events.get())
+                await writer.drain()
+
+    def on_event(self, event, details):
+        """
+        Passes a playback event to the event loop. Called from the playback thread,
+        so all it does is hand the message over.
+            :param event: is "started", "cycle", "stopped", "stale" or "fresh".
+            :param details: is the dictionary of facts about it.
+        """
+        self.loop.call_soon_threadsafe(self.publish, dict(details, event=event))
+
+    def publish(self, message):
+        """
+        Queues an event message for every subscribed client. Runs in the event loop.
+        A client that falls behind loses its oldest messages instead of holding up the rest.
+            :param message: is the dictionary to send.
+        """
+        if message["event"] == "cycle":
+            metrics = self.session.metrics
+            if metrics is not None and metrics.lateness.count:
+                message["late_p99"] = metrics.lateness.percentile(0.99)
+                message["late_max"] = metrics.lateness.max
+            self.last_cycle = message
+        source = self.session.source
+        message.update(filename=self.session.filename, cycle_time=self.session.cycle_time,
+                       multiplier=self.session.multiplier, stream=source.name if source else None)
+        for events in self.subscribers:
+            if events.full():
+                events.get_nowait()
+            events.put_nowait(message)
+
+    async def cmd_load(self, request):
+        """
+        Parses a gait file in a worker thread and plays it next.
+            :param request: has "file", and optionally "boundary".
+        """
+        filename = required(request, "file", str)
+        try:
+            timeline, steps = await self.loop.run_in_executor(None, load, filename)
+        except (OSError, ValueError) as error:
+            raise CommandError(str(error))
+        # working out the frames can take a while for big gaits
+        await self.loop.run_in_executor(None, self.session.load, timeline, steps, filename, boundary(request))
+        return {"channels": len(timeline), "steps": steps}
+
+    async def cmd_set_multiplier(self, request):
+        """
+        Changes the amplitude multiplier.
+            :param request: has "value", and optionally "boundary".
+        """
+        value = required(request, "value", (int, float))
+        if value < 0:
+            raise CommandError("the multiplier can't be negative")
+        # the frames are worked out again, off the event loop
+        await self.loop.run_in_executor(None, self.session.set_multiplier, value, boundary(request))
+        return {}
+
+    async def cmd_set_cycle_time(self, request):
+        """
+        Changes how long each cycle takes.
+            :param request: has "value", and optionally "boundary".
+        """
+        value = required(request, "value", (int, float))
+        if value <= 0:
+            raise CommandError("the cycle time has to be more than 0")
+        await self.loop.run_in_executor(None, self.session.set_cycle_time, value, boundary(request))
+        return {}
+
+    async def cmd_start(self, request, start_step=0):
+        """
+        Starts playing in the background.
+            :param request: optionally has "cycles" and "duration".
+            :param start_step: is the step of the cycle to start from.
+        """
+        session = self.session
+        if session.playing:
+            raise CommandError("already playing")
+        if session.source is None and (session.prepared is None or not session.cycle_time
+                                       or session.multiplier is None):
+            raise CommandError("load a gait and set the cycle time and multiplier first")
+        cycles = optional(request, "cycles", int)
+        duration = optional(request, "duration", (int, float))
+        self.paused = False
+        session.start(cycles, duration, start_step)
+        return {}
+
+    async def cmd_stop(self, request):
+        """
+        Stops playing and waits for it to finish stopping.
+            :param request: optionally has "hold", whether to leave the outputs where they are.
+        """
+        hold = optional(request, "hold", bool)
+        # stopping waits for the playback thread, so it's done off the event loop
+        await self.loop.run_in_executor(None, self.session.stop, hold)
+        self.paused = False
+        return {}
+
+    async def cmd_pause(self, request):
+        """
+        Stops playing with the outputs held, remembering the step to resume from.
+            :param request: has nothing else.
+        """
+        if not self.session.playing:
+            raise CommandError("not playing")
+        await self.loop.run_in_executor(None, self.session.stop, True)
+        self.paused = True
+        return {"position": self.session.position}
+
+    async def cmd_resume(self, request):
+        """
+        Starts playing again from where pause stopped.
+            :param request: optionally has "cycles" and "duration".
+        """
+        if not self.paused:
+            raise CommandError("not paused")
+        return await self.cmd_start(request, self.session.position)
+
+    async def cmd_stream(self, request):
+        """
+        Plays from a stream of frames another process writes, from the next start.
+            :param request: has "name", the name of the stream.FrameRing, or null to
+                go back to playing the gait.
+        """
+        name = optional(request, "name", str)
+        if self.session.playing:
+            raise CommandError("stop playing first")
+        ring = None
+        if name is not None:
+            try:
+                ring = FrameRing(name)
+            except (OSError, ValueError) as error:
+                raise CommandError("can't open stream {}: {}".format(name, error))
+        previous = self.session.source
+        self.session.use_stream(ring)
+        if previous is not None:
+            previous.close()
+        return {"channels": ring.channels} if ring else {}
+
+    async def cmd_status(self, request):
+        """
+        Returns what's loaded and whether it's playing.
+            :param request: has nothing else.
+        """
+        session = self.session
+        prepared = session.prepared
+        return {
+            "playing": session.playing,
+            "paused": self.paused,
+            "filename": session.filename,
+            "channels": len(prepared[0]) if prepared else None,
+            "steps": prepared[1] if prepared else None,
+            "cycle_time": session.cycle_time,
+            "multiplier": session.multiplier,
+            "position": session.position,
+            "stream": session.source.name if session.source else None,
+            "last_cycle": self.last_cycle,
+        }
+
+def required(request, key, kind):
+    """
+    Returns a value from a command, or raises CommandError if it's missing or the wrong type.
+        :param request: is the command's dictionary.
+        :param key: is the name of the value.
+        :param kind: is the type, or tuple of types, it has to be.
+    """
+    if key not in request:
+        raise CommandError("missing \"{}\"".format(key))
+    return optional(request, key, kind)
+
+def optional(request, key, kind):
+    """
+    Returns a value from a command, or None if it's missing. Raises CommandError
+    if it's the wrong type.
+        :param request: is the command's dictionary.
+        :param key: is the name of the value.
+        :param kind: is the type, or tuple of types, it has to be.
+    """
+    value = request.get(key)
+    # JSON true and false are bools, which Python also counts as ints
+    if value is not None and (not isinstance(value, kind) or (isinstance(value, bool) and kind is not bool)):
+        raise CommandError("\"{}\" has the wrong type".format(key))
+    return value
+
+def boundary(request):
+    """
+    Returns the boundary a command asks for, or raises CommandError if it isn't one.
+        :param request: is the command's dictionary.
+    """
+    value = request.get("boundary", CYCLE_BOUNDARY)
+    if value not in (STEP_BOUNDARY, CYCLE_BOUNDARY):
+        raise CommandError("boundary has to be \"{}\" or \"{}\"".format(STEP_BOUNDARY, CYCLE_BOUNDARY))
+    return value
+
+async def serve(session, path=None, address=None):
+    """
+    Runs a ControlServer for a session until the task is cancelled.
+        :param session: is the PlaybackSession to control.
+        :param path: is the Unix socket to listen on.
+        :param address: is a (host, port) to listen on over TCP instead.
+    """
+    server = ControlServer(session)
+    await server.start(path, address)
+    print("Listening on", ", ".join(server.addresses()))
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+def main():
+    """
+    Runs the server on the socket given on the command line until Ctrl-C.
+    """
+    parser = argparse.ArgumentParser(description="Control playback over a local socket.")
+    parser.add_argument("--unix", metavar="PATH", help="Unix socket to listen on")
+    parser.add_argument("--tcp", metavar="HOST:PORT", help="TCP address to listen on instead")
+    parser.add_argument("--simulated", action="store_true", help="play on simulated boards")
+    args = parser.parse_args()
+
+    address = None
+    if args.tcp:
+        host, _, port = args.tcp.rpartition(":")
+        if not port.isdigit():
+            parser.error("--tcp has to be HOST:PORT")
+        address = (host or "127.0.0.1", int(port))
+
+    session = PlaybackSession(PWM_board(simulated=True if args.simulated else None), log_level=SILENT)
+    try:
+        asyncio.run(serve(session, args.unix, address))
+    except KeyboardInterrupt:
+        print("\nShutting down.")
+    except OSError as error:
+        print(error)
+        sys.exit(1)
+    finally:
+        session.close()
+
+if __name__ == "__main__":
+    main()
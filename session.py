@@ -0,0 +1,687 @@
+#!/usr/bin/python3
+"""
+    This module keeps one connection to the boards open for the whole
+    time the program runs. The gait, cycle time, and multiplier can be
+    changed while it plays, and take over at the next step or cycle,
+    so the actuators never have to deflate between gaits.
+"""
+
+# Global setting for how long a change of gait or settings fades in, in seconds. 0 switches at once
+CROSSFADE_TIME = 0.0
+# Global setting for leaving the outputs at their last values when playback stops.
+# They are always shut off when the session closes
+HOLD_ON_STOP = True
+
+# When a change takes over
+STEP_BOUNDARY = "step"
+CYCLE_BOUNDARY = "cycle"
+
+import signal
+import threading
+import numpy # install package by typing: pip install numpy
+from core import do_cycle, do_sparse_cycle, frame_events, compile_timeline, scale_frames, SPARSE_PLAYBACK
+from output import PWM_board
+from scheduler import Scheduler
+from compose import Gait
+from pipeline import OutputPipeline, THREADED_OUTPUT
+from resample import resample_frames, resampled_frame_count, RESAMPLE_RATE
+from watcher import GaitWatcher, HOT_RELOAD
+from metrics import Metrics, metrics_path, dump_on_signal, METRICS_FOLDER, SAVE_METRICS
+from recorder import Recorder, RECORD, RECORD_FOLDER
+from tracelog import TraceLog, LOG_LEVEL, LOG_LEVELS, SILENT, TRACE, TRACE_FOLDER
+from visualization import add_quotes
+from stream import follow_ring
+
+def prepare_playback(timeline, steps, cycle_time, multiplier):
+    """
+    Works out every frame of a gait ahead of time so each step is just a lookup.
+    Returns the timeline and steps, followed by the amplitudes to print, the frames
+    to send, and the list of events for sparse playback (None if it's off).
+        :param timeline: is the gait to follow, or a compose.Gait.
+        :param steps: is the number of steps in one cycle.
+        :param cycle_time: is how long each cycle takes.
+        :param multiplier: is what to multipy amplitudes by.
+    """
+    # a composed gait already remembers its compiled frames
+    amplitudes = timeline.frames() if isinstance(timeline, Gait) else compile_timeline(timeline, steps)
+    # ramp smoothly between steps at a higher frame rate
+    if RESAMPLE_RATE:
+        amplitudes = resample_frames(amplitudes, resampled_frame_count(cycle_time, steps, RESAMPLE_RATE))
+    frames = scale_frames(amplitudes, multiplier)
+    # for sparse playback, also work out which steps actually change anything
+    events = frame_events(frames) if SPARSE_PLAYBACK else None
+    return timeline, steps, amplitudes, frames, events
+
+def crossfade(last_amplitudes, last_frame, amplitudes, frames, start_step, fade_steps):
+    """
+    Returns copies of the amplitudes and frames where the steps from start_step on
+    blend from the last values that were output into the new ones.
+        :param last_amplitudes: is the row of amplitudes that was output last.
+        :param last_frame: is the frame that was output last.
+        :param amplitudes: is the matrix of amplitudes to fade into.
+        :param frames: is the matrix of frames to fade into.
+        :param start_step: is the first step of the fade.
+        :param fade_steps: is how many steps the fade takes. It's cut short at the end of the cycle.
+    """
+    fade_steps = min(fade_steps, len(frames) - start_step)
+    # how much of the new value each step of the fade gets, never quite 0 or 1
+    weight = (numpy.arange(1, fade_steps + 1) / (fade_steps + 1.0))[:, numpy.newaxis]
+    rows = slice(start_step, start_step + fade_steps)
+
+    faded_amplitudes = amplitudes.astype(float)
+    faded_amplitudes[rows] = last_amplitudes + (amplitudes[rows] - last_amplitudes) * weight
+    faded_frames = frames.astype(float)
+    faded_frames[rows] = last_frame + (frames[rows] - last_frame) * weight
+    return faded_amplitudes, faded_frames
+
+class PlaybackSession:
+    """
+    Owns the board connection and plays one gait at a time on it. Playback
+    can run in the calling thread with play(), or in the background with
+    start(). Everything else is safe to call from any thread while it plays.
+    """
+
+    def __init__(self, board=None, crossfade_time=None, hold_on_stop=None, log_level=None, record=None,
+                 save_metrics=None):
+        """
+        Makes a session. The boards are connected the first time they're needed.
+            :param board: is an optional PWM_board to use. Defaults to a new one.
+            :param crossfade_time: is how long changes fade in. Defaults to CROSSFADE_TIME.
+            :param hold_on_stop: is whether stopping leaves the outputs where they are.
+                Defaults to HOLD_ON_STOP.
+            :param log_level: is how much playback logs, one of tracelog.LOG_LEVELS.
+                Defaults to LOG_LEVEL.
+            :param record: is whether to record every frame written and save it in
+                RECORD_FOLDER when playback stops. Defaults to RECORD.
+            :param save_metrics: is whether to save the metrics of every run in
+                METRICS_FOLDER. Defaults to SAVE_METRICS.
+        """
+        self.board = PWM_board() if board is None else board
+        self.connected = False
+        self.crossfade_time = CROSSFADE_TIME if crossfade_time is None else crossfade_time
+        self.hold_on_stop = HOLD_ON_STOP if hold_on_stop is None else hold_on_stop
+        self.log_level = LOG_LEVEL if log_level is None else log_level
+        self.record = RECORD if record is None else record
+        self.save_metrics = SAVE_METRICS if save_metrics is None else save_metrics
+        if self.log_level not in LOG_LEVELS:
+            raise ValueError("unknown log level: {}".format(self.log_level))
+
+        # what's playing, or will play when play() is next called
+        self.filename = None
+        self.cycle_time = None
+        self.multiplier = None
+        self.prepared = None
+
+        # a change waiting to take over, as (prepared playback, boundary).
+        # Reentrant, so play() can call prepare() while holding it
+        self.lock = threading.RLock()
+        self.pending = None
+        # ends the current cycle early, to stop or to make a change at the next step
+        self.interrupt = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = None
+        self.playing = False
+
+        # the last row that was output, for fading from. Zeros when the boards are cleared
+        self.last_amplitudes = None
+        self.last_frame = None
+        self.metrics = None
+        # whether the stop in progress holds the outputs, or None for hold_on_stop
+        self.stop_hold = None
+        # the step of the cycle the last run stopped at, to resume from
+        self.position = 0
+        # functions taking (event, details) that are told when playback starts,
+        # starts each cycle, and stops, and when a stream goes stale. See notify()
+        self.listeners = []
+        # a stream.FrameRing to play from instead of the gait, or None. See use_stream()
+        self.source = None
+
+    def connect(self):
+        """
+        Connects to the boards if they aren't already. Returns False if it fails.
+        """
+        if self.connected:
+            return True
+        self.say("Attempting to connect...")
+        self.connected = self.board.connect()
+        self.say("Connected!" if self.connected else "Error connecting!")
+        return self.connected
+
+    def notify(self, event, **details):
+        """
+        Tells every listener about something that happened. Listeners are called from
+        the playback thread, so they have to return quickly and not block.
+            :param event: is "started", "cycle", "stopped", or for a stream, "stale" or "fresh".
+            :param details: are the facts about it, passed to listeners as a dictionary.
+        """
+        for listener in list(self.listeners):
+            listener(event, details)
+
+    def say(self, *message, **options):
+        """
+        Prints a message about playback, unless the log level is silent.
+            :param message: is what to print, the same as print() takes.
+            :param options: are passed on to print().
+        """
+        if self.log_level != SILENT:
+            print(*message, **options)
+
+    def close(self):
+        """
+        Stops playback, shuts off every output, and closes the connection.
+        """
+        self.stop()
+        if self.connected:
+            self.board.disconnect()
+            self.connected = False
+        self.last_amplitudes = None
+        self.last_frame = None
+
+    def __enter__(self):
+        """
+        Returns the session, so it can be used in a with statement that closes it.
+        """
+        return self
+
+    def __exit__(self, *error):
+        """
+        Closes the session at the end of a with statement.
+        """
+        self.close()
+
+    def load(self, timeline, steps, filename=None, boundary=CYCLE_BOUNDARY):
+        """
+        Sets the gait to play. If one is already playing, the new one takes over
+        at the next boundary.
+            :param timeline: is the gait to follow, or a compose.Gait.
+            :param steps: is the number of steps in one cycle.
+            :param filename: is the file the gait came from, for display, reloading
+                and naming the metrics files.
+            :param boundary: is STEP_BOUNDARY or CYCLE_BOUNDARY.
+        """
+        with self.lock:
+            self.filename = filename
+            self.change(self.playback_for(timeline, steps), boundary)
+
+    def set_multiplier(self, multiplier, boundary=CYCLE_BOUNDARY):
+        """
+        Changes what amplitudes are multiplied by, at the next boundary.
+            :param multiplier: is the new multiplier.
+            :param boundary: is STEP_BOUNDARY or CYCLE_BOUNDARY.
+        """
+        with self.lock:
+            self.multiplier = multiplier
+            self.refresh(boundary)
+
+    def set_cycle_time(self, cycle_time, boundary=CYCLE_BOUNDARY):
+        """
+        Changes how long each cycle takes, at the next boundary. Raises ValueError
+        if it isn't more than 0.
+            :param cycle_time: is the new cycle time, in seconds.
+            :param boundary: is STEP_BOUNDARY or CYCLE_BOUNDARY.
+        """
+        if not cycle_time > 0:
+            raise ValueError("the cycle time has to be more than 0")
+        with self.lock:
+            self.cycle_time = cycle_time
+            self.refresh(boundary)
+
+    def refresh(self, boundary):
+        """
+        Works out the frames of the newest gait again with the current settings.
+        Must be called with the lock held.
+            :param boundary: is STEP_BOUNDARY or CYCLE_BOUNDARY.
+        """
+        # a change that hasn't taken over yet is newer than what's playing
+        latest = self.pending[0] if self.pending else self.prepared
+        if latest is not None and self.cycle_time and self.multiplier is not None:
+            timeline, steps = latest[:2]
+            self.change(self.playback_for(timeline, steps), boundary)
+
+    def playback_for(self, timeline, steps):
+        """
+        Returns what change() takes for a gait. While playing, that's the frames
+        worked out with the current settings. While stopped, the frames are left
+        as None for prepare() to work out when they're needed, so loading a gait
+        and changing each setting before playing only works them out once.
+        Must be called with the lock held.
+            :param timeline: is the gait to follow.
+            :param steps: is the number of steps in one cycle.
+        """
+        if not self.playing:
+            return timeline, steps, None, None, None
+        return prepare_playback(timeline, steps, self.cycle_time or 1.0, self.multiplier or 0.0)
+
+    def prepare(self):
+        """
+        Works out the frames of the loaded gait with the current settings, unless
+        they already have been. Returns what prepare_playback() returned, or None
+        if the gait, cycle time or multiplier hasn't been set yet.
+        """
+        with self.lock:
+            if self.prepared is None or not self.cycle_time or self.multiplier is None:
+                return None
+            if self.prepared[2] is None:
+                timeline, steps = self.prepared[:2]
+                self.prepared = prepare_playback(timeline, steps, self.cycle_time, self.multiplier)
+            return self.prepared
+
+    def change(self, prepared, boundary):
+        """
+        Queues prepared playback to take over. Must be called with the lock held.
+            :param prepared: is what playback_for() or prepare_playback() returned.
+            :param boundary: is STEP_BOUNDARY or CYCLE_BOUNDARY.
+        """
+        if boundary not in (STEP_BOUNDARY, CYCLE_BOUNDARY):
+            raise ValueError("unknown boundary: {}".format(boundary))
+        if not self.playing:
+            self.prepared = prepared
+            return
+        # a step boundary beats a cycle boundary if both are waiting
+        if self.pending and self.pending[1] == STEP_BOUNDARY:
+            boundary = STEP_BOUNDARY
+        self.pending = (prepared, boundary)
+        if boundary == STEP_BOUNDARY:
+            self.interrupt.set()
+
+    def take_change(self, at_cycle_start):
+        """
+        Returns the waiting change if it should take over now, or None.
+            :param at_cycle_start: is whether playback is at the start of a cycle.
+        """
+        with self.lock:
+            if self.pending is None or not (at_cycle_start or self.pending[1] == STEP_BOUNDARY):
+                return None
+            prepared, self.pending = self.pending[0], None
+            self.prepared = prepared
+            return prepared
+
+    def use_stream(self, ring):
+        """
+        Plays frames written by another process instead of the gait, from the next
+        time play() is called. The cycle time and multiplier don't apply to them.
+            :param ring: is the stream.FrameRing to read, or None to go back to the gait.
+        """
+        with self.lock:
+            if self.playing:
+                raise RuntimeError("stop playback before changing what it plays from")
+            self.source = ring
+
+    def start(self, cycles=None, duration=None, start_step=0):
+        """
+        Plays in a background thread. Returns once it has started.
+            :param cycles: is an optional number of cycles to play before stopping.
+            :param duration: is an optional number of seconds to play before stopping.
+            :param start_step: is the step of the cycle to start from. Use position to
+                carry on where the last run stopped.
+        """
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.play, args=(cycles, duration, start_step), daemon=True)
+        self.thread.start()
+
+    def stop(self, hold=None):
+        """
+        Asks playback to stop and waits for it when it's running in the background.
+        Does nothing if nothing is playing, so it can't stop the next run before it starts.
+            :param hold: is whether to leave the outputs where they are. Defaults to hold_on_stop.
+        """
+        # a thread from start() that hasn't set playing yet still counts
+        starting = self.thread is not None and self.thread.is_alive()
+        if not self.playing and not starting:
+            return
+        self.stop_hold = hold
+        self.stopping.set()
+        self.interrupt.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+            self.thread = None
+
+    def time_up(self):
+        """
+        Ends a run that was given a duration. Called from a timer thread.
+        """
+        self.stopping.set()
+        self.interrupt.set()
+
+    def play(self, cycles=None, duration=None, start_step=0):
+        """
+        Plays the loaded gait until stop() is called, Ctrl-C is pressed, the given
+        number of cycles is done, or the given time is up, whichever comes first.
+        Returns the Metrics of the run, or None if nothing could be played. If
+        playback fails, the outputs are shut off and the error is raised again.
+            :param cycles: is an optional number of cycles to play before stopping.
+                A cycle started part way through counts as one.
+            :param duration: is an optional number of seconds to play before stopping.
+                Playback stops before the next step once the time is up, even mid-cycle.
+            :param start_step: is the step of the cycle to start from. Use position to
+                carry on where the last run stopped.
+        With a stream to play from (see use_stream()), cycles and start_step are ignored.
+        """
+        if self.source is not None:
+            return self.play_stream(duration)
+        with self.lock:
+            if self.prepare() is None:
+                self.say("Nothing to play. Load a gait and set the cycle time and multiplier first.")
+                return None
+            self.pending = None
+            self.playing = True
+        if not self.connect():
+            self.playing = False
+            return None
+
+        board = self.board
+        filename = self.filename
+        _, _, amplitudes, frames, events = self.prepared
+        # the first frame of the run fades in from whatever the boards are holding
+        fade_from = self.last_amplitudes is not None
+        held_before = self.last_amplitudes, self.last_frame
+
+        # keep track of how well the run keeps to its schedule.
+        # sending SIGUSR1 saves what has been measured so far
+        metrics = Metrics()
+        board.metrics = metrics
+        self.metrics = metrics
+        previous_handler = None
+        json_path = metrics_path(filename, ".json") if self.save_metrics and METRICS_FOLDER else None
+        # everything below is cleaned up at the end, however the run ends
+        recorder, pipeline, trace, watcher, timer = None, None, None, None, None
+        error = None
+        finished = False
+        cycle = 0
+        step = first_step = min(start_step, len(frames) - 1)
+        try:
+            if json_path and threading.current_thread() is threading.main_thread():
+                # signal handlers can only be set from the main thread
+                previous_handler = dump_on_signal(metrics, json_path)
+
+            # deadlines carry on from one cycle to the next, so timing errors don't add up
+            scheduler = Scheduler(self.cycle_time / len(frames), metrics=metrics)
+            scheduler.start()
+
+            # write to the boards from background threads so the frames can be worked out ahead
+            # keep every frame written, with its timing, to save when the run stops
+            recorder = Recorder(max(frames.shape[1], len(board.channel_pins))) if self.record else None
+            if recorder:
+                recorder.details = {"filename": filename, "cycle_time": self.cycle_time,
+                                    "multiplier": self.multiplier}
+
+            pipeline = OutputPipeline(board, scheduler, metrics=metrics, recorder=recorder) if THREADED_OUTPUT else None
+            if pipeline:
+                pipeline.start()
+
+            # every step goes to a ring buffer that's written to a file in the background
+            if self.log_level == TRACE:
+                trace = TraceLog(metrics_path(filename, ".log", TRACE_FOLDER))
+                trace.start()
+
+            # parse and compile the file in the background whenever it's saved,
+            # with whatever settings are current at the time
+            if HOT_RELOAD and filename:
+                watcher = GaitWatcher(filename, lambda new_timeline, new_steps: prepare_playback(
+                    new_timeline, new_steps, self.cycle_time, self.multiplier))
+                watcher.start()
+
+            # a fixed-length run stops itself the same way stop() does
+            if duration is not None:
+                timer = threading.Timer(duration, self.time_up)
+                timer.daemon = True
+                timer.start()
+
+            self.notify("started", filename=filename, cycle_time=self.cycle_time, multiplier=self.multiplier)
+            first_cycle = True
+            # the steps played this cycle, when they differ from the frames (during a fade)
+            cycle_amplitudes, cycle_frames = None, None
+            while True:
+                # cleared before checking for a stop or a change, so one that comes in
+                # after the checks still ends the cycle below early, instead of being lost
+                self.interrupt.clear()
+                if self.stopping.is_set():
+                    break
+
+                # swap in a reloaded file between cycles
+                reloaded = watcher.take() if watcher and step == 0 else None
+                if reloaded:
+                    with self.lock:
+                        self.change(reloaded, CYCLE_BOUNDARY)
+                    self.say("\nReloaded", add_quotes(filename))
+
+                # swap in a change if it's due
+                changed = self.take_change(step == 0)
+                if changed or fade_from:
+                    if changed:
+                        _, _, amplitudes, frames, events = changed
+                        # each step keeps its share of the cycle
+                        scheduler.retime(self.cycle_time / len(frames))
+                        step = min(step, len(frames) - 1)
+                        first_cycle = True
+                    fade_steps = int(round(self.crossfade_time / scheduler.step_time))
+                    if fade_steps > 0 and self.last_frame is not None \
+                            and len(self.last_frame) == frames.shape[1]:
+                        cycle_amplitudes, cycle_frames = crossfade(
+                            self.last_amplitudes, self.last_frame, amplitudes, frames, step, fade_steps)
+                    else:
+                        cycle_amplitudes, cycle_frames = None, None
+                    fade_from = False
+
+                if step == 0 and self.listeners:
+                    # with threaded output, cycles are worked out a little ahead of when they're due
+                    self.notify("cycle", cycle=cycle + 1, time=scheduler.elapsed(),
+                                due=scheduler.deadline(scheduler.tick) - scheduler.started,
+                                overruns=scheduler.overruns)
+                if step == 0:
+                    self.say("Cycle #{} at time {:.3f}s, {} steps late so far".format(
+                        cycle + 1, scheduler.elapsed(), scheduler.overruns))
+                playing_amplitudes = amplitudes if cycle_amplitudes is None else cycle_amplitudes
+                playing_frames = frames if cycle_frames is None else cycle_frames
+
+                # sparse playback only covers whole unfaded cycles. Anything else,
+                # like the rest of a cycle after a change, is played step by step
+                if events is not None and step == 0 and cycle_frames is None:
+                    stopped_at = do_sparse_cycle(board, playing_amplitudes, playing_frames, events,
+                                                 scheduler, pipeline, metrics, first_cycle=first_cycle,
+                                                 interrupt=self.interrupt, trace=trace, recorder=recorder)
+                else:
+                    stopped_at = do_cycle(board, playing_amplitudes, playing_frames, scheduler,
+                                          pipeline, metrics, start_step=step, interrupt=self.interrupt,
+                                          trace=trace, recorder=recorder)
+                if stopped_at > step:
+                    self.last_amplitudes = playing_amplitudes[stopped_at - 1]
+                    self.last_frame = playing_frames[stopped_at - 1]
+                    first_cycle = False
+
+                if stopped_at < len(frames):
+                    # interrupted to stop, or to make a change at this step
+                    step = stopped_at
+                    continue
+                step = 0
+                cycle_amplitudes, cycle_frames = None, None
+                cycle += 1
+                if cycles is not None and cycle >= cycles:
+                    finished = True
+                    break
+            # a run that ends by itself lets the frames still queued play out
+            if finished and pipeline:
+                pipeline.drain(self.stopping)
+        except KeyboardInterrupt:
+            pass
+        except Exception as caught:
+            # an I2C error from the writers, or anything else. Clean up, then raise it again
+            error = caught
+            raise
+        finally:
+            self.say("\nStopping playback...", end='')
+            if timer:
+                # wait in case it's going off right now, so it can't stop the next run
+                timer.cancel()
+                timer.join()
+            if watcher:
+                watcher.stop()
+            # make sure the writers are done before touching the boards
+            if pipeline:
+                pipeline.stop()
+                # frames queued ahead were thrown away, so go by what was really written
+                written = pipeline.last_written()
+                if written is None:
+                    step = first_step
+                    self.last_amplitudes, self.last_frame = held_before
+                else:
+                    _, written_step, self.last_amplitudes, self.last_frame = written
+                    step = written_step + 1
+            if trace:
+                trace.stop()
+            # a failed run always shuts the outputs off, since they may be stuck anywhere
+            hold = error is None and (self.hold_on_stop if self.stop_hold is None else self.stop_hold)
+            self.stop_hold = None
+            # a run that finished, or stopped between cycles, carries on from the start next time
+            self.position = 0 if finished or step >= len(frames) else step
+            if not hold:
+                self.shut_off()
+            with self.lock:
+                self.playing = False
+                # anything still waiting plays next time
+                if self.pending:
+                    self.prepared = self.pending[0]
+                    self.pending = None
+            self.stopping.clear()
+            self.interrupt.clear()
+            self.say("done.\n")
+            if error is not None:
+                self.say("Playback failed:", error)
+            if metrics.overruns:
+                self.say("{} steps fell behind schedule.\n".format(metrics.overruns))
+
+            self.save_run(filename, metrics, recorder, trace, json_path)
+            if previous_handler is not None:
+                signal.signal(signal.SIGUSR1, previous_handler)
+            board.metrics = None
+            self.notify("stopped", cycles=cycle, finished=finished, position=self.position,
+                        overruns=metrics.overruns, held=bool(hold),
+                        error=None if error is None else str(error))
+        return metrics
+
+    def play_stream(self, duration=None):
+        """
+        Sends each new frame from the stream to the boards until stop() is called,
+        Ctrl-C is pressed, or the given time is up. Returns the Metrics of the run,
+        where lateness is how long after a frame was written it started being
+        sent, and overruns are frames that were too stale to send. If playback
+        fails, the outputs are shut off and the error is raised again.
+            :param duration: is an optional number of seconds to play before stopping.
+        """
+        with self.lock:
+            ring = self.source
+            self.playing = True
+        if not self.connect():
+            self.playing = False
+            return None
+
+        board = self.board
+        name = "stream-" + ring.name
+        metrics = Metrics()
+        board.metrics = metrics
+        self.metrics = metrics
+        recorder, trace, timer = None, None, None
+        error = None
+        counts = {}
+
+        def on_stale(stale):
+            # only said when it changes, so it's never printed on every frame
+            self.say("\nThe stream has gone stale." if stale else "\nThe stream is fresh again.")
+            self.notify("stale" if stale else "fresh")
+
+        try:
+            recorder = Recorder(max(ring.channels, len(board.channel_pins))) if self.record else None
+            if recorder:
+                recorder.details = {"stream": ring.name}
+            if self.log_level == TRACE:
+                trace = TraceLog(metrics_path(name, ".log", TRACE_FOLDER))
+                trace.start()
+            if duration is not None:
+                timer = threading.Timer(duration, self.time_up)
+                timer.daemon = True
+                timer.start()
+
+            self.notify("started", filename=name, cycle_time=None, multiplier=None)
+            counts = follow_ring(board, ring, self.stopping, metrics, recorder, trace, on_stale=on_stale)
+        except KeyboardInterrupt:
+            pass
+        except Exception as caught:
+            error = caught
+            raise
+        finally:
+            self.say("\nStopping playback...", end='')
+            if timer:
+                timer.cancel()
+                timer.join()
+            if trace:
+                trace.stop()
+            hold = error is None and (self.hold_on_stop if self.stop_hold is None else self.stop_hold)
+            self.stop_hold = None
+            metrics.overruns = counts.get("stale", 0)
+            if not hold:
+                self.shut_off()
+            # the stream's frames don't match any gait, so the next gait starts without a fade
+            self.last_amplitudes = None
+            self.last_frame = None
+            with self.lock:
+                self.playing = False
+            self.stopping.clear()
+            self.interrupt.clear()
+            self.say("done.\n")
+            if error is not None:
+                self.say("Playback failed:", error)
+            if counts:
+                self.say("{sent} frames sent, {skipped} skipped for newer ones, {stale} too stale, "
+                         "{torn} overwritten while read, {bad} with NaN or infinite values, "
+                         "{clipped} clipped to 0 to 1.\n".format(**counts))
+
+            self.save_run(name, metrics, recorder, trace)
+            board.metrics = None
+            self.notify("stopped", cycles=0, finished=False, position=self.position,
+                        overruns=metrics.overruns, held=bool(hold),
+                        error=None if error is None else str(error), **counts)
+        return metrics
+
+    def shut_off(self):
+        """
+        Shuts off every output at the end of a run, and remembers they're at zero
+        so the next run fades in from there. Failing to reach the boards is only
+        reported, since it happens while cleaning up after errors.
+        """
+        try:
+            self.board.clear()
+        except OSError as error:
+            self.say("Couldn't shut off the outputs:", error)
+            return
+        self.last_amplitudes = numpy.zeros_like(self.last_amplitudes, dtype=float) \
+            if self.last_amplitudes is not None else None
+        self.last_frame = numpy.zeros_like(self.last_frame, dtype=float) \
+            if self.last_frame is not None else None
+
+    def save_run(self, name, metrics, recorder=None, trace=None, json_path=None):
+        """
+        Prints the timing of a run that just ended and saves its metrics and recording.
+            :param name: is the gait file or stream it played, for naming the files.
+            :param metrics: is the Metrics of the run.
+            :param recorder: is the run's Recorder, if it recorded one.
+            :param trace: is the run's stopped TraceLog, if it traced one.
+            :param json_path: is where to save the metrics as JSON. Defaults to a new
+                file in METRICS_FOLDER. Nothing is saved if save_metrics is off.
+        """
+        self.say(metrics.summary())
+        if self.save_metrics and METRICS_FOLDER:
+            json_path = json_path or metrics_path(name, ".json")
+            metrics.dump_json(json_path)
+            metrics.dump_csv(metrics_path(name, ".csv"))
+            self.say("Saved timing metrics to", add_quotes(json_path))
+        if recorder:
+            record_path = metrics_path(name, ".rec", RECORD_FOLDER)
+            recorder.save(record_path)
+            self.say("Saved recording of {} frames to {}".format(recorder.count, add_quotes(record_path)))
+        if trace:
+            self.say("Saved trace to", add_quotes(trace.path))
+            if trace.dropped():
+                self.say("{} steps were dropped from the trace. Raise TRACE_CAPACITY to keep them.".format(
+                    trace.dropped()))
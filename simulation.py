@@ -0,0 +1,262 @@
+#!/usr/bin/python3
+"""
+    This module simulates Adafruit PCA9685 boards on an I2C bus, so
+    playback can be run, tested, and timed without a Raspberry Pi.
+    The simulated boards have the same methods output.py uses on
+    real ones, and keep their registers like the real chip does.
+"""
+
+# Global setting for simulated time per I2C transaction (start, address, and stop)
+TRANSACTION_LATENCY = 0.00005
+# Global setting for simulated time per byte sent or read (9 bits at 100kHz)
+BYTE_LATENCY = 0.00009
+# Global setting for the chance that a transaction fails, from 0 to 1
+ERROR_RATE = 0.0
+# Global setting for whether transactions really take their simulated time.
+# When off, the time is only added up in SimulatedBus.busy_time
+REALTIME = True
+# Global setting for which addresses answer on each simulated bus when probing for boards
+SIMULATED_ADDRESSES = {1: [0x40, 0x41]}
+# Global setting for addresses on each simulated bus where a chip that isn't a PCA9685
+# answers, like {1: [0x48, 0x68]} for an ADC and an IMU. Probing should skip them
+SIMULATED_OTHER_ADDRESSES = {}
+
+import errno
+import random
+import threading
+
+from output import MODE1, MODE1_AUTO_INCREMENT, MODE2, ALLCALLADR, LED0_ON_L, PRE_SCALE
+from scheduler import clock, sleep_until
+
+# The rest of the PCA9685 registers the Adafruit library touches
+ALL_LED_ON_L = 0xFA
+MODE1_SLEEP = 0x10
+MODE1_ALLCALL = 0x01
+MODE1_RESTART = 0x80
+MODE2_OUTDRV = 0x04
+OSCILLATOR_FREQUENCY = 25000000.0
+
+class SimulatedBus:
+    """
+    Models the timing of one I2C bus. Only one transaction happens at a time.
+    """
+
+    def __init__(self, busnum=1, transaction_latency=None, byte_latency=None,
+                 error_rate=None, realtime=None, seed=None):
+        """
+        Makes a bus. Settings that aren't given come from the globals above.
+            :param busnum: is the bus number, only used for display.
+            :param transaction_latency: is the time each transaction takes, in seconds.
+            :param byte_latency: is the extra time for each byte, in seconds.
+            :param error_rate: is the chance that a transaction fails, from 0 to 1.
+            :param realtime: is whether transactions block for their simulated time.
+            :param seed: is the random seed for injected errors.
+        """
+        self.busnum = busnum
+        self.transaction_latency = TRANSACTION_LATENCY if transaction_latency is None else transaction_latency
+        self.byte_latency = BYTE_LATENCY if byte_latency is None else byte_latency
+        self.error_rate = ERROR_RATE if error_rate is None else error_rate
+        self.realtime = REALTIME if realtime is None else realtime
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Zeroes the transaction, byte, error, and time counters.
+        """
+        self.transactions = 0
+        self.bytes = 0
+        self.errors = 0
+        self.busy_time = 0.0
+
+    def transfer(self, byte_count):
+        """
+        Takes up the bus for one transaction. Raises OSError if an error is injected,
+        in which case the transaction should be treated as never having happened.
+            :param byte_count: is the number of bytes sent or read after the address.
+        """
+        duration = self.transaction_latency + byte_count * self.byte_latency
+        with self.lock:
+            self.transactions += 1
+            self.bytes += byte_count
+            self.busy_time += duration
+            if self.realtime:
+                sleep_until(clock() + duration)
+            if self.error_rate and self.random.random() < self.error_rate:
+                self.errors += 1
+                raise OSError(errno.EIO, "simulated I2C error on bus {}".format(self.busnum))
+
+# one shared bus per bus number, like the real hardware
+buses = {}
+
+def get_bus(busnum=1):
+    """
+    Returns the simulated bus with the given number, making it if needed.
+        :param busnum: is the I2C bus number.
+    """
+    if busnum not in buses:
+        buses[busnum] = SimulatedBus(busnum)
+    return buses[busnum]
+
+def probe_device(busnum, address):
+    """
+    Returns the simulated device at an address, for probing: a PCA9685 as it is
+    at power-on for SIMULATED_ADDRESSES, a chip whose registers all read 0 for
+    SIMULATED_OTHER_ADDRESSES, and otherwise one that nothing answers for, so
+    every read fails. Reads take up the bus either way.
+        :param busnum: is the I2C bus number.
+        :param address: is the address to try.
+    """
+    bus = get_bus(busnum)
+    if address in SIMULATED_ADDRESSES.get(busnum, []):
+        return SimulatedI2CDevice(address, bus)
+    device = SimulatedI2CDevice(address, bus, present=address in SIMULATED_OTHER_ADDRESSES.get(busnum, []))
+    device.registers = bytearray(256)
+    return device
+
+# Registers that don't power on as 0, from the PCA9685 datasheet
+RESET_REGISTERS = {MODE1: 0x11, MODE2: 0x04, 0x02: 0xE2, 0x03: 0xE4, 0x04: 0xE8, ALLCALLADR: 0xE0,
+                   PRE_SCALE: 0x1E}
+
+class SimulatedI2CDevice:
+    """
+    Stands in for the Adafruit_GPIO I2C device a PCA9685 object writes through.
+    Holds the chip's 256 registers.
+    """
+
+    def __init__(self, address, bus, present=True):
+        """
+        Makes a device with its registers as a PCA9685's are at power-on.
+            :param address: is the device's I2C address.
+            :param bus: is the SimulatedBus it's on.
+            :param present: is whether anything answers at the address. If not,
+                every read and write fails, like on a real bus.
+        """
+        self.address = address
+        self.bus = bus
+        self.present = present
+        self.registers = bytearray(256)
+        for register, value in RESET_REGISTERS.items():
+            self.registers[register] = value
+        # every channel starts fully off
+        for channel in range(0, 16):
+            self.registers[LED0_ON_L + 4 * channel + 3] = 0x10
+
+    def transfer(self, byte_count):
+        """
+        Takes up the bus for one transaction with this device. Raises OSError
+        if nothing answers at its address.
+            :param byte_count: is the number of bytes sent or read after the address.
+        """
+        self.bus.transfer(byte_count)
+        if not self.present:
+            raise OSError(errno.EREMOTEIO, "no device at address {:#04x} on bus {}".format(
+                self.address, self.bus.busnum))
+
+    def store(self, register, value):
+        """
+        Sets a register the way the chip would, without using the bus.
+            :param register: is the register number.
+            :param value: is the byte to store.
+        """
+        self.registers[register] = value & 0xFF
+        # the ALL_LED registers set the same register of every channel
+        if ALL_LED_ON_L <= register < ALL_LED_ON_L + 4:
+            offset = register - ALL_LED_ON_L
+            for channel in range(0, 16):
+                self.registers[LED0_ON_L + 4 * channel + offset] = value & 0xFF
+
+    def write8(self, register, value):
+        """
+        Writes one register.
+        """
+        self.transfer(2)
+        self.store(register, value)
+
+    def readU8(self, register):
+        """
+        Reads one register.
+        """
+        self.transfer(2)
+        return self.registers[register]
+
+    def writeList(self, register, data):
+        """
+        Writes several bytes starting at a register. Like the real chip, the bytes
+        only go to consecutive registers when auto-increment is turned on in MODE1.
+        """
+        self.transfer(1 + len(data))
+        auto_increment = self.registers[MODE1] & MODE1_AUTO_INCREMENT
+        for num, value in enumerate(data):
+            self.store(register + num if auto_increment else register, value)
+
+    def readList(self, register, length):
+        """
+        Reads several bytes starting at a register.
+        """
+        self.transfer(1 + length)
+        if self.registers[MODE1] & MODE1_AUTO_INCREMENT:
+            return bytearray(self.registers[register:register + length])
+        return bytearray([self.registers[register]] * length)
+
+class SimulatedPCA9685:
+    """
+    Stands in for Adafruit_PCA9685.PCA9685, with the same methods.
+    """
+
+    def __init__(self, address=0x40, busnum=1, bus=None):
+        """
+        Sets up the simulated board the same way the Adafruit library sets up a real one.
+            :param address: is the board's I2C address.
+            :param busnum: is the number of the shared simulated bus to use.
+            :param bus: is an optional SimulatedBus to use instead.
+        """
+        self._device = SimulatedI2CDevice(address, bus if bus is not None else get_bus(busnum))
+        self.set_all_pwm(0, 0)
+        self._device.write8(MODE2, MODE2_OUTDRV)
+        self._device.write8(MODE1, MODE1_ALLCALL)
+        mode1 = self._device.readU8(MODE1)
+        self._device.write8(MODE1, mode1 & ~MODE1_SLEEP)
+
+    def set_pwm_freq(self, freq_hz):
+        """
+        Sets the PWM frequency, in Hz.
+        """
+        prescale = int(OSCILLATOR_FREQUENCY / 4096.0 / float(freq_hz) - 1.0 + 0.5)
+        oldmode = self._device.readU8(MODE1)
+        self._device.write8(MODE1, (oldmode & 0x7F) | MODE1_SLEEP)
+        self._device.write8(PRE_SCALE, prescale)
+        self._device.write8(MODE1, oldmode)
+        self._device.write8(MODE1, oldmode | MODE1_RESTART)
+
+    def set_pwm(self, channel, on, off):
+        """
+        Sets when one channel turns on and off, out of 4096 ticks.
+        """
+        register = LED0_ON_L + 4 * channel
+        self._device.write8(register, on & 0xFF)
+        self._device.write8(register + 1, on >> 8)
+        self._device.write8(register + 2, off & 0xFF)
+        self._device.write8(register + 3, off >> 8)
+
+    def set_all_pwm(self, on, off):
+        """
+        Sets when every channel turns on and off, out of 4096 ticks.
+        """
+        self._device.write8(ALL_LED_ON_L, on & 0xFF)
+        self._device.write8(ALL_LED_ON_L + 1, on >> 8)
+        self._device.write8(ALL_LED_ON_L + 2, off & 0xFF)
+        self._device.write8(ALL_LED_ON_L + 3, off >> 8)
+
+    def get_pwm(self, channel):
+        """
+        Returns the (on, off) values a channel's registers hold. Not part of
+        the Adafruit library; it's here so tests can check what was written.
+            :param channel: is the channel to read, from 0 to 15.
+        """
+        registers = self._device.registers
+        register = LED0_ON_L + 4 * channel
+        on = registers[register] | registers[register + 1] << 8
+        off = registers[register + 2] | registers[register + 3] << 8
+        return on, off
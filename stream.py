@@ -0,0 +1,288 @@
+#!/usr/bin/python3
+"""
+    This module lets another process on the same machine drive the
+    valves directly, for closed-loop control. The controller writes
+    frames into a ring buffer in shared memory, and playback sends the
+    newest one to the boards as soon as it appears, without parsing it
+    or allocating anything.
+
+    Each frame has one value for each channel, from 0 to 1, the same as
+    the frames playback sends for a gait (the multiplier isn't applied).
+    Values outside that are clipped to it, and frames with NaN or infinite
+    values are skipped, since the registers can't hold anything else.
+    Frames are numbered in the order they're written, and stamped with
+    when they were written, so playback can tell when the controller
+    has fallen behind or stopped.
+
+        # in the controller
+        from stream import FrameRing
+        ring = FrameRing("pneunet", channels=32, create=True)
+        while running:
+            ring.write(compute_valves(read_sensors()))
+
+        # in playback
+        session.use_stream(FrameRing("pneunet"))
+        session.play()
+"""
+
+# Global setting for how long playback waits between checks for a new frame (seconds)
+STREAM_POLL = 0.0005
+# Global setting for how old a frame can be before it's too stale to send (seconds)
+STREAM_STALE_TIME = 0.05
+# Global setting for what to do when the controller stops sending fresh frames:
+# "hold" leaves the outputs where they are, "zero" shuts them off
+STALE_POLICY = "hold"
+# Global setting for how many frames the ring holds
+STREAM_CAPACITY = 64
+
+# Stale policies
+STALE_HOLD = "hold"
+STALE_ZERO = "zero"
+
+# Marks the start of a ring buffer
+STREAM_MAGIC = b"PNFR"
+# Bump this whenever the layout of the ring buffer changes
+STREAM_VERSION = 1
+
+import os
+import numpy # install package by typing: pip install numpy
+from multiprocessing import shared_memory
+from scheduler import clock
+
+# at the start of the shared memory. sequence is the number of the newest whole frame, 0 for none yet
+HEADER_DTYPE = numpy.dtype([("magic", "S4"), ("version", "<u4"), ("channels", "<u4"),
+                            ("capacity", "<u4"), ("sequence", "<u8"), ("writer", "<u8")], align=True)
+
+def slot_dtype(channels):
+    """
+    Returns the numpy dtype of one frame in the ring.
+        :param channels: is the number of channels in each frame.
+    """
+    # aligned, so the sequence numbers are read and written in one go
+    return numpy.dtype([
+        ("sequence", "<u8"),    # the frame's number, or 0 while it's being written
+        ("stamp", "<f8"),       # the clock() value it was written at
+        ("frame", "<f4", (channels,)),
+    ], align=True)
+
+class FrameRing:
+    """
+    A ring buffer of frames in shared memory, written by one process and read
+    by another. The writer never waits for the reader: the reader always takes
+    the newest frame, and a slot being overwritten is caught by its sequence number.
+    """
+
+    def __init__(self, name, channels=None, capacity=None, create=False):
+        """
+        Opens a ring buffer, or makes a new one.
+            :param name: is the name of the shared memory, the same in both processes.
+            :param channels: is the number of channels in each frame. Only needed to create one.
+            :param capacity: is how many frames it holds. Defaults to STREAM_CAPACITY.
+            :param create: is whether to make a new one. Only one process should.
+                The one that makes it should close() it with unlink=True when done.
+        """
+        if create:
+            if not channels:
+                raise ValueError("a new ring buffer needs a number of channels")
+            capacity = STREAM_CAPACITY if capacity is None else capacity
+            size = HEADER_DTYPE.itemsize + capacity * slot_dtype(channels).itemsize
+            self.memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+        else:
+            self.memory = attach(name)
+
+        self.header = numpy.ndarray((), dtype=HEADER_DTYPE, buffer=self.memory.buf)
+        if create:
+            self.header["magic"] = STREAM_MAGIC
+            self.header["version"] = STREAM_VERSION
+            self.header["channels"] = channels
+            self.header["capacity"] = capacity
+            self.header["sequence"] = 0
+        elif self.header["magic"] != STREAM_MAGIC or self.header["version"] != STREAM_VERSION:
+            self.close()
+            raise ValueError("{} isn't a version {} frame ring".format(name, STREAM_VERSION))
+
+        self.name = name
+        self.channels = int(self.header["channels"])
+        self.capacity = int(self.header["capacity"])
+        self.slots = numpy.ndarray((self.capacity,), dtype=slot_dtype(self.channels),
+                                   buffer=self.memory.buf, offset=HEADER_DTYPE.itemsize)
+        # the sequence number of the last frame this process wrote
+        self.written = int(self.header["sequence"])
+
+    def write(self, frame, stamp=None):
+        """
+        Writes a frame into the next slot and returns its sequence number.
+        Only one process (and thread) should write to a ring.
+            :param frame: is the list or array of values, one for each channel.
+            :param stamp: is the clock() value it's for. Defaults to now.
+        """
+        sequence = self.written + 1
+        slot = self.slots[sequence % self.capacity]
+        # a reader that catches the slot half-written sees 0 and skips it
+        slot["sequence"] = 0
+        slot["frame"] = frame
+        slot["stamp"] = clock() if stamp is None else stamp
+        slot["sequence"] = sequence
+        self.header["sequence"] = sequence
+        self.header["writer"] = os.getpid()
+        self.written = sequence
+        return sequence
+
+    def sequence(self):
+        """
+        Returns the sequence number of the newest whole frame, or 0 if there's none yet.
+        """
+        return int(self.header["sequence"])
+
+    def read(self, sequence):
+        """
+        Returns (stamp, frame) for a frame, or None if it has been overwritten or
+        is being written. The frame is a view into the shared memory, not a copy,
+        so check valid() after using it.
+            :param sequence: is the frame's sequence number.
+        """
+        slot = self.slots[sequence % self.capacity]
+        if slot["sequence"] != sequence:
+            return None
+        return float(slot["stamp"]), slot["frame"]
+
+    def valid(self, sequence):
+        """
+        Returns whether a frame is still in the ring, whole and unchanged.
+            :param sequence: is the frame's sequence number.
+        """
+        return self.slots[sequence % self.capacity]["sequence"] == sequence
+
+    def close(self, unlink=False):
+        """
+        Closes this process's view of the ring.
+            :param unlink: is whether to delete the shared memory too. Only
+                the process that made it should.
+        """
+        # the arrays hold on to the memory, so they have to go first
+        self.header = None
+        self.slots = None
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+def attach(name):
+    """
+    Returns an existing block of shared memory without taking ownership of it,
+    so it isn't deleted when this process exits.
+        :param name: is the name of the shared memory.
+    """
+    try:
+        # Python 3.13 and later can be told directly
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    memory = shared_memory.SharedMemory(name=name)
+    # earlier versions register it to be deleted on exit, so take that back
+    from multiprocessing import resource_tracker
+    resource_tracker.unregister(memory._name, "shared_memory")
+    return memory
+
+def follow_ring(device, ring, stopping, metrics=None, recorder=None, trace=None,
+                stale_time=None, policy=None, poll=None, on_stale=None):
+    """
+    Sends the newest frame in a ring buffer to a device each time a new one is
+    written, until stopped. Frames the controller wrote while an older one was
+    being sent are skipped, since only the newest matters. Each frame is copied
+    out of the ring into one reused buffer before it's checked, so the writer
+    can't change it between being checked and sent. Values are clipped to 0 to 1,
+    and frames with NaN or infinite values aren't sent. Returns a dictionary
+    counting the frames that were sent, skipped, too stale to send, overwritten
+    while they were being read, bad, or clipped, and how many times the stream
+    went stale.
+        :param device: is the connected PWM_board to send to.
+        :param ring: is the FrameRing to read.
+        :param stopping: is a threading.Event. Setting it ends the loop.
+        :param metrics: is an optional Metrics. Lateness is how long after a frame
+            was written it started being sent.
+        :param recorder: is an optional Recorder to record each frame sent in.
+        :param trace: is an optional started TraceLog to record each frame sent in.
+        :param stale_time: is how old a frame can be and still be sent. Defaults to STREAM_STALE_TIME.
+        :param policy: is STALE_HOLD or STALE_ZERO, for when frames stop coming.
+            Defaults to STALE_POLICY.
+        :param poll: is how long to wait between checks for a new frame. Defaults to STREAM_POLL.
+        :param on_stale: is an optional function called with True when the outputs
+            go stale, because no fresh, valid frame has been sent for stale_time,
+            and False when one is sent again.
+    """
+    stale_time = STREAM_STALE_TIME if stale_time is None else stale_time
+    policy = STALE_POLICY if policy is None else policy
+    poll = STREAM_POLL if poll is None else poll
+    if policy not in (STALE_HOLD, STALE_ZERO):
+        raise ValueError("unknown stale policy: {}".format(policy))
+
+    counts = {"sent": 0, "skipped": 0, "stale": 0, "torn": 0, "bad": 0, "clipped": 0, "stale_periods": 0}
+    # frames already in the ring are from before playback started, so only newer ones count
+    last_sequence = ring.sequence()
+    # when the frame the outputs hold was written
+    last_fresh = clock()
+    stale = False
+    # frames are copied here to be checked and sent, so nothing is allocated per frame
+    frame = numpy.zeros(ring.channels)
+
+    while not stopping.is_set():
+        # whether the controller has stopped, or is writing frames that are all too old
+        # or bad, the outputs go stale once nothing good has been sent for too long
+        if not stale and clock() - last_fresh > stale_time:
+            stale = True
+            counts["stale_periods"] += 1
+            if policy == STALE_ZERO:
+                device.clear()
+            if on_stale is not None:
+                on_stale(True)
+
+        sequence = ring.sequence()
+        if sequence == last_sequence:
+            stopping.wait(poll)
+            continue
+
+        counts["skipped"] += max(0, sequence - last_sequence - 1)
+        last_sequence = sequence
+        entry = ring.read(sequence)
+        if entry is None:
+            # the writer lapped the ring while we looked. There's a newer frame anyway
+            counts["torn"] += 1
+            continue
+        stamp, view = entry
+        frame[:] = view
+        if not ring.valid(sequence):
+            # overwritten while it was copied, so the copy may be half of each
+            counts["torn"] += 1
+            continue
+
+        write_start = clock()
+        if write_start - stamp > stale_time:
+            counts["stale"] += 1
+            continue
+        # the registers can't hold anything else. 3.0 would set the full-off bit,
+        # and NaN can't be turned into a register value at all
+        if not numpy.isfinite(frame).all():
+            counts["bad"] += 1
+            continue
+        if frame.min() < 0.0 or frame.max() > 1.0:
+            numpy.clip(frame, 0.0, 1.0, out=frame)
+            counts["clipped"] += 1
+
+        device.send(frame)
+        write_end = clock()
+        counts["sent"] += 1
+        last_fresh = stamp
+        if stale:
+            stale = False
+            if on_stale is not None:
+                on_stale(False)
+        if metrics is not None:
+            metrics.lateness.record(write_start - stamp)
+            metrics.writes.record(write_end - write_start)
+        if recorder is not None:
+            recorder.record(sequence, stamp, write_start, write_end, frame)
+        if trace is not None:
+            # the trace is written later, so it needs its own copy
+            trace.record(sequence, stamp, 0, numpy.array(frame))
+
+    return counts
@@ -0,0 +1,66 @@
+#!/usr/bin/python3
+"""
+    Shared setup for the tests. Every test runs in its own empty folder on
+    fresh simulated boards, with nothing saved to the metrics or cache
+    folders of the repo. Run the tests from the top folder by typing:
+
+        python -m pytest
+"""
+
+import os
+import sys
+import pytest # install package by typing: pip install pytest
+
+# the modules live in the top folder, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cache
+import metrics
+import session
+import simulation
+
+@pytest.fixture(autouse=True)
+def isolated(tmp_path, monkeypatch):
+    """
+    Runs a test in an empty folder, so no board map, cache, or metrics from
+    the repo are picked up, and on simulated buses that don't take real time.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(cache, "CACHE_FOLDER", str(tmp_path / "cache"))
+    monkeypatch.setattr(metrics, "METRICS_FOLDER", None)
+    # session.py keeps its own copy of the setting
+    monkeypatch.setattr(session, "METRICS_FOLDER", None)
+    monkeypatch.setattr(simulation, "REALTIME", False)
+    # new buses for each test, so transaction counts start at 0
+    monkeypatch.setattr(simulation, "buses", {})
+    return tmp_path
+
+@pytest.fixture
+def board():
+    """
+    Returns a PWM_board connected to two simulated boards, channels 0 to 31.
+    """
+    from output import PWM_board
+    device = PWM_board(simulated=True)
+    assert device.connect()
+    return device
+
+def register(device, channel):
+    """
+    Returns the off value a simulated board holds for a channel.
+        :param device: is the connected PWM_board.
+        :param channel: is the channel number across all boards.
+    """
+    board_num, pin = device.channel_pins[channel]
+    return device.boards[board_num].get_pwm(pin)[1]
+
+def unlink_ring(ring):
+    """
+    Deletes a stream.FrameRing a test made. Here the controller and playback are
+    the same process, so attaching to the ring took back the registration that
+    would delete it on exit. Register it again first, so unlinking it is tidy.
+        :param ring: is the FrameRing the test made with create=True.
+    """
+    from multiprocessing import resource_tracker
+    resource_tracker.register(ring.memory._name, "shared_memory")
+    ring.close(unlink=True)
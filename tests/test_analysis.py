@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+"""
+    Tests for analysis.py: the load profile of a gait, and the intervals
+    that are listed out of order, overlap, or run past the end of the cycle.
+"""
+
+import numpy # install package by typing: pip install numpy
+import pytest # install package by typing: pip install pytest
+import analysis
+from analysis import GaitAnalysis, analyze_timeline, interval_problems
+from core import Interval
+
+def test_profile():
+    """Two channels at full amplitude half the time, overlapping on one step."""
+    timeline = [[Interval(0, 3, 10)], [Interval(2, 2, 5)]]
+    result = analyze_timeline(timeline, 4, multiplier=1.0)
+    assert result.active.tolist() == [1, 1, 2, 1]
+    assert result.load.tolist() == pytest.approx([1.0, 1.0, 1.5, 0.5])
+    assert result.duty.tolist() == pytest.approx([0.75, 0.25])
+    assert result.peak_active == 2
+    assert result.peak_load == pytest.approx(1.5)
+    assert result.peak_step == 2
+    assert result.mean_load == pytest.approx(1.0)
+    assert "at most 2 channels open at once" in result.summary()
+
+def test_multiplier_scales_the_load():
+    result = analyze_timeline([[Interval(0, 2, 10)]], 2, multiplier=0.5)
+    assert result.peak_load == pytest.approx(0.5)
+    # how many are open doesn't depend on the multiplier
+    assert result.peak_active == 1
+
+def test_empty_timeline():
+    result = GaitAnalysis(numpy.zeros((0, 3)), 1.0)
+    assert (result.peak_active, result.peak_load, result.mean_load) == (0, 0.0, 0.0)
+    assert result.duty.tolist() == [0, 0, 0]
+
+def test_warnings(monkeypatch):
+    result = analyze_timeline([[Interval(0, 3, 10)], [Interval(2, 2, 5)]], 4)
+    # no limits, no warnings
+    assert result.warnings() == []
+    messages = result.warnings(max_active=1, max_load=1.2)
+    assert len(messages) == 2
+    assert messages[0].startswith("1 steps open more than 1 channels")
+    assert "first on step 2" in messages[0]
+    assert "up to 1.50 on step 2" in messages[1]
+    # the global limits are used when none are given
+    monkeypatch.setattr(analysis, "MAX_TOTAL_LOAD", 0.9)
+    assert len(result.warnings()) == 1
+
+def test_no_interval_problems():
+    timeline = [[Interval(0, 2, 5), Interval(2, 2, 8)], [], [Interval(1, 3, 2)]]
+    assert interval_problems(timeline, 4) == []
+    assert interval_problems([[], []], 4) == []
+
+def test_interval_problems():
+    timeline = [
+        [Interval(4, 2, 5), Interval(0, 2, 5)], # listed out of order
+        [Interval(0, 4, 5), Interval(2, 1, 8)], # overlapping
+        [Interval(6, 4, 5)], # past the end
+        [Interval(0, 2, 5), Interval(2, 2, 5)]] # fine, they only touch
+    assert interval_problems(timeline, 8) == [
+        (0, "1 interval listed out of order"),
+        (1, "1 interval overlaps another"),
+        (2, "1 interval runs past the end of the cycle")]
+
+def test_overlap_is_found_even_when_out_of_order():
+    """Overlaps are checked in order of start, not the order they're listed."""
+    timeline = [[Interval(5, 1, 5), Interval(0, 6, 5)]]
+    assert interval_problems(timeline, 8) == [
+        (0, "1 interval listed out of order"),
+        (0, "1 interval overlaps another")]
+
+def test_overlaps_dont_carry_across_channels():
+    """A long interval on one channel doesn't make the next channel's first interval overlap."""
+    timeline = [[Interval(0, 8, 5)], [Interval(0, 2, 5), Interval(3, 2, 5), Interval(4, 2, 5)]]
+    assert interval_problems(timeline, 8) == [(1, "1 interval overlaps another")]
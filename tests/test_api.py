@@ -0,0 +1,98 @@
+#!/usr/bin/python3
+"""
+    Tests for api.py: playing gaits from a script on the simulated boards,
+    in the calling thread and in the background.
+"""
+
+import time
+import pytest # install package by typing: pip install pytest
+import api
+import session
+from core import Interval, CompactTimeline
+from output import OUTPUT_SCALE
+from conftest import register
+
+GAIT = "steps: 4\n0 2 5\n1 2 3\n"
+
+@pytest.fixture(params=[True, False], ids=["threaded", "direct"])
+def device(request, monkeypatch):
+    """
+    Returns a session from api.open_device() on the simulated boards, with and
+    without the writer threads.
+    """
+    monkeypatch.setattr(session, "THREADED_OUTPUT", request.param)
+    with api.open_device(simulated=True) as device:
+        yield device
+
+@pytest.fixture
+def gait_file(tmp_path):
+    """
+    Returns the path of a small gait file.
+    """
+    path = tmp_path / "walk.gait"
+    path.write_text(GAIT)
+    return str(path)
+
+def test_play_and_wait(device, gait_file):
+    """Waiting plays the cycles in the calling thread and returns the run's metrics."""
+    metrics = api.play(device, gait_file, 0.04, 0.5, cycles=2)
+    assert metrics.lateness.count == 8
+    assert not device.playing
+    assert device.filename == gait_file
+
+def test_play_in_background_then_stop(device, gait_file):
+    """With wait=False, play() returns right away and the gait plays until stop()."""
+    started = time.perf_counter()
+    assert api.play(device, gait_file, 0.04, 0.5, wait=False) is None
+    assert time.perf_counter() - started < 0.04
+    time.sleep(0.2)
+    assert device.playing
+    metrics = api.stop(device)
+    assert not device.playing
+    assert device.thread is None
+    # several cycles were played before it stopped
+    assert metrics is device.metrics
+    assert metrics.lateness.count > 4
+    # stopping again does nothing
+    assert api.stop(device) is metrics
+
+def test_stop_shuts_off_the_outputs(device, gait_file):
+    api.play(device, gait_file, 0.04, 1.0, wait=False)
+    time.sleep(0.1)
+    api.stop(device, hold=False)
+    assert register(device.board, 0) == 0
+    assert register(device.board, 1) == 0
+
+def test_play_while_playing_changes_the_gait(device, gait_file):
+    """Another play() while it's running in the background takes over at the next cycle."""
+    api.play(device, gait_file, 0.04, 1.0, wait=False)
+    time.sleep(0.1)
+    timeline = CompactTimeline.from_lists([[Interval(0, 4, 10)]])
+    api.play(device, (timeline, 4), 0.04, 1.0, wait=False)
+    time.sleep(0.2)
+    assert register(device.board, 0) == OUTPUT_SCALE
+    api.stop(device, hold=True)
+    assert device.prepared[1] == 4
+    assert device.filename is None
+
+def test_play_checks_its_arguments(device, gait_file):
+    with pytest.raises(ValueError):
+        api.play(device, gait_file, 0, 0.5, cycles=1)
+    # waiting needs something to wait for
+    with pytest.raises(ValueError):
+        api.play(device, gait_file, 0.04, 0.5)
+    api.play(device, gait_file, 0.04, 0.5, wait=False)
+    try:
+        with pytest.raises(RuntimeError):
+            api.play(device, gait_file, 0.04, 0.5, cycles=1)
+    finally:
+        api.stop(device)
+
+def test_load_without_intervals(tmp_path):
+    path = tmp_path / "empty.gait"
+    path.write_text("steps: 4\n")
+    with pytest.raises(ValueError):
+        api.load(str(path))
+
+def test_stop_when_nothing_was_played(device):
+    assert api.stop(device) is None
@@ -0,0 +1,133 @@
+#!/usr/bin/python3
+"""
+    Tests for cache.py: a cached gait loads the same as a freshly parsed
+    one, and a stale or damaged cache file is never used.
+"""
+
+import os
+import pytest # install package by typing: pip install pytest
+import cache
+from cache import load_timeline, read_cache, write_cache, cache_path
+from parse import read_timeline
+
+GAIT = "steps: 6\n0 2 3, 4 2 5\n1 1 x\n2 3 7\n"
+
+@pytest.fixture
+def gait_file(tmp_path):
+    """
+    Returns the path to a small gait file with one bad line.
+    """
+    path = tmp_path / "walk.gait"
+    path.write_text(GAIT)
+    return str(path)
+
+def cache_files():
+    """
+    Returns the names of the files in the cache folder.
+    """
+    if not os.path.isdir(cache.CACHE_FOLDER):
+        return []
+    return sorted(os.listdir(cache.CACHE_FOLDER))
+
+def no_parsing(monkeypatch):
+    """
+    Makes parsing fail, so a test can tell the cache was used.
+    """
+    def parse(*args):
+        raise AssertionError("the gait was parsed again")
+    monkeypatch.setattr(cache, "read_timeline", parse)
+
+def test_round_trip(gait_file, monkeypatch):
+    """A gait loaded from the cache has the same intervals, steps, and errors as when it was parsed."""
+    parsed = read_timeline(gait_file)
+    first = load_timeline(gait_file)
+    assert len(cache_files()) == 1
+
+    no_parsing(monkeypatch)
+    timeline, steps, errors = load_timeline(gait_file)
+    assert timeline.to_lists() == parsed[0].to_lists() == first[0].to_lists()
+    assert steps == parsed[1] == 6
+    assert errors == parsed[2] == [(3, 'invalid interval "1 1 x"')]
+
+def test_changed_file_is_parsed_again(gait_file):
+    """The cache is keyed on the file's contents, so an edit is never hidden by it."""
+    load_timeline(gait_file)
+    with open(gait_file, "a") as file:
+        file.write("0 6 9\n")
+    timeline, steps, errors = load_timeline(gait_file)
+    assert len(timeline) == 3
+    assert len(cache_files()) == 2
+
+def test_empty_timeline(tmp_path):
+    """A gait with no intervals at all survives the trip too."""
+    path = str(tmp_path / "empty.bin")
+    write_cache(path, [[], []], 4, [])
+    timeline, steps, errors = read_cache(path)
+    assert timeline.to_lists() == [[], []]
+    assert (steps, errors) == (4, [])
+
+@pytest.mark.parametrize("damage", ["truncate", "magic", "version"])
+def test_damaged_cache_is_ignored(gait_file, damage):
+    """A cut-off file, or one that isn't a cache of this version, reads as no cache, and is replaced."""
+    expected = read_timeline(gait_file)[0].to_lists()
+    load_timeline(gait_file)
+    path = os.path.join(cache.CACHE_FOLDER, cache_files()[0])
+    with open(path, "r+b") as file:
+        if damage == "truncate":
+            file.truncate(cache.HEADER.size + 4)
+        elif damage == "magic":
+            file.write(b"NOPE")
+        else:
+            file.seek(4)
+            file.write((cache.CACHE_VERSION + 1).to_bytes(2, "little"))
+
+    assert read_cache(path) is None
+    assert load_timeline(gait_file)[0].to_lists() == expected
+    assert read_cache(path)[0].to_lists() == expected
+
+def test_cache_turned_off(gait_file, monkeypatch):
+    """With no cache folder, gaits are just parsed."""
+    monkeypatch.setattr(cache, "CACHE_FOLDER", None)
+    assert load_timeline(gait_file)[1] == 6
+    assert not os.path.exists("cache")
+
+def test_cache_path_has_version():
+    """Cache files from another version of the format can't be mistaken for this one."""
+    assert cache_path("abc").endswith("abc-v{}.bin".format(cache.CACHE_VERSION))
+
+def test_steps_too_big_for_the_cache(tmp_path):
+    """A step count the parser accepts but the cache can't hold is just parsed, not cached."""
+    path = tmp_path / "huge.gait"
+    path.write_text("steps: 99999999999\n0 2 5\n")
+    timeline, steps, errors = load_timeline(str(path))
+    assert steps == 99999999999 and len(timeline) == 1
+    assert cache_files() == []
+    assert not write_cache(str(tmp_path / "huge.bin"), timeline, steps, errors)
+
+def test_cache_is_pruned(tmp_path, monkeypatch):
+    """Past the size limit, the gaits used longest ago are deleted, and ones still used are kept."""
+    paths = []
+    for num in range(4):
+        path = tmp_path / "gait{}.gait".format(num)
+        path.write_text("steps: 4\n0 {} 5\n".format(num + 1))
+        paths.append(str(path))
+        before = set(cache_files())
+        load_timeline(paths[-1])
+        # each file is older than the next, whatever the filesystem's time resolution is
+        added = os.path.join(cache.CACHE_FOLDER, (set(cache_files()) - before).pop())
+        os.utime(added, (1000 + num, 1000 + num))
+    size = os.path.getsize(added)
+    # using the oldest one makes it the newest
+    load_timeline(paths[0])
+
+    monkeypatch.setattr(cache, "CACHE_SIZE_LIMIT", 3 * size)
+    path = tmp_path / "gait4.gait"
+    path.write_text("steps: 4\n0 1 9\n")
+    load_timeline(str(path))
+    assert len(cache_files()) == 3
+
+    no_parsing(monkeypatch)
+    load_timeline(paths[0])
+    load_timeline(str(path))
+    with pytest.raises(AssertionError):
+        load_timeline(paths[1])
@@ -0,0 +1,52 @@
+#!/usr/bin/python3
+"""
+    Tests for catalog.py: describing a folder of gaits, only parsing
+    files that changed, and not letting one bad file stop the rest.
+"""
+
+import pytest # install package by typing: pip install pytest
+import catalog
+from catalog import Catalog
+
+@pytest.fixture
+def folder(tmp_path):
+    """
+    Returns a folder with a good gait, one with a bad line, one that isn't
+    text at all, and a file that isn't a gait.
+    """
+    gaits = tmp_path / "gaits"
+    gaits.mkdir()
+    (gaits / "walk.gait").write_text("steps: 4\n0 2 5\n1 2 3\n")
+    (gaits / "typo.gait").write_text("steps: 4\n0 2 5\n1 2 x\n")
+    (gaits / "binary.gait").write_bytes(b"\xff\xfe\x00steps\x80\n")
+    (gaits / "notes.md").write_text("not a gait\n")
+    return str(gaits)
+
+@pytest.mark.parametrize("pool", [False, True], ids=["serial", "pool"])
+def test_update(folder, monkeypatch, pool):
+    """Every gait is described, in the worker processes or not, and bad files get an error instead of raising."""
+    if pool:
+        monkeypatch.setattr(catalog, "POOL_THRESHOLD", 1)
+    gaits = Catalog(folder)
+    assert gaits.update(workers=2) == ["binary.gait", "typo.gait", "walk.gait"]
+
+    walk = gaits.entries["walk.gait"]
+    assert (walk["steps"], walk["channels"], walk["intervals"], walk["errors"]) == (4, 2, 2, [])
+    assert gaits.describe("walk.gait").startswith("2 channels, 4 steps")
+    assert gaits.entries["typo.gait"]["errors"][0][0] == 3
+
+    binary = gaits.entries["binary.gait"]
+    assert binary["hash"] is None and binary["channels"] == 0
+    assert binary["errors"][0][0] == 0
+    assert gaits.invalid() == ["binary.gait", "typo.gait"]
+
+def test_only_changes_are_parsed(folder):
+    """A saved catalog is reused, so only new and edited files are parsed again."""
+    Catalog(folder).update()
+    with open(folder + "/walk.gait", "a") as file:
+        file.write("2 2 7\n")
+    gaits = Catalog(folder)
+    assert gaits.update() == ["walk.gait"]
+    assert gaits.entries["walk.gait"]["channels"] == 3
+    assert gaits.update() == []
+    assert gaits.files() == ["binary.gait", "typo.gait", "walk.gait"]
@@ -0,0 +1,113 @@
+#!/usr/bin/python3
+"""
+    Tests for compose.py: each operation's frames, saving a composed gait
+    to a file and reading it back, and playing one with the api.
+"""
+
+import numpy # install package by typing: pip install numpy
+import pytest # install package by typing: pip install pytest
+import api
+import session
+from compose import from_timeline, load_gait
+from core import Interval, compile_timeline
+from parse import read_timeline
+
+@pytest.fixture
+def walk():
+    """
+    Returns a 4 step gait on 3 channels, with an overlap on channel 2.
+    """
+    timeline = [[Interval(0, 2, 5)], [Interval(1, 2, 3)], [Interval(0, 4, 2), Interval(2, 1, 9)]]
+    return from_timeline(timeline, 4)
+
+def test_frames_match_compile_timeline(walk):
+    """A gait made from a timeline has the same frames as compiling the timeline."""
+    expected = compile_timeline(walk.timeline(), 4)
+    assert walk.frames().tolist() == expected.tolist()
+    assert walk.frames()[:, 2].tolist() == [2, 2, 9, 2]
+    # the frames are shared, so they can't be changed by accident
+    with pytest.raises(ValueError):
+        walk.frames()[0, 0] = 1
+
+def test_to_lines_round_trip(walk):
+    """Saving a gait and parsing the file gives back the same frames, for composed gaits too."""
+    composed = (walk + walk.shift(1, [0]).scale(2)) * 2
+    for gait in (walk, composed):
+        timeline, steps, errors = read_timeline(gait.to_lines())
+        assert errors == []
+        assert steps == gait.steps
+        assert compile_timeline(timeline, steps).tolist() == gait.frames().tolist()
+
+def test_load_gait_round_trip(walk, tmp_path):
+    """A gait saved to a file loads back as the same gait."""
+    path = tmp_path / "walk.gait"
+    path.write_text("\n".join(walk.to_lines()) + "\n")
+    assert load_gait(str(path)).frames().tolist() == walk.frames().tolist()
+
+def test_load_gait_without_intervals(tmp_path):
+    """A file with nothing to play is an error, not an empty gait."""
+    path = tmp_path / "empty.gait"
+    path.write_text("steps: 4\n")
+    with pytest.raises(ValueError):
+        load_gait(str(path))
+
+def test_then_and_repeat(walk):
+    """then() plays one gait after the other, and repeat() plays it again in the same cycle."""
+    frames = walk.frames()
+    assert (walk + walk).frames().tolist() == numpy.vstack([frames, frames]).tolist()
+    assert (walk * 3).frames().tolist() == numpy.vstack([frames] * 3).tolist()
+    assert (walk * 3).steps == 12
+
+def test_then_pads_channels(walk):
+    """The gait with fewer channels is held at zero on the rest."""
+    short = from_timeline([[Interval(0, 2, 1)]], 2)
+    frames = (short + walk).frames()
+    assert frames.shape == (6, 3)
+    assert frames[:2, 1:].tolist() == [[0, 0], [0, 0]]
+
+def test_shift_wraps_around(walk):
+    """Shifting a channel moves it later, and what goes past the end comes back at the start."""
+    shifted = walk.shift(3, [0]).frames()
+    assert shifted[:, 0].tolist() == [5, 0, 0, 5]
+    assert shifted[:, 1:].tolist() == walk.frames()[:, 1:].tolist()
+    assert walk.shift(-1).frames().tolist() == numpy.roll(walk.frames(), -1, axis=0).tolist()
+
+def test_mirror_swaps_channels(walk):
+    """Mirroring swaps the two groups of channels and leaves the rest alone."""
+    frames = walk.frames()
+    mirrored = walk.mirror([0], [1]).frames()
+    assert mirrored[:, 0].tolist() == frames[:, 1].tolist()
+    assert mirrored[:, 1].tolist() == frames[:, 0].tolist()
+    assert mirrored[:, 2].tolist() == frames[:, 2].tolist()
+
+def test_stretch_and_scale(walk):
+    """Stretching holds each step for longer, and scaling stays within the amplitude range."""
+    stretched = walk.stretch(2)
+    assert stretched.steps == 8
+    assert stretched.frames()[:, 0].tolist() == [5, 5, 5, 5, 0, 0, 0, 0]
+    assert walk.scale(3).frames()[:, 0].tolist() == [10, 10, 0, 0]
+
+def test_same_composition_is_shared(walk):
+    """Building the same composition twice gives the same frames without working them out again."""
+    assert (walk * 2).frames() is (walk * 2).frames()
+
+def test_scale_leaves_high_amplitudes_above_the_range():
+    """Only amplitudes that were in range are kept in range, so scale(1.0) changes nothing."""
+    loud = from_timeline([[Interval(0, 2, 20)], [Interval(0, 4, 6)]], 4)
+    assert loud.scale(1.0).frames().tolist() == loud.frames().tolist()
+    assert loud.scale(0.5).frames().tolist() == [[10, 3], [10, 3], [0, 3], [0, 3]]
+    assert loud.scale(2).frames().tolist() == [[40, 10], [40, 10], [0, 10], [0, 10]]
+    # negative factors still bottom out at zero
+    assert loud.scale(-1).frames().max() == 0
+
+def test_playing_a_gait_uses_its_frames(walk, monkeypatch):
+    """api.play() plays a Gait's remembered frames instead of compiling it again."""
+    def no_compiling(*args):
+        raise AssertionError("the gait was compiled again")
+    monkeypatch.setattr(session, "compile_timeline", no_compiling)
+    with api.open_device(simulated=True) as device:
+        metrics = api.play(device, walk, 0.04, 1.0, cycles=1)
+        assert metrics.lateness.count > 0
+        assert device.prepared[2].tolist() == walk.frames().tolist()
+        # the session can still tell how many channels it has
+        assert len(device.prepared[0]) == 3
@@ -0,0 +1,146 @@
+#!/usr/bin/python3
+"""
+    Tests for core.py: how overlapping intervals are resolved, compiling
+    timelines, and playing cycles on the simulated boards.
+"""
+
+import threading
+import numpy # install package by typing: pip install numpy
+import pytest # install package by typing: pip install pytest
+from core import (Interval, CompactTimeline, ChannelIndex, compile_timeline, frame_events,
+                  scale_frames, do_cycle, do_sparse_cycle)
+from scheduler import Scheduler, clock
+from conftest import register
+
+def amplitudes_of(intervals, steps):
+    """
+    Returns the amplitude a ChannelIndex gives at each step.
+        :param intervals: is the list of intervals on one channel.
+        :param steps: is the number of steps to look at.
+    """
+    index = ChannelIndex(intervals)
+    return [index.amplitude_at(step) for step in range(steps)]
+
+def test_later_start_wins_then_earlier_resumes():
+    """An interval that starts inside another wins until it ends, then the first picks back up."""
+    intervals = [Interval(0, 6, 3), Interval(2, 2, 7)]
+    assert amplitudes_of(intervals, 8) == [3, 3, 7, 7, 3, 3, 0, 0]
+
+def test_order_listed_only_breaks_ties():
+    """Intervals are ranked by start wherever they're listed; only a tie goes to the later one listed."""
+    assert amplitudes_of([Interval(2, 2, 7), Interval(0, 6, 3)], 6) == [3, 3, 7, 7, 3, 3]
+    assert amplitudes_of([Interval(1, 3, 4), Interval(1, 2, 9)], 5) == [0, 9, 9, 4, 0]
+    assert amplitudes_of([Interval(1, 2, 9), Interval(1, 3, 4)], 5) == [0, 4, 4, 4, 0]
+
+def test_zero_amplitude_overrides_and_is_left_out():
+    """A later interval of 0 turns the channel off, and isn't kept as a segment itself."""
+    index = ChannelIndex([Interval(0, 6, 5), Interval(2, 2, 0)])
+    assert [index.amplitude_at(step) for step in range(6)] == [5, 5, 0, 0, 5, 5]
+    assert 0 not in index.amplitudes
+
+def test_compact_and_list_channels_agree():
+    """A channel's slice of a CompactTimeline is indexed the same as its list of intervals."""
+    intervals = [Interval(0, 6, 3), Interval(2, 2, 7), Interval(5, 3, 1)]
+    compact = CompactTimeline.from_lists([intervals])
+    assert amplitudes_of(compact[0], 9) == amplitudes_of(intervals, 9)
+
+def test_compile_timeline_matches_index():
+    """Channels with and without overlaps compile to what ChannelIndex gives at every step."""
+    timeline = [
+        [Interval(0, 2, 1), Interval(4, 3, 2)],
+        [Interval(0, 8, 3), Interval(2, 2, 7), Interval(3, 4, 5)],
+        [],
+        [Interval(6, 10, 4)],
+    ]
+    steps = 8
+    amplitudes = compile_timeline(timeline, steps)
+    assert amplitudes.shape == (steps, len(timeline))
+    for channel, intervals in enumerate(timeline):
+        assert amplitudes[:, channel].tolist() == amplitudes_of(intervals, steps)
+
+def test_compile_timeline():
+    """Each step's row holds the amplitude of every channel at that step, and 0 where nothing is on."""
+    timeline = [[Interval(0, 2, 1), Interval(3, 2, 4)], [], [Interval(1, 10, 7)]]
+    amplitudes = compile_timeline(timeline, 5)
+    assert amplitudes.tolist() == [[1, 0, 0], [1, 0, 7], [0, 0, 7], [4, 0, 7], [4, 0, 7]]
+    assert compile_timeline([[], []], 3).tolist() == [[0, 0]] * 3
+
+def test_index_from_any_step():
+    """Lookups don't depend on the one before, so playback can start anywhere."""
+    index = ChannelIndex([Interval(6, 2, 4), Interval(0, 3, 1)])
+    assert [index.amplitude_at(step) for step in (7, 0, 5, 2, 3, 6, 100)] == [4, 1, 0, 1, 0, 4, 0]
+
+def test_scale_frames():
+    """Amplitudes are scaled so STEPS_IN_AMPLITUDE at a multiplier of 1 is fully on."""
+    assert scale_frames(numpy.array([[0, 5, 10]]), 0.5).tolist() == [[0.0, 0.25, 0.5]]
+
+def test_frame_events_wrap_around():
+    """Step 0 is only an event if something changed since the last step of the cycle."""
+    frames = numpy.array([[1, 0], [1, 0], [1, 2], [1, 0]])
+    events = frame_events(frames)
+    assert [step for step, _ in events] == [2, 3]
+    assert events[0][1].tolist() == [1]
+
+@pytest.fixture
+def gait():
+    """
+    Returns (amplitudes, frames) for a 5 step gait on two boards' worth of channels.
+    """
+    timeline = [[Interval(0, 2, 10)], [Interval(1, 4, 5)]] + [[] for _ in range(30)]
+    amplitudes = compile_timeline(timeline, 5)
+    return amplitudes, scale_frames(amplitudes, 0.5)
+
+def test_do_cycle_writes_each_step(board, gait):
+    """The dense cycle ends with the last step's values in the registers."""
+    amplitudes, frames = gait
+    timing = Scheduler(0.001)
+    timing.start()
+    assert do_cycle(board, amplitudes, frames, timing) == len(frames)
+    assert register(board, 0) == 0
+    assert register(board, 1) == int(0.25 * 2048)
+    assert timing.tick == len(frames)
+
+def test_do_cycle_from_a_step(board, gait):
+    """A cycle can start part way through, for resuming."""
+    amplitudes, frames = gait
+    timing = Scheduler(0.001)
+    timing.start()
+    assert do_cycle(board, amplitudes, frames, timing, start_step=3) == len(frames)
+    assert timing.tick == 2
+
+def test_sparse_cycle_lasts_the_whole_cycle(board, gait):
+    """Even a gait that never changes takes the cycle's full time, instead of returning at once."""
+    amplitudes = numpy.full((5, 32), 5)
+    frames = scale_frames(amplitudes, 1)
+    timing = Scheduler(0.02)
+    timing.start()
+    cycle_start = clock()
+    for cycle in range(3):
+        assert do_sparse_cycle(board, amplitudes, frames, frame_events(frames), timing,
+                               first_cycle=cycle == 0) == len(frames)
+    assert clock() - cycle_start >= 3 * 5 * 0.02
+    assert register(board, 31) == 1024
+
+def test_sparse_cycle_matches_dense(board, gait):
+    """Writing only the channels that change leaves the boards the same as writing every step."""
+    amplitudes, frames = gait
+    timing = Scheduler(0.001)
+    timing.start()
+    events = frame_events(frames)
+    for cycle in range(2):
+        assert do_sparse_cycle(board, amplitudes, frames, events, timing,
+                               first_cycle=cycle == 0) == len(frames)
+        assert [register(board, channel) for channel in range(32)] == [
+            int(value * 2048) for value in frames[-1]]
+
+def test_sparse_cycle_interrupted(board, gait):
+    """Interrupting a sparse cycle returns the step to carry on from, and hands its tick out again."""
+    amplitudes, frames = gait
+    timing = Scheduler(0.05)
+    timing.start()
+    interrupt = threading.Event()
+    threading.Timer(0.07, interrupt.set).start()
+    stopped_at = do_sparse_cycle(board, amplitudes, frames, frame_events(frames), timing,
+                                 first_cycle=True, interrupt=interrupt)
+    assert 1 <= stopped_at < len(frames)
+    assert timing.tick == stopped_at
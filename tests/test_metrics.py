@@ -0,0 +1,79 @@
+#!/usr/bin/python3
+"""
+    Tests for metrics.py: the timing histograms, and where the metrics
+    of a run are saved, if anywhere.
+"""
+
+import json
+import os
+import pytest # install package by typing: pip install pytest
+import api
+import metrics
+import session
+from core import Interval
+from metrics import Histogram, Metrics, metrics_path
+from session import PlaybackSession
+
+GAIT = ([[Interval(0, 2, 5)], [Interval(1, 2, 3)]], 4)
+
+def test_histogram():
+    """Values are counted in doubling buckets, with the exact count, total, min and max kept too."""
+    histogram = Histogram()
+    assert histogram.percentile(0.5) is None
+    for value in (0.000001, 0.000003, 0.000003, 0.5):
+        histogram.record(value)
+    assert (histogram.count, histogram.min, histogram.max) == (4, 0.000001, 0.5)
+    assert histogram.total == pytest.approx(0.500007)
+    assert histogram.percentile(0.5) == pytest.approx(0.000004)
+    assert histogram.percentile(1.0) == 0.5
+    summary = histogram.to_dict()
+    assert sum(count for _, count in summary["buckets"]) == 4
+
+def test_saved_files(tmp_path):
+    """The JSON and CSV files hold every histogram that has something in it."""
+    run = Metrics()
+    run.lateness.record(0.001)
+    run.record_send(1, 0.0002)
+    run.dump_json(str(tmp_path / "run.json"))
+    run.dump_csv(str(tmp_path / "run.csv"))
+    saved = json.loads((tmp_path / "run.json").read_text())
+    assert saved["histograms"]["step_lateness"]["count"] == 1
+    assert "send_board_1" in saved["histograms"]
+    assert (tmp_path / "run.csv").read_text().count("\n") == 3
+
+def test_relative_folder_is_next_to_the_program(tmp_path, monkeypatch):
+    """Files go next to the program, not into whatever folder it's run from."""
+    monkeypatch.setattr(metrics, "PROGRAM_FOLDER", str(tmp_path / "program"))
+    path = metrics_path("gaits/walk.gait", ".json", "runs")
+    assert os.path.dirname(path) == str(tmp_path / "program" / "runs")
+    assert os.path.basename(path).startswith("walk-")
+    assert not os.path.exists("runs")
+    absolute = str(tmp_path / "elsewhere")
+    assert os.path.dirname(metrics_path("walk", ".csv", absolute)) == absolute
+
+def test_api_sessions_save_nothing(tmp_path, monkeypatch):
+    """Playing from the api leaves no files behind unless it's asked to."""
+    folder = tmp_path / "saved"
+    monkeypatch.setattr(metrics, "METRICS_FOLDER", str(folder))
+    monkeypatch.setattr(session, "METRICS_FOLDER", str(folder))
+    with api.open_device(simulated=True) as player:
+        assert not player.save_metrics
+        api.play(player, GAIT, 0.02, 0.5, cycles=1)
+    assert not folder.exists()
+    assert not os.path.exists("metrics")
+
+    with api.open_device(simulated=True, save_metrics=True) as player:
+        api.play(player, GAIT, 0.02, 0.5, cycles=1)
+    assert sorted(os.path.splitext(name)[1] for name in os.listdir(str(folder))) == [".csv", ".json"]
+
+def test_sessions_save_by_default(board, tmp_path, monkeypatch):
+    """A session made directly, like the menus make, saves the metrics of each run."""
+    folder = tmp_path / "saved"
+    monkeypatch.setattr(metrics, "METRICS_FOLDER", str(folder))
+    monkeypatch.setattr(session, "METRICS_FOLDER", str(folder))
+    player = PlaybackSession(board, log_level="silent")
+    assert player.save_metrics
+    player.cycle_time, player.multiplier = 0.02, 0.5
+    player.load(*GAIT, filename="walk.gait")
+    player.play(cycles=1)
+    assert len(os.listdir(str(folder))) == 2
@@ -0,0 +1,96 @@
+#!/usr/bin/python3
+"""
+    Tests for output.py on the simulated boards: what reaches the
+    registers, how many transactions it takes, and probing for boards.
+"""
+
+import pytest # install package by typing: pip install pytest
+import output
+import simulation
+from output import PWM_board, probe_boards, OUTPUT_SCALE
+from conftest import register
+
+def test_send_sets_registers(board):
+    """Each channel's value ends up in the off register of its board and pin."""
+    values = [channel / 32.0 for channel in range(32)]
+    board.send(values)
+    assert [register(board, channel) for channel in range(32)] == [int(value * OUTPUT_SCALE) for value in values]
+    assert board.boards[1].get_pwm(15) == (0, int(31 / 32.0 * OUTPUT_SCALE))
+
+def test_only_changes_are_written(board):
+    """Sending the same frame twice costs nothing the second time, and neighbours go in one block."""
+    bus = simulation.get_bus(1)
+    board.send([0.5] * 32)
+    bus.reset()
+    board.send([0.5] * 32)
+    assert bus.transactions == 0
+
+    # pins 2 to 4 changed together, and pin 9 on its own
+    frame = [0.5] * 32
+    frame[2:5] = [0.1] * 3
+    frame[9] = 0.2
+    board.send(frame)
+    assert bus.transactions == 2
+    assert bus.bytes == 1 + 3 * 4 + 1 + 4
+
+def test_send_channels(board):
+    """Only the channels asked for are written, even if others changed."""
+    board.send([0.0] * 32)
+    board.send_channels([3, 20], [0.5] * 32)
+    assert register(board, 3) == register(board, 20) == OUTPUT_SCALE // 2
+    assert register(board, 4) == 0
+
+def test_clear(board):
+    """Clearing shuts off every channel, and the next send writes them all again."""
+    board.send([0.5] * 32)
+    board.clear()
+    assert [register(board, channel) for channel in range(32)] == [0] * 32
+    board.send([0.5] * 32)
+    assert register(board, 17) == OUTPUT_SCALE // 2
+
+def test_failed_write_is_retried(board):
+    """A write the bus rejected isn't remembered as sent, so the next send tries it again."""
+    bus = simulation.get_bus(1)
+    bus.error_rate = 1.0
+    with pytest.raises(OSError):
+        board.send([0.5] * 32)
+    bus.error_rate = 0.0
+    board.send([0.5] * 32)
+    assert [register(board, channel) for channel in range(32)] == [OUTPUT_SCALE // 2] * 32
+
+def test_probing_skips_other_chips(monkeypatch):
+    """Only PCA9685s are found, not the sensors that share the bus with them."""
+    monkeypatch.setattr(simulation, "SIMULATED_ADDRESSES", {1: [0x40, 0x42], 3: [0x41]})
+    monkeypatch.setattr(simulation, "SIMULATED_OTHER_ADDRESSES", {1: [0x48, 0x68, 0x76]})
+    assert probe_boards([1, 2, 3], simulated=True) == [(1, 0x40), (1, 0x42), (3, 0x41)]
+
+def test_connect_uses_probed_layout(monkeypatch):
+    """With buses to probe and no board map, the boards found get 16 channels each, in order."""
+    monkeypatch.setattr(simulation, "SIMULATED_ADDRESSES", {1: [0x41, 0x44]})
+    monkeypatch.setattr(simulation, "SIMULATED_OTHER_ADDRESSES", {1: [0x40]})
+    monkeypatch.setattr(output, "PROBE_BUSES", [1])
+    device = PWM_board(simulated=True)
+    assert device.find_layout() == [(0, 1, 0x41), (16, 1, 0x44)]
+    assert device.connect()
+
+def test_board_map(tmp_path):
+    """A board map file sets where each board's channels start."""
+    path = tmp_path / "boards.map"
+    path.write_text("0 1 0x40\n16 1 0x41\n")
+    assert output.read_board_map(str(path)) == [(0, 1, 0x40), (16, 1, 0x41)]
+    path.write_text("0 1 0x40\n8 1 0x41\n")
+    with pytest.raises(ValueError):
+        output.read_board_map(str(path))
+
+def test_boards_on_several_buses():
+    """Any number of boards can be laid out across buses, with gaps between their channels."""
+    layout = [(0, 1, 0x40), (16, 1, 0x41), (48, 2, 0x40), (64, 3, 0x45)]
+    device = PWM_board(simulated=True, layout=layout)
+    assert device.connect()
+    assert device.boards_by_bus() == {1: [0, 1], 2: [2], 3: [3]}
+    device.send([channel / 80.0 for channel in range(80)])
+    for channel in (0, 31, 48, 79):
+        assert register(device, channel) == int(channel / 80.0 * OUTPUT_SCALE)
+    # channels 32 to 47 have no board, so nothing is written for them
+    assert 40 not in device.channel_pins
+    assert simulation.get_bus(2).transactions and simulation.get_bus(3).transactions
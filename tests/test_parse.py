@@ -0,0 +1,70 @@
+#!/usr/bin/python3
+"""
+    Tests for parse.py: the single-pass parser and the verbose one that
+    explains each line have to agree on every file, good or bad.
+"""
+
+import glob
+import os
+import pytest # install package by typing: pip install pytest
+from core import Interval
+from parse import read_timeline, DEFAULT_STEPS_IN_TIMELINE
+
+GAITS_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "gaits")
+
+# each is a list of lines, with a description for the test name
+SOURCES = {
+    "simple": ["steps: 6", "0 2 3, 4 2 5", "2 3 7"],
+    "comments": ["# a walk", "steps: 4 # per cycle", "", "0 1 2 # first", "# 1 1 1", "1 1 3"],
+    "no step count": ["0 1 2, 3 1 4"],
+    "step count after intervals": ["0 1 2", "12", "1 1 1"],
+    "two numbers on the first line": ["steps 4 or 5", "0 1 2"],
+    "bad intervals": ["steps: 4", "0 1, 1 1 x, 2 -1 3, 0 1 2 3", "1.5 1 2", ",, ,", "0 1 2"],
+    "too big": ["steps: 4", "0 1 99999999999", "0 1 2147483647"],
+    "crlf": ["steps: 3\r\n", "0 1 2\r\n", "\r\n", "1 1 1\r\n"],
+    "empty": [],
+    "only errors": ["steps: 4", "a b c", "1 2"],
+}
+
+def both_parsers(source, capsys):
+    """
+    Returns what the single-pass parser and the verbose parser each make of a source,
+    as (intervals as lists, steps, errors).
+        :param source: is a list of lines or a path.
+        :param capsys: is pytest's fixture for output, so the verbose parser's is hidden.
+    """
+    results = []
+    for verbose in (False, True):
+        timeline, steps, errors = read_timeline(iter(source) if isinstance(source, list) else source, verbose)
+        results.append((timeline.to_lists(), steps, list(map(tuple, errors))))
+    capsys.readouterr()
+    return results
+
+@pytest.mark.parametrize("name", sorted(SOURCES))
+def test_parsers_agree_on_lines(name, capsys):
+    """Both parsers make the same intervals, step count and errors from the same lines."""
+    fast, verbose = both_parsers(SOURCES[name], capsys)
+    assert fast == verbose
+
+@pytest.mark.parametrize("path", sorted(glob.glob(os.path.join(GAITS_FOLDER, "*"))),
+                         ids=os.path.basename)
+def test_parsers_agree_on_gaits(path, capsys):
+    """Both parsers read every example gait the same, including the one full of mistakes."""
+    fast, verbose = both_parsers(path, capsys)
+    assert fast == verbose
+
+def test_what_is_read():
+    """Comments and blank lines are skipped, bad intervals are reported by line, and good ones kept."""
+    timeline, steps, errors = read_timeline(SOURCES["bad intervals"])
+    assert steps == 4
+    # a line with no valid intervals isn't a channel
+    assert timeline.to_lists() == [[Interval(0, 1, 2)]]
+    assert [line for line, _ in errors] == [2, 2, 2, 2, 3, 4, 4, 4, 4]
+    assert read_timeline(SOURCES["no step count"])[1] == DEFAULT_STEPS_IN_TIMELINE
+
+def test_missing_file(tmp_path, capsys):
+    """A file that isn't there is one error on line 0, from either parser."""
+    path = str(tmp_path / "missing.gait")
+    fast, verbose = both_parsers(path, capsys)
+    assert fast == verbose
+    assert fast[2][0][0] == 0 and fast[0] == []
@@ -0,0 +1,122 @@
+#!/usr/bin/python3
+"""
+    Tests for recorder.py: saving a recording and loading it back, and
+    replaying a run recorded by a session with the frames it sent.
+"""
+
+import glob
+import os
+import numpy # install package by typing: pip install numpy
+import pytest # install package by typing: pip install pytest
+import recorder
+import session
+from core import Interval, CompactTimeline
+from recorder import Recorder, load_recording, replay, replay_frames, timing_stats, HEADER
+from session import PlaybackSession
+
+class Listener:
+    """
+    A stand-in for a PWM_board that keeps every frame it's sent.
+    """
+
+    def __init__(self):
+        """
+        Makes a listener that hasn't been sent anything.
+        """
+        self.frames = []
+
+    def send(self, amplitudes):
+        """
+        Keeps a copy of a frame.
+            :param amplitudes: is the array that was sent.
+        """
+        self.frames.append(numpy.array(amplitudes))
+
+def test_save_and_load_round_trip(tmp_path):
+    """Every field of every frame comes back the same, across more than one chunk."""
+    recording = Recorder(3, chunk=2)
+    recording.details = {"filename": "walk.gait"}
+    start = recording.started
+    for tick in range(5):
+        recording.record(tick, start + tick, start + tick + 0.25, start + tick + 0.5,
+                         [tick, tick / 2.0, 1.0], writer=tick % 2)
+    assert recording.count == 5
+    assert len(recording.chunks) == 3
+    path = str(tmp_path / "walk.rec")
+    recording.save(path)
+
+    records, details = load_recording(path)
+    assert details["filename"] == "walk.gait"
+    assert details["wall_time"] == recording.wall_time
+    assert records["tick"].tolist() == [0, 1, 2, 3, 4]
+    assert records["deadline"].tolist() == [0, 1, 2, 3, 4]
+    assert records["started"].tolist() == [0.25, 1.25, 2.25, 3.25, 4.25]
+    assert records["writer"].tolist() == [0, 1, 0, 1, 0]
+    assert records["frame"][3].tolist() == [3, 1.5, 1.0]
+    assert records.tobytes() == recording.frames().tobytes()
+
+def test_long_frames_are_cut_short():
+    recording = Recorder(2)
+    recording.record(0, 0, 0, 0, [1.0, 2.0, 3.0])
+    recording.record(1, 0, 0, 0, [4.0])
+    # a short frame leaves the rest of the row at zero
+    assert recording.frames()["frame"].tolist() == [[1.0, 2.0], [4.0, 0.0]]
+
+def test_load_rejects_other_files(tmp_path):
+    short = tmp_path / "short.rec"
+    short.write_bytes(b"PN")
+    with pytest.raises(ValueError):
+        load_recording(str(short))
+    wrong = tmp_path / "wrong.rec"
+    wrong.write_bytes(HEADER.pack(b"PNRC", recorder.RECORD_VERSION + 1, 1, 0, 0))
+    with pytest.raises(ValueError):
+        load_recording(str(wrong))
+
+def test_replay_frames_keeps_the_first_of_each_step():
+    """With a writer for each bus, every step is recorded more than once, maybe out of order."""
+    recording = Recorder(1)
+    for tick, writer, value in ((0, 1, 1.0), (1, 1, 2.0), (0, 2, 9.0), (1, 2, 9.0), (2, 1, 3.0)):
+        recording.record(tick, tick, tick, tick, [value], writer=writer)
+    frames = replay_frames(recording.frames())
+    assert frames["tick"].tolist() == [0, 1, 2]
+    assert frames["frame"][:, 0].tolist() == [1.0, 2.0, 3.0]
+    assert len(replay_frames(recording.frames()[:0])) == 0
+
+def test_timing_stats():
+    recording = Recorder(1)
+    recording.record(0, 0.0, 0.5, 1.0, [0])
+    recording.record(0, 1.0, 1.5, 1.5, [0])
+    stats = timing_stats(recording.frames())
+    assert stats["frames"] == 2
+    assert stats["steps"] == 1
+    assert stats["lateness"]["max"] == pytest.approx(0.5)
+    assert stats["write_time"]["mean"] == pytest.approx(0.25)
+
+@pytest.mark.parametrize("threaded", [True, False], ids=["threaded", "direct"])
+def test_replay_a_recorded_run(board, tmp_path, monkeypatch, threaded):
+    """A session's recording replays the same frames it sent, in order, with each cycle's timing."""
+    monkeypatch.setattr(session, "THREADED_OUTPUT", threaded)
+    monkeypatch.setattr(session, "RECORD_FOLDER", str(tmp_path / "recordings"))
+    player = PlaybackSession(board, log_level="silent", record=True)
+    steps = 5
+    timeline = CompactTimeline.from_lists([[Interval(step, 1, step + 1) for step in range(steps)], []])
+    player.cycle_time, player.multiplier = 0.05, 0.5
+    player.load(timeline, steps, "counting")
+    assert player.connect()
+    player.play(cycles=2)
+    player.close()
+
+    paths = glob.glob(os.path.join(str(tmp_path / "recordings"), "counting-*.rec"))
+    assert len(paths) == 1
+    records, details = load_recording(paths[0])
+    assert details["filename"] == "counting"
+    assert details["cycle_time"] == 0.05
+
+    sent = player.prepared[3]
+    listener = Listener()
+    assert replay(records, listener, speed=100) == 2 * steps
+    for step, frame in enumerate(listener.frames):
+        assert frame[:sent.shape[1]].tolist() == sent[step % steps].tolist()
+    # the second cycle was due one cycle time after the first
+    deadlines = replay_frames(records)["deadline"]
+    assert deadlines[steps] - deadlines[0] == pytest.approx(0.05)
@@ -0,0 +1,68 @@
+#!/usr/bin/python3
+"""
+    Tests for resample.py: the shape of the ramps between steps, and
+    how many frames a cycle gets.
+"""
+
+import numpy # install package by typing: pip install numpy
+import pytest # install package by typing: pip install pytest
+import session
+from core import Interval
+from resample import resample_frames, resampled_frame_count
+
+# one channel that goes 0, 8, 4, 4 over a cycle of 4 steps
+AMPLITUDES = numpy.array([[0], [8], [4], [4]])
+
+def channel(frames):
+    """
+    Returns the first channel of resampled frames as a list of rounded values.
+    """
+    return [round(value, 6) for value in frames[:, 0].tolist()]
+
+def test_step_shape_repeats_each_step():
+    """With no ramp, each step is just held for its share of the frames."""
+    assert channel(resample_frames(AMPLITUDES, 8, "step")) == [0, 0, 8, 8, 4, 4, 4, 4]
+    # a width of 0 is the same as no ramp
+    assert channel(resample_frames(AMPLITUDES, 8, "linear", 0)) == [0, 0, 8, 8, 4, 4, 4, 4]
+
+def test_linear_ramp():
+    """A linear ramp goes evenly from the last step's value to the new one over part of the step."""
+    frames = resample_frames(AMPLITUDES, 16, "linear", 0.5)
+    assert channel(frames) == [4, 2, 0, 0, 0, 4, 8, 8, 8, 6, 4, 4, 4, 4, 4, 4]
+
+def test_full_width_linear_ramp():
+    """A ramp as wide as the step only reaches the new value at the end of it."""
+    frames = resample_frames(AMPLITUDES, 8, "linear", 1.0)
+    assert channel(frames) == [4, 2, 0, 4, 8, 6, 4, 4]
+
+def test_ease_ramp():
+    """An eased ramp starts and ends gently, but passes the halfway point at the same time."""
+    linear = channel(resample_frames(AMPLITUDES, 32, "linear", 1.0))
+    ease = channel(resample_frames(AMPLITUDES, 32, "ease", 1.0))
+    # step 1 ramps from 0 to 8 over frames 8 to 16
+    assert ease[8] == linear[8] == 0
+    assert ease[12] == linear[12] == 4
+    assert ease[9] < linear[9] and ease[15] > linear[15]
+    assert all(first <= second for first, second in zip(ease[8:16], ease[9:16]))
+
+def test_first_step_ramps_from_the_last():
+    """Cycles repeat, so the first step ramps from the last step's value."""
+    assert resample_frames(AMPLITUDES, 8, "linear", 1.0)[0, 0] == 4
+
+def test_unknown_shape():
+    """A misspelled ramp shape is an error."""
+    with pytest.raises(ValueError):
+        resample_frames(AMPLITUDES, 8, "smooth")
+
+def test_frame_count():
+    """The frame rate sets the frames per cycle, but never fewer than the gait's steps."""
+    assert resampled_frame_count(2.0, 10, 100) == 200
+    assert resampled_frame_count(0.05, 10, 100) == 10
+
+def test_playback_is_resampled(monkeypatch):
+    """With a frame rate set, playback sends the ramped frames instead of the steps."""
+    monkeypatch.setattr(session, "RESAMPLE_RATE", 40)
+    timeline = [[Interval(1, 1, 10)]]
+    _, _, amplitudes, frames, _ = session.prepare_playback(timeline, 2, 1.0, 1.0)
+    assert amplitudes.shape == (40, 1)
+    assert frames[:, 0].max() == 1.0 and 0 < frames[21, 0] < 1
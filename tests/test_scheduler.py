@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+"""
+    Tests for scheduler.py: deadlines, changing the step time, and each
+    overrun policy. The clock is faked, so nothing here actually waits.
+"""
+
+import pytest # install package by typing: pip install pytest
+import scheduler
+from metrics import Metrics
+from scheduler import Scheduler, OVERRUN_CATCH_UP, OVERRUN_SKIP, OVERRUN_STRETCH
+
+class FakeClock:
+    """
+    A clock that only moves when told to.
+    """
+
+    def __init__(self, now=100.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def fake_clock(monkeypatch):
+    """
+    Returns a FakeClock that the scheduler reads instead of the real one.
+    """
+    fake = FakeClock()
+    monkeypatch.setattr(scheduler, "clock", fake)
+    return fake
+
+def test_deadlines_are_absolute(fake_clock):
+    """Each step's deadline is counted from the start, not from the step before."""
+    timing = Scheduler(0.1)
+    timing.start()
+    assert [timing.next_tick() for _ in range(3)] == [0, 1, 2]
+    assert timing.slot(3) == (pytest.approx(100.3), 0.1)
+    assert timing.advance(10) == 3
+    assert timing.next_tick() == 13
+    fake_clock.now = 105.0
+    assert timing.elapsed() == pytest.approx(5.0)
+
+def test_retime_keeps_earlier_deadlines(fake_clock):
+    """A new step time only applies from the next step handed out."""
+    timing = Scheduler(0.1)
+    timing.start()
+    for _ in range(3):
+        timing.next_tick()
+    timing.retime(0.2)
+    assert timing.deadline(2) == pytest.approx(100.2)
+    assert timing.slot(3) == (pytest.approx(100.3), 0.2)
+    assert timing.deadline(5) == pytest.approx(100.7)
+
+def test_late_inside_its_slot_is_output(fake_clock):
+    """A step that's late but not past the start of the next one isn't an overrun."""
+    timing = Scheduler(0.1, OVERRUN_SKIP)
+    timing.start()
+    fake_clock.now = 100.05
+    assert timing.wait(0)
+    assert timing.overruns == 0
+
+def test_skip_drops_late_steps_and_counts_once(fake_clock):
+    """With "skip", a step past its slot is dropped, and counted once however often it's checked."""
+    metrics = Metrics()
+    timing = Scheduler(0.1, OVERRUN_SKIP, metrics=metrics)
+    timing.start()
+    fake_clock.now = 100.25
+    assert not timing.wait(0)
+    assert not timing.wait(0)
+    assert timing.wait(2)
+    assert timing.overruns == 1
+    assert metrics.overruns == 1
+
+def test_catch_up_outputs_late_steps(fake_clock):
+    """With "catch up", late steps are still output, and the deadlines stay put."""
+    timing = Scheduler(0.1, OVERRUN_CATCH_UP)
+    timing.start()
+    fake_clock.now = 100.25
+    assert timing.wait(0)
+    assert timing.overruns == 1
+    assert timing.deadline(1) == pytest.approx(100.1)
+
+def test_stretch_pushes_back_later_deadlines(fake_clock):
+    """With "stretch", the whole schedule moves back by how late the step was."""
+    timing = Scheduler(0.1, OVERRUN_STRETCH)
+    timing.start()
+    fake_clock.now = 100.25
+    assert timing.wait(0)
+    assert timing.deadline(1) == pytest.approx(100.35)
+
+def test_unknown_policy():
+    """A misspelled policy is caught up front, not in the middle of a run."""
+    with pytest.raises(ValueError):
+        Scheduler(0.1, "catchup")
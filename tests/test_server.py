@@ -0,0 +1,209 @@
+#!/usr/bin/python3
+"""
+    Tests for server.py: the JSON line protocol over a Unix socket,
+    controlling a session on the simulated boards, and switching it to
+    a stream of frames.
+"""
+
+import asyncio
+import json
+import os
+import pytest # install package by typing: pip install pytest
+import server as server_module
+from output import PWM_board
+from server import ControlServer
+from session import PlaybackSession
+from stream import FrameRing
+from conftest import unlink_ring
+
+GAIT = "steps: 4\n0 2 5\n1 2 3\n"
+
+class Client:
+    """
+    One connection to the server, keeping replies and event messages apart.
+    """
+
+    def __init__(self, reader, writer):
+        """
+        Wraps the two ends of a connection.
+        """
+        self.reader = reader
+        self.writer = writer
+        self.events = []
+
+    async def send_line(self, line):
+        """
+        Sends one raw line and returns the reply to it.
+        """
+        self.writer.write(line + b"\n")
+        await self.writer.drain()
+        while True:
+            message = json.loads(await asyncio.wait_for(self.reader.readline(), 5))
+            if "event" not in message:
+                return message
+            self.events.append(message)
+
+    async def command(self, cmd, **values):
+        """
+        Sends a command and returns the reply to it.
+        """
+        return await self.send_line(json.dumps(dict(values, cmd=cmd)).encode())
+
+    async def wait_for_event(self, event):
+        """
+        Returns the next event message of one kind.
+        """
+        while True:
+            message = json.loads(await asyncio.wait_for(self.reader.readline(), 5))
+            self.events.append(message)
+            if message.get("event") == event:
+                return message
+
+def run_server(scenario):
+    """
+    Starts a server for a session on simulated boards, runs a scenario with two
+    connected clients, and shuts everything down again.
+        :param scenario: is an async function taking (server, client, other client).
+    """
+    async def run():
+        session = PlaybackSession(PWM_board(simulated=True), log_level="silent")
+        server = ControlServer(session)
+        await server.start(path="pneunet.sock")
+        try:
+            first = Client(*await asyncio.open_unix_connection("pneunet.sock"))
+            second = Client(*await asyncio.open_unix_connection("pneunet.sock"))
+            await scenario(server, first, second)
+            first.writer.close()
+            second.writer.close()
+        finally:
+            await server.close()
+            session.close()
+    asyncio.run(run())
+
+@pytest.fixture
+def gait_file(tmp_path):
+    """
+    Returns the path to a small gait file.
+    """
+    path = tmp_path / "walk.gait"
+    path.write_text(GAIT)
+    return str(path)
+
+def test_replies_carry_the_id(gait_file):
+    """Every reply says whether it worked, and copies the command's id."""
+    async def scenario(server, client, _):
+        reply = await client.command("load", file=gait_file, id=7)
+        assert reply == {"id": 7, "ok": True, "channels": 2, "steps": 4}
+        assert await client.command("set_cycle_time", value=0.1) == {"ok": True}
+        status = await client.command("status", id="s")
+        assert status["id"] == "s" and status["ok"]
+        assert (status["filename"], status["steps"], status["cycle_time"]) == (gait_file, 4, 0.1)
+        assert not status["playing"]
+    run_server(scenario)
+
+def test_bad_commands(gait_file):
+    """Bad commands get an error reply, and the connection keeps working."""
+    async def scenario(server, client, _):
+        assert await client.send_line(b"not json") == {"ok": False, "error": "not valid JSON"}
+        assert not (await client.send_line(b"[1, 2]"))["ok"]
+        reply = await client.command("dance", id=1)
+        assert reply == {"id": 1, "ok": False, "error": "unknown command: dance"}
+        # true is a bool, not a number
+        assert not (await client.command("set_multiplier", value=True))["ok"]
+        assert not (await client.command("set_multiplier", value=-1))["ok"]
+        assert not (await client.command("set_cycle_time", value=0))["ok"]
+        assert not (await client.command("set_multiplier", value=0.5, boundary="soon"))["ok"]
+        assert not (await client.command("load"))["ok"]
+        assert not (await client.command("load", file="missing.gait"))["ok"]
+        assert not (await client.command("start"))["ok"]
+        assert not (await client.command("resume"))["ok"]
+        assert not (await client.command("pause"))["ok"]
+        assert not (await client.command("stream", name="no-such-stream"))["ok"]
+        assert (await client.command("status"))["ok"]
+    run_server(scenario)
+
+def test_play_pause_resume(gait_file):
+    """A subscribed client hears about each cycle, and pause and resume carry on from the same step."""
+    async def scenario(server, client, listener):
+        assert (await listener.command("subscribe"))["ok"]
+        await client.command("load", file=gait_file)
+        await client.command("set_cycle_time", value=0.2)
+        await client.command("set_multiplier", value=0.5)
+        assert (await client.command("start"))["ok"]
+        started = await listener.wait_for_event("started")
+        assert started["filename"] == gait_file and started["multiplier"] == 0.5
+        assert (await client.command("start"))["error"] == "already playing"
+        cycle = await listener.wait_for_event("cycle")
+        assert cycle["cycle"] == 1
+
+        await asyncio.sleep(0.1)
+        paused = await client.command("pause")
+        assert paused["ok"] and 0 < paused["position"] < 4
+        stopped = await listener.wait_for_event("stopped")
+        assert stopped["position"] == paused["position"] and stopped["held"]
+        status = await client.command("status")
+        assert status["paused"] and not status["playing"]
+
+        assert (await client.command("resume", cycles=1))["ok"]
+        stopped = await listener.wait_for_event("stopped")
+        assert stopped["finished"] and stopped["cycles"] == 1
+        assert (await client.command("status"))["position"] == 0
+
+        # the client that didn't subscribe got no events
+        assert client.events == []
+        assert (await listener.command("unsubscribe"))["ok"]
+    run_server(scenario)
+
+def test_stop_and_change_while_playing(gait_file):
+    """Settings can change while playing, and stop waits until playback has stopped."""
+    async def scenario(server, client, _):
+        await client.command("load", file=gait_file)
+        await client.command("set_cycle_time", value=0.1)
+        await client.command("set_multiplier", value=0.5)
+        await client.command("start")
+        assert (await client.command("set_multiplier", value=0.8, boundary="step"))["ok"]
+        assert (await client.command("set_cycle_time", value=0.05))["ok"]
+        await asyncio.sleep(0.1)
+        assert (await client.command("stop", hold=False))["ok"]
+        status = await client.command("status")
+        assert not status["playing"] and not status["paused"]
+        assert (status["multiplier"], status["cycle_time"]) == (0.8, 0.05)
+    run_server(scenario)
+
+def test_unreadable_gait_file(gait_file, monkeypatch):
+    """A gait file that can't be read gets an error reply, like one that can't be parsed."""
+    def unreadable(filename):
+        raise PermissionError("permission denied: {}".format(filename))
+    monkeypatch.setattr(server_module, "load", unreadable)
+
+    async def scenario(server, client, _):
+        reply = await client.command("load", file=gait_file, id=3)
+        assert reply == {"id": 3, "ok": False, "error": "permission denied: {}".format(gait_file)}
+        # the connection and the server keep working
+        assert (await client.command("status"))["ok"]
+    run_server(scenario)
+
+def test_stream(request):
+    """A client can switch playback to a stream of frames and back to the gait."""
+    ring = FrameRing("pneunet-test-{}".format(os.getpid()), channels=32, create=True)
+    request.addfinalizer(lambda: unlink_ring(ring))
+
+    async def scenario(server, client, listener):
+        await listener.command("subscribe")
+        reply = await client.command("stream", name=ring.name)
+        assert reply == {"ok": True, "channels": 32}
+        assert (await client.command("start"))["ok"]
+        await listener.wait_for_event("started")
+        assert (await client.command("stream", name=None))["error"] == "stop playing first"
+        for _ in range(5):
+            ring.write([0.5] * 32)
+            await asyncio.sleep(0.005)
+        assert (await client.command("status"))["stream"] == ring.name
+        await client.command("stop")
+        stopped = await listener.wait_for_event("stopped")
+        assert stopped["sent"] > 0 and stopped["stream"] == ring.name
+        assert server.session.board.boards[0].get_pwm(0) == (0, 1024)
+
+        assert (await client.command("stream", name=None)) == {"ok": True}
+        assert (await client.command("status"))["stream"] is None
+    run_server(scenario)
@@ -0,0 +1,194 @@
+#!/usr/bin/python3
+"""
+    Tests for session.py on the simulated boards: playing a number of
+    cycles, stopping and resuming, changes while playing, and cleaning
+    up after a failed run.
+"""
+
+import threading
+import time
+import pytest # install package by typing: pip install pytest
+import api
+import pipeline
+import session
+import simulation
+from core import Interval, CompactTimeline
+from output import OUTPUT_SCALE
+from session import PlaybackSession, STEP_BOUNDARY
+from conftest import register
+
+# steps in the counting gait
+STEPS = 20
+
+@pytest.fixture(params=[True, False], ids=["threaded", "direct"])
+def player(request, board, monkeypatch):
+    """
+    Returns a session on the simulated boards with the counting gait loaded, which
+    turns channel 0 up a little more each step, so its register says which step
+    was output last. Runs each test with and without the writer threads.
+    """
+    monkeypatch.setattr(session, "THREADED_OUTPUT", request.param)
+    player = PlaybackSession(board, log_level="silent")
+    player.events = []
+    player.listeners.append(lambda event, details: player.events.append((event, details)))
+    timeline = CompactTimeline.from_lists([[Interval(step, 1, step + 1) for step in range(STEPS)]])
+    player.cycle_time, player.multiplier = 0.2, 0.5
+    player.load(timeline, STEPS, "counting")
+    assert player.connect()
+    yield player
+    player.close()
+
+def step_held(player):
+    """
+    Returns the step of the counting gait that channel 0 of the boards is holding.
+        :param player: is the session from the player fixture.
+    """
+    frames = player.prepared[3]
+    return [int(frame[0] * OUTPUT_SCALE) for frame in frames].index(register(player.board, 0))
+
+def events_named(player, name):
+    """
+    Returns the details of each event of one kind the session sent.
+        :param player: is the session from the player fixture.
+        :param name: is the kind of event, like "cycle".
+    """
+    return [details for event, details in player.events if event == name]
+
+def test_plays_cycles(player):
+    """A run given a number of cycles plays exactly that many, on schedule, and ends on the last step."""
+    started = time.perf_counter()
+    metrics = player.play(cycles=3)
+    assert time.perf_counter() - started >= 3 * 0.2 - 0.01
+    assert len(events_named(player, "cycle")) == 3
+    stopped = events_named(player, "stopped")[-1]
+    assert stopped["finished"] and stopped["cycles"] == 3 and stopped["error"] is None
+    assert metrics.lateness.count == 3 * STEPS
+    assert step_held(player) == STEPS - 1
+    assert player.position == 0 and not player.playing
+
+def test_nothing_to_play(board):
+    """Playing before a gait and settings are given does nothing."""
+    player = PlaybackSession(board, log_level="silent")
+    assert player.play(cycles=1) is None
+    assert not player.playing
+
+def test_stop_when_idle(player):
+    """Stopping when nothing is playing can't stop the next run before it starts."""
+    player.stop()
+    player.start(cycles=2)
+    player.thread.join(2)
+    assert events_named(player, "stopped")[-1]["cycles"] == 2
+
+def test_resume_from_what_was_output(player):
+    """Stopping part way holds the step that was really output, and resuming carries on after it."""
+    player.start()
+    time.sleep(0.13)
+    player.stop(hold=True)
+    held = step_held(player)
+    assert player.position == held + 1
+    assert int(player.last_frame[0] * OUTPUT_SCALE) == register(player.board, 0)
+
+    player.start(cycles=1, start_step=player.position)
+    player.thread.join(2)
+    stopped = events_named(player, "stopped")[-1]
+    assert stopped["finished"] and stopped["cycles"] == 1
+    assert step_held(player) == STEPS - 1
+
+def test_stop_without_holding(player):
+    """Stopping without holding shuts every output off."""
+    player.start()
+    time.sleep(0.05)
+    player.stop(hold=False)
+    assert register(player.board, 0) == 0
+    # the next run fades in from zero
+    assert not player.last_frame.any()
+
+def test_duration(player):
+    """A run given a duration stops once the time is up, even mid-cycle."""
+    started = time.perf_counter()
+    player.play(duration=0.15)
+    assert 0.15 <= time.perf_counter() - started < 0.5
+    assert not events_named(player, "stopped")[-1]["finished"]
+
+def test_change_at_step(player):
+    """A change to the multiplier at the next step takes over without waiting for the cycle to end."""
+    player.start()
+    time.sleep(0.03)
+    player.set_multiplier(0.25, STEP_BOUNDARY)
+    # the writer threads still send what was queued before the change
+    time.sleep(0.03 + pipeline.PIPELINE_DEPTH * 0.2 / STEPS)
+    player.stop(hold=True)
+    assert 0 < player.position < STEPS
+    assert player.last_frame[0] == pytest.approx(0.25 * player.position / 10)
+    assert int(player.last_frame[0] * OUTPUT_SCALE) == register(player.board, 0)
+
+def test_failed_run_cleans_up(player):
+    """An I2C error ends the run with the error raised, playback marked stopped, and no threads left."""
+    threads_before = set(threading.enumerate())
+    simulation.get_bus(1).error_rate = 1.0
+    with pytest.raises(OSError):
+        player.play(cycles=2)
+    assert not player.playing
+    assert "simulated I2C error" in events_named(player, "stopped")[-1]["error"]
+    assert set(threading.enumerate()) <= threads_before
+
+    # the next run isn't affected
+    simulation.get_bus(1).error_rate = 0.0
+    player.play(cycles=1)
+    assert events_named(player, "stopped")[-1]["finished"]
+
+def test_cycle_time_has_to_be_positive(player):
+    """A cycle time of 0 is refused up front, instead of leaving nothing to play."""
+    with pytest.raises(ValueError):
+        player.set_cycle_time(0)
+    assert player.cycle_time == 0.2
+    assert player.prepare() is not None
+    with pytest.raises(ValueError):
+        api.play(player, player.prepared[:2], 0, 0.5, cycles=1)
+
+def held_steady(player, cycle_time):
+    """
+    Switches the session to a gait that only changes once a cycle, played sparsely,
+    so a lost interrupt would leave playback asleep for nearly a whole cycle.
+        :param player: is the session from the player fixture.
+        :param cycle_time: is the long cycle time to use.
+    """
+    player.set_cycle_time(cycle_time)
+    player.load(CompactTimeline.from_lists([[Interval(0, STEPS, 10)]]), STEPS, "steady")
+
+def at_next_boundary(player, action):
+    """
+    Makes an action happen right after playback next checks for a change,
+    the moment a stop() or change from another thread would be easiest to lose.
+        :param player: is the session from the player fixture.
+        :param action: is the function to call then.
+    """
+    take_change = player.take_change
+
+    def take_change_then_act(at_cycle_start):
+        changed = take_change(at_cycle_start)
+        player.take_change = take_change
+        action()
+        return changed
+    player.take_change = take_change_then_act
+
+def test_stop_at_a_step_boundary(player, monkeypatch):
+    """A stop that comes in just as a cycle starts still ends it at once."""
+    monkeypatch.setattr(session, "SPARSE_PLAYBACK", True)
+    held_steady(player, 2.0)
+    # what stop() does, without waiting for the thread it's called from
+    at_next_boundary(player, lambda: (player.stopping.set(), player.interrupt.set()))
+    started = time.perf_counter()
+    player.play(cycles=1)
+    assert time.perf_counter() - started < 0.5
+    assert not events_named(player, "stopped")[-1]["finished"]
+
+def test_change_at_a_step_boundary(player, monkeypatch):
+    """A change at the next step that comes in just as a cycle starts takes over at once."""
+    monkeypatch.setattr(session, "SPARSE_PLAYBACK", True)
+    held_steady(player, 2.0)
+    at_next_boundary(player, lambda: player.set_multiplier(0.25, STEP_BOUNDARY))
+    player.start(cycles=1)
+    time.sleep(0.3)
+    assert register(player.board, 0) == OUTPUT_SCALE // 4
+    player.stop()
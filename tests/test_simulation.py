@@ -0,0 +1,75 @@
+#!/usr/bin/python3
+"""
+    Tests for simulation.py: the simulated PCA9685 keeps its registers
+    like the real chip, and the simulated bus counts and times its
+    transactions.
+"""
+
+import pytest # install package by typing: pip install pytest
+import simulation
+from scheduler import clock
+from simulation import SimulatedBus, SimulatedPCA9685, SimulatedI2CDevice
+
+def test_set_pwm_and_get_pwm():
+    """What set_pwm() writes is what get_pwm() reads back."""
+    board = SimulatedPCA9685()
+    assert board.get_pwm(5) == (0, 0)
+    board.set_pwm(5, 100, 3000)
+    assert board.get_pwm(5) == (100, 3000)
+    board.set_all_pwm(0, 4096)
+    assert [board.get_pwm(channel) for channel in (0, 15)] == [(0, 4096), (0, 4096)]
+
+def test_power_on_registers():
+    """A chip nobody has set up yet has every channel fully off, like the real one."""
+    device = SimulatedI2CDevice(0x40, SimulatedBus())
+    assert device.readU8(simulation.PRE_SCALE) == 0x1E
+    assert device.readU8(simulation.LED0_ON_L + 3) == 0x10
+
+def test_write_list_needs_auto_increment():
+    """Without auto-increment, a block write keeps overwriting the same register."""
+    device = SimulatedI2CDevice(0x40, SimulatedBus())
+    device.write8(simulation.MODE1, 0)
+    device.writeList(simulation.LED0_ON_L, [1, 2, 3])
+    assert list(device.registers[simulation.LED0_ON_L:simulation.LED0_ON_L + 3]) == [3, 0, 0]
+    device.write8(simulation.MODE1, simulation.MODE1_AUTO_INCREMENT)
+    device.writeList(simulation.LED0_ON_L, [1, 2, 3])
+    assert list(device.registers[simulation.LED0_ON_L:simulation.LED0_ON_L + 3]) == [1, 2, 3]
+
+def test_bus_counts_transactions():
+    """Each transaction is counted with its bytes and the time it would take."""
+    bus = SimulatedBus(transaction_latency=0.001, byte_latency=0.0001, realtime=False)
+    device = SimulatedI2CDevice(0x40, bus)
+    device.write8(simulation.MODE1, 0)
+    device.writeList(simulation.LED0_ON_L, [0] * 8)
+    assert (bus.transactions, bus.bytes) == (2, 2 + 9)
+    assert bus.busy_time == pytest.approx(2 * 0.001 + 11 * 0.0001)
+    bus.reset()
+    assert (bus.transactions, bus.bytes, bus.busy_time) == (0, 0, 0.0)
+
+def test_realtime_bus_takes_time():
+    """A realtime bus blocks for as long as each transaction would take."""
+    bus = SimulatedBus(transaction_latency=0.005, byte_latency=0.0, realtime=True)
+    started = clock()
+    for _ in range(4):
+        bus.transfer(2)
+    assert clock() - started >= 4 * 0.005
+
+def test_injected_errors():
+    """With an error rate of 1, every transaction fails and is counted as an error."""
+    bus = SimulatedBus(error_rate=1.0, realtime=False, seed=1)
+    with pytest.raises(OSError):
+        bus.transfer(2)
+    assert bus.errors == 1
+
+def test_absent_device():
+    """Nothing answers at an address with no device, but the attempt still uses the bus."""
+    bus = SimulatedBus(realtime=False)
+    device = SimulatedI2CDevice(0x70, bus, present=False)
+    with pytest.raises(OSError):
+        device.readU8(0)
+    assert bus.transactions == 1
+
+def test_shared_bus():
+    """Boards with the same bus number share one bus, like on the real hardware."""
+    assert simulation.get_bus(1) is simulation.get_bus(1)
+    assert simulation.get_bus(1) is not simulation.get_bus(2)
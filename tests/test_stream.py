@@ -0,0 +1,140 @@
+#!/usr/bin/python3
+"""
+    Tests for stream.py: frames another process writes to a ring buffer
+    reach the simulated boards, bad frames don't, and the outputs go
+    stale when the frames stop or lag.
+"""
+
+import os
+import threading
+import time
+import numpy # install package by typing: pip install numpy
+import pytest # install package by typing: pip install pytest
+from stream import FrameRing, follow_ring, STALE_HOLD, STALE_ZERO
+from scheduler import clock
+from output import OUTPUT_SCALE
+from conftest import register, unlink_ring
+
+@pytest.fixture
+def ring(request):
+    """
+    Returns a new ring buffer of 32 channel frames, deleted after the test.
+    """
+    ring = FrameRing("pneunet-test-{}-{}".format(os.getpid(), request.node.name[-20:]),
+                     channels=32, capacity=8, create=True)
+    yield ring
+    unlink_ring(ring)
+
+class Follower:
+    """
+    Runs follow_ring() in a thread, the way playback does.
+    """
+
+    def __init__(self, board, ring, **options):
+        self.stopping = threading.Event()
+        self.stale = []
+        self.counts = None
+        self.thread = threading.Thread(target=self.run, args=(board, ring, options))
+        self.thread.start()
+        # frames written before it started following are ignored
+        time.sleep(0.01)
+
+    def run(self, board, ring, options):
+        self.counts = follow_ring(board, ring, self.stopping, on_stale=self.stale.append, **options)
+
+    def stop(self):
+        self.stopping.set()
+        self.thread.join()
+        return self.counts
+
+def write_frames(ring, values, count=5, lag=0.0, period=0.005):
+    """
+    Writes the same frame several times, like a controller would.
+        :param ring: is the FrameRing to write to.
+        :param values: is the frame to write.
+        :param count: is how many times to write it.
+        :param lag: is how many seconds old each frame is stamped as.
+        :param period: is how long to wait after each one.
+    """
+    for _ in range(count):
+        ring.write(values, stamp=clock() - lag)
+        time.sleep(period)
+
+def test_sequence_and_read(ring):
+    """Frames are numbered from 1, and one that has been overwritten can't be read."""
+    assert ring.sequence() == 0
+    for value in range(10):
+        ring.write([value / 10.0] * 32)
+    assert ring.sequence() == 10
+    stamp, frame = ring.read(10)
+    assert frame[0] == pytest.approx(0.9)
+    assert ring.read(1) is None and not ring.valid(1)
+
+def test_attach(ring):
+    """Another process's view of the ring sees the same frames."""
+    other = FrameRing(ring.name)
+    ring.write([0.5] * 32)
+    assert (other.channels, other.capacity, other.sequence()) == (32, 8, 1)
+    assert other.read(1)[1][0] == 0.5
+    other.close()
+
+def test_frames_reach_the_boards(board, ring):
+    """The newest frame is sent, and the ones it replaced are counted as skipped."""
+    follower = Follower(board, ring)
+    write_frames(ring, [0.25] * 32)
+    for value in range(5):
+        ring.write([value / 10.0] * 32)
+    time.sleep(0.02)
+    counts = follower.stop()
+    assert register(board, 31) == int(0.4 * OUTPUT_SCALE)
+    assert counts["sent"] >= 2
+    assert counts["sent"] + counts["skipped"] + counts["torn"] == 10
+
+def test_out_of_range_is_clipped(board, ring):
+    """Values past 1 would set the full-off bit, so they're clipped to 1."""
+    follower = Follower(board, ring)
+    frame = [0.5] * 32
+    frame[0], frame[1] = 3.0, -1.0
+    write_frames(ring, frame)
+    counts = follower.stop()
+    assert counts["clipped"] == counts["sent"] > 0
+    assert register(board, 0) == OUTPUT_SCALE
+    assert register(board, 1) == 0
+
+def test_nan_is_not_sent(board, ring):
+    """A frame with NaN in it is skipped, and the outputs keep the last good one."""
+    follower = Follower(board, ring)
+    write_frames(ring, [0.5] * 32)
+    frame = [0.9] * 32
+    frame[3] = float("nan")
+    write_frames(ring, frame)
+    counts = follower.stop()
+    assert counts["bad"] > 0
+    assert register(board, 0) == OUTPUT_SCALE // 2
+
+@pytest.mark.parametrize("policy", [STALE_HOLD, STALE_ZERO])
+def test_stopped_controller_goes_stale(board, ring, policy):
+    """When the frames stop coming, the stale policy decides what the outputs do."""
+    follower = Follower(board, ring, stale_time=0.02, policy=policy)
+    write_frames(ring, [0.5] * 32)
+    time.sleep(0.05)
+    write_frames(ring, [0.25] * 32)
+    counts = follower.stop()
+    assert counts["stale_periods"] >= 1
+    assert follower.stale[:2] == [True, False]
+    assert register(board, 0) == OUTPUT_SCALE // 4
+
+def test_lagging_controller_goes_stale(board, ring):
+    """Frames that are always too old to send make the outputs go stale, even though they keep coming."""
+    follower = Follower(board, ring, stale_time=0.02, policy=STALE_ZERO)
+    write_frames(ring, [0.5] * 32)
+    write_frames(ring, [0.75] * 32, count=15, lag=0.1)
+    counts = follower.stop()
+    assert counts["stale"] > 0
+    assert follower.stale == [True]
+    assert register(board, 0) == 0
+
+def test_unknown_policy(board, ring):
+    """A misspelled stale policy is caught before anything is sent."""
+    with pytest.raises(ValueError):
+        follow_ring(board, ring, threading.Event(), policy="freeze")
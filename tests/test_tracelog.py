@@ -0,0 +1,83 @@
+#!/usr/bin/python3
+"""
+    Tests for tracelog.py: steps recorded into the ring buffer reach the
+    trace file, a full buffer drops the oldest steps and counts them, and
+    each log level prints what it should.
+"""
+
+import numpy # install package by typing: pip install numpy
+import session
+from core import Interval
+from session import PlaybackSession
+from tracelog import TraceLog, SILENT, SUMMARY, TRACE
+
+def trace_lines(path):
+    """
+    Returns the lines of a trace file after the header, split into columns.
+    """
+    with open(path) as file:
+        return [line.rstrip("\n").split("\t") for line in file][1:]
+
+def test_steps_are_written(tmp_path):
+    """Every step recorded ends up in the file, in order, once the log stops."""
+    path = str(tmp_path / "traces" / "walk.log")
+    trace = TraceLog(path, capacity=100, interval=0.01)
+    trace.start()
+    for tick in range(10):
+        trace.record(tick, 1.5 + tick, tick % 4, numpy.array([tick, 0]))
+    trace.stop()
+    lines = trace_lines(path)
+    assert [line[2] for line in lines] == [str(tick) for tick in range(10)]
+    assert lines[5][1:] == ["6.500000", "5", "1", "[5, 0]"]
+    assert (trace.recorded, trace.written, trace.dropped()) == (10, 10, 0)
+
+def test_full_buffer_drops_the_oldest(tmp_path):
+    """When the file falls behind, the oldest steps are dropped and counted, and recording never blocks."""
+    path = str(tmp_path / "walk.log")
+    # so long between writes that nothing is written until it stops
+    trace = TraceLog(path, capacity=4, interval=60)
+    trace.start()
+    for tick in range(10):
+        trace.record(tick, 0.0, 0, numpy.array([tick]))
+    assert trace.dropped() == 6
+    trace.stop()
+    assert [line[2] for line in trace_lines(path)] == ["6", "7", "8", "9"]
+    assert (trace.recorded, trace.written, trace.dropped()) == (10, 4, 6)
+
+def test_flushing_while_recording(tmp_path):
+    """Steps written out between records aren't counted as dropped."""
+    trace = TraceLog(str(tmp_path / "walk.log"), capacity=4, interval=60)
+    trace.start()
+    for tick in range(12):
+        trace.record(tick, 0.0, 0, numpy.array([tick]))
+        if tick % 4 == 3:
+            trace.flush()
+    trace.stop()
+    assert (trace.written, trace.dropped()) == (12, 0)
+
+def play_at(board, level, capsys):
+    """
+    Plays two cycles at a log level and returns what was printed.
+        :param board: is the connected PWM_board.
+        :param level: is the log level.
+        :param capsys: is pytest's fixture for output.
+    """
+    player = PlaybackSession(board, log_level=level)
+    player.cycle_time, player.multiplier = 0.02, 0.5
+    player.load([[Interval(0, 2, 5)]], 4, "walk.gait")
+    capsys.readouterr()
+    player.play(cycles=2)
+    return capsys.readouterr().out
+
+def test_log_levels(board, tmp_path, monkeypatch, capsys):
+    """Silent prints nothing, summary prints a line a cycle, and trace saves every step too."""
+    assert play_at(board, SILENT, capsys) == ""
+    printed = play_at(board, SUMMARY, capsys)
+    assert "Cycle #1" in printed and "Cycle #2" in printed
+
+    folder = tmp_path / "traces"
+    monkeypatch.setattr(session, "TRACE_FOLDER", str(folder))
+    printed = play_at(board, TRACE, capsys)
+    assert "Saved trace to" in printed
+    (path,) = folder.iterdir()
+    assert len(trace_lines(str(path))) == 2 * 4
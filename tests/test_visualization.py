@@ -0,0 +1,97 @@
+#!/usr/bin/python3
+"""
+    Tests for visualization.py: zooming out, runs of equal values, and
+    paging through a TimelineView.
+"""
+
+import numpy # install package by typing: pip install numpy
+import pytest # install package by typing: pip install pytest
+import visualization
+from visualization import TimelineView, runs, zoom_out
+
+def ramp(steps, channels=2):
+    """
+    Returns a matrix where every channel holds the step number, mod 10.
+    """
+    return numpy.repeat((numpy.arange(steps) % 10)[:, None], channels, axis=1)
+
+def test_zoom_out_keeps_the_highest_value():
+    """Each zoomed row holds the peak of its steps, so a one-step pulse still shows."""
+    amplitudes = numpy.array([[0], [7], [0], [0], [0], [3]])
+    assert zoom_out(amplitudes, 2)[:, 0].tolist() == [7, 0, 3]
+    # the last row is padded with the last step, not with zeros
+    assert zoom_out(amplitudes, 4)[:, 0].tolist() == [7, 3]
+    # a zoom of 1 is the matrix itself
+    assert zoom_out(amplitudes, 1) is amplitudes
+
+def test_runs():
+    assert runs(numpy.array([])) == []
+    assert runs(numpy.array([5, 5, 5, 0, 2, 2])) == [(5, 3), (0, 1), (2, 2)]
+
+def test_view_zooms_out_to_fit_one_page():
+    """A long timeline starts zoomed out just enough to fit the page."""
+    view = TimelineView(ramp(100), width=40)
+    # a one digit channel number, " >  ", and two characters per cell
+    assert view.columns == (40 - 1 - 4) // 2
+    assert view.zoom == 8
+    assert -(-100 // view.zoom) <= view.columns
+    # a short timeline isn't zoomed at all
+    assert TimelineView(ramp(5), width=40).zoom == 1
+
+def test_paging_stays_inside_the_timeline():
+    view = TimelineView(ramp(100), width=40)
+    view.set_zoom(1)
+    assert view.first_column == 0
+    view.page(1)
+    assert view.first_column == view.columns
+    # can't go past the last page or before the first one
+    view.page(100)
+    assert view.first_column == (100 - 1) // view.columns * view.columns
+    view.page(-100)
+    assert view.first_column == 0
+
+def test_zoom_keeps_the_left_step_in_view():
+    view = TimelineView(ramp(100), width=40)
+    view.set_zoom(1)
+    view.page(2)
+    first_step = view.first_column
+    view.set_zoom(2)
+    # the column now starts at the same step
+    assert view.first_column == first_step // 2
+    assert view.render(color=False).splitlines()[0].startswith("steps {}-".format(first_step))
+    # a zoom under 1 is treated as 1
+    view.set_zoom(0)
+    assert view.zoom == 1
+
+def test_render_page():
+    view = TimelineView(numpy.array([[0, 1], [2, 3], [4, 5]]), width=40)
+    assert view.render(color=False).splitlines() == [
+        "steps 0-2 of 3, 1 step per column",
+        "0 >  0 2 4 ",
+        "1 >  1 3 5 "]
+
+def test_compressed_runs(monkeypatch):
+    """Runs at least RUN_LENGTH_MIN long are shortened to value*count."""
+    monkeypatch.setattr(visualization, "RUN_LENGTH_MIN", 3)
+    view = TimelineView(numpy.array([[0], [0], [0], [0], [1], [1], [2]]), width=40)
+    view.compress = True
+    assert view.render(color=False).splitlines()[1] == "0 >  0*4 1 1 2 "
+    view.compress = False
+    assert view.render(color=False).splitlines()[1] == "0 >  0 0 0 0 1 1 2 "
+
+def test_save_writes_every_step(tmp_path):
+    view = TimelineView(ramp(100), width=40)
+    view.save(str(tmp_path / "timeline.txt"))
+    lines = (tmp_path / "timeline.txt").read_text().splitlines()
+    # the whole timeline, not just the zoomed out page, and no color codes
+    assert lines[0] == "steps 0-99 of 100, 1 step per column"
+    assert len(lines[1].split()) == 2 + 100
+    assert "\x1b" not in "".join(lines)
+
+def test_save_html(tmp_path):
+    view = TimelineView(numpy.array([[0], [0], [9]]), width=40)
+    view.save(str(tmp_path / "timeline.html"))
+    text = (tmp_path / "timeline.html").read_text()
+    # a run of equal values is one cell
+    assert "<td colspan=\"2\"" in text
+    assert text.count("<td") == 2
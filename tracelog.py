@@ -0,0 +1,120 @@
+#!/usr/bin/python3
+"""
+    This module keeps playback's logging off the real-time path. Each
+    step is recorded into an in-memory ring buffer, and a background
+    thread writes the buffer out to a trace file, so a slow terminal
+    or disk can't make steps late.
+"""
+
+# Global setting for how much playback logs: "silent" (nothing printed), "summary" (a line
+# each cycle), or "trace" (every step, saved to a file in TRACE_FOLDER)
+LOG_LEVEL = "summary"
+# Global setting for the folder traces are saved in
+TRACE_FOLDER = "traces"
+# Global setting for how many steps the ring buffer holds before the oldest are dropped
+TRACE_CAPACITY = 65536
+# Global setting for how often the background thread writes the buffer out (seconds)
+FLUSH_INTERVAL = 0.25
+
+# Logging levels
+SILENT = "silent"
+SUMMARY = "summary"
+TRACE = "trace"
+LOG_LEVELS = (SILENT, SUMMARY, TRACE)
+
+from collections import deque
+import os
+import threading
+from scheduler import clock
+
+class TraceLog:
+    """
+    Records every step that's output into a ring buffer, and writes them to
+    a file from a background thread. Recording never blocks; if the file
+    falls too far behind, the oldest steps are dropped and counted.
+    """
+
+    def __init__(self, path, capacity=None, interval=None):
+        """
+        Makes a trace log. Call start() before recording.
+            :param path: is the file to write the trace to.
+            :param capacity: is how many steps the buffer holds. Defaults to TRACE_CAPACITY.
+            :param interval: is how often to write the buffer out. Defaults to FLUSH_INTERVAL.
+        """
+        self.path = path
+        self.interval = FLUSH_INTERVAL if interval is None else interval
+        # appending to a deque is atomic, so recording needs no lock.
+        # once it's full, each append pushes out the oldest entry
+        self.buffer = deque(maxlen=TRACE_CAPACITY if capacity is None else capacity)
+        self.recorded = 0
+        self.written = 0
+        self.file = None
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def start(self):
+        """
+        Opens the trace file and starts writing to it in a background thread.
+        """
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.file = open(self.path, "w")
+        # time is when the step was output, or queued for the writer threads
+        self.file.write("time\tdeadline\ttick\tstep\tamplitudes\n")
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def record(self, tick, deadline, step, values):
+        """
+        Records one step that was output. Safe to call on the real-time path:
+        the values are only formatted later, in the background thread.
+            :param tick: is the scheduler step it was output on.
+            :param deadline: is the clock() value the step was due at.
+            :param step: is the step of the cycle.
+            :param values: is the row of amplitudes that was output. It must not change afterwards.
+        """
+        self.buffer.append((clock(), deadline, tick, step, values))
+        self.recorded += 1
+
+    def run(self):
+        """
+        Writes the buffer out every interval until stopped. Runs in its own thread.
+        """
+        while not self.stopped.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        """
+        Writes everything in the buffer to the file.
+        """
+        lines = []
+        while True:
+            try:
+                time, deadline, tick, step, values = self.buffer.popleft()
+            except IndexError:
+                break
+            lines.append("{:.6f}\t{:.6f}\t{}\t{}\t{}\n".format(time, deadline, tick, step, values.tolist()))
+        self.written += len(lines)
+        self.file.writelines(lines)
+        self.file.flush()
+
+    def dropped(self):
+        """
+        Returns how many steps were pushed out of the buffer before they could be written.
+        """
+        return self.recorded - self.written - len(self.buffer)
+
+    def stop(self):
+        """
+        Stops the background thread, writes out what's left, and closes the file.
+        """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
@@ -6,35 +6,195 @@
     This module has functions to help with visualizing timelines.
 """
 
-from ansicolor import black # install package by typing: pip install ansicolor
-from core import read_channel
+# Global setting for how many characters wide the printed timeline can be.
+# None uses the width of the terminal
+PAGE_WIDTH = None
+# Global setting for the fewest repeats of a value that compression shortens to value*count
+RUN_LENGTH_MIN = 4
+
+import html
+import shutil
+import numpy # install package by typing: pip install numpy
+from color import black
+from core import compile_timeline
 
 def print_timeline(timeline, steps):
     """
-    Prints a graphical representation of the timeline to the console.
+    Prints a graphical representation of the timeline to the console. Long
+    timelines are zoomed out to fit on one page. Returns the TimelineView
+    so it can be paged through or zoomed in.
         :param timeline: is the 2D array of intervals to read.
+        :param steps: is the number of steps in one cycle.
     """
+    # this is the same matrix the playback reads from
+    view = TimelineView(compile_timeline(timeline, steps))
+    view.show()
+    return view
 
-    print() # newline
+def zoom_out(amplitudes, zoom):
+    """
+    Returns a matrix with one row for every few steps, holding the highest
+    amplitude of each channel over those steps, so short pulses still show.
+        :param amplitudes: is the matrix returned by compile_timeline().
+        :param zoom: is how many steps go in each row.
+    """
+    if zoom <= 1:
+        return amplitudes
+    rows = -(-len(amplitudes) // zoom) # round up
+    # pad the end with the last step so the matrix splits evenly
+    padded = numpy.concatenate([amplitudes, numpy.repeat(amplitudes[-1:], rows * zoom - len(amplitudes), axis=0)])
+    return padded.reshape(rows, zoom, -1).max(axis=1)
+
+def runs(values):
+    """
+    Returns a list of (value, count) for each run of equal values in a row.
+        :param values: is a 1D array.
+    """
+    if len(values) == 0:
+        return []
+    # where each run starts
+    starts = numpy.flatnonzero(numpy.concatenate([[True], values[1:] != values[:-1]]))
+    counts = numpy.diff(numpy.append(starts, len(values)))
+    return list(zip(values[starts].tolist(), counts.tolist()))
+
+class TimelineView:
+    """
+    Renders a compiled timeline as text, a page at a time, with a channel on
+    each line. Each line is built in one pass from the compiled matrix.
+    """
 
-    # count number of digits of left column to align numbers
-    pad_length = len(str(len(timeline)))
+    def __init__(self, amplitudes, width=None):
+        """
+        Makes a view zoomed out just enough to fit the whole cycle on one page.
+            :param amplitudes: is the matrix returned by compile_timeline().
+            :param width: is how many characters wide a page can be. Defaults to
+                PAGE_WIDTH, or the width of the terminal.
+        """
+        self.amplitudes = amplitudes
+        if width is None:
+            width = PAGE_WIDTH or shutil.get_terminal_size().columns
+        # every cell is the same width, so the columns line up
+        values = numpy.unique(amplitudes).tolist() if amplitudes.size else [0]
+        self.cell_width = max(len(str(value)) for value in values) + 1
+        # count number of digits of left column to align numbers
+        self.pad_length = len(str(amplitudes.shape[1]))
+        self.columns = max(1, (width - self.pad_length - 4) // self.cell_width)
+        self.compress = False
+        self.first_column = 0
+        self.zoom = 1
+        # zoom out until the whole cycle fits on one page
+        while -(-len(amplitudes) // self.zoom) > self.columns:
+            self.zoom *= 2
 
-    # print the row
-    for channel in range(0, len(timeline)):
-        current_index = 0
-        amp = 0
-        print(str(channel).zfill(pad_length), " >  ", sep='', end='')
-        # print the columns
-        for current_time in range(0, steps):
-            (amp, current_index) = read_channel(timeline, channel, current_index, current_time)
-            # make the zeros stand out. easier to look at that way
-            if amp == 0:
-                print(black(str(amp), bold=True), " ", sep='', end='')
+    def cell(self, text, value, color):
+        """
+        Returns a padded cell for the console.
+            :param text: is what the cell says.
+            :param value: is the amplitude it stands for.
+            :param color: is whether to make zeros stand out with color.
+        """
+        # always at least one space after, even when a run's text is wider than a cell
+        text = text.ljust(self.cell_width - 1) + " "
+        # make the zeros stand out. easier to look at that way
+        return black(text, bold=True) if color and value == 0 else text
+
+    def render_row(self, values, color):
+        """
+        Returns the text of one channel's row.
+            :param values: is the 1D array of the values to show.
+            :param color: is whether to make zeros stand out with color.
+        """
+        if not self.compress:
+            # one string per value, worked out once, so the row is a single join
+            cells = {value: self.cell(str(value), value, color) for value in numpy.unique(values).tolist()}
+            return "".join(map(cells.__getitem__, values.tolist()))
+        pieces = []
+        for value, count in runs(values):
+            if count >= RUN_LENGTH_MIN:
+                pieces.append(self.cell("{}*{}".format(value, count), value, color))
             else:
-                print(amp, " ", sep='', end='')
-        print() # newline
-    print() # newline
+                pieces.append(self.cell(str(value), value, color) * count)
+        return "".join(pieces)
+
+    def render(self, color=True, whole=False):
+        """
+        Returns the text of the current page.
+            :param color: is whether to make zeros stand out with color.
+            :param whole: is whether to show every step instead of just this page.
+        """
+        zoomed = self.amplitudes if whole else zoom_out(self.amplitudes, self.zoom)
+        zoom = 1 if whole else self.zoom
+        first = 0 if whole else self.first_column
+        last = len(zoomed) if whole else min(len(zoomed), first + self.columns)
+        page = zoomed[first:last]
+
+        lines = ["steps {}-{} of {}, {} step{} per column".format(
+            first * zoom, min(last * zoom, len(self.amplitudes)) - 1, len(self.amplitudes),
+            zoom, "" if zoom == 1 else "s")]
+        # a column of the matrix is a row on the screen
+        for channel, values in enumerate(page.T):
+            lines.append(str(channel).zfill(self.pad_length) + " >  " + self.render_row(values, color))
+        return "\n".join(lines)
+
+    def show(self):
+        """
+        Prints the current page in one go.
+        """
+        print("\n" + self.render() + "\n")
+
+    def page(self, pages):
+        """
+        Moves forward or back some pages, staying inside the timeline.
+            :param pages: is how many pages to move. Negative moves back.
+        """
+        zoomed_length = -(-len(self.amplitudes) // self.zoom)
+        last_page = (zoomed_length - 1) // self.columns
+        self.first_column = min(max(self.first_column // self.columns + pages, 0), last_page) * self.columns
+
+    def set_zoom(self, zoom):
+        """
+        Changes how many steps go in each column, keeping the step at the
+        left of the page in view.
+            :param zoom: is the new number of steps per column, at least 1.
+        """
+        first_step = self.first_column * self.zoom
+        self.zoom = max(1, zoom)
+        self.first_column = first_step // self.zoom
+        self.page(0)
+
+    def save(self, filename):
+        """
+        Writes every step of the timeline to a file, as an HTML table if the
+        filename ends with .html and as plain text otherwise.
+            :param filename: is the path of the file to write.
+        """
+        if filename.lower().endswith((".html", ".htm")):
+            text = self.render_html()
+        else:
+            text = self.render(color=False, whole=True) + "\n"
+        with open(filename, "w") as file:
+            file.write(text)
+
+    def render_html(self):
+        """
+        Returns an HTML page with a table of the whole timeline. Each run of equal
+        values is one cell, shaded darker for higher amplitudes.
+        """
+        highest = max(1, int(self.amplitudes.max())) if self.amplitudes.size else 1
+        lines = ["<!DOCTYPE html>", "<html><head><meta charset=\"utf-8\"><style>",
+                 "table { border-collapse: collapse; font-family: monospace; }",
+                 "td { border: 1px solid #ddd; padding: 0 2px; text-align: center; }",
+                 "</style></head><body><table>",
+                 "<tr><th></th>" + "".join("<th>{}</th>".format(step) for step in range(len(self.amplitudes))) + "</tr>"]
+        for channel, values in enumerate(self.amplitudes.T):
+            cells = []
+            for value, count in runs(values):
+                shade = 255 - int(180 * min(value, highest) / highest)
+                cells.append("<td colspan=\"{}\" style=\"background: rgb({}, {}, 255)\">{}</td>".format(
+                    count, shade, shade, html.escape(str(value))))
+            lines.append("<tr><th>{}</th>{}</tr>".format(channel, "".join(cells)))
+        lines.append("</table></body></html>")
+        return "\n".join(lines) + "\n"
 
 def interval_to_string(interval):
     """
@@ -0,0 +1,96 @@
+#!/usr/bin/python3
+"""
+    This module watches the gait file that's playing. When it's saved,
+    the new version is parsed and compiled in the background, ready to
+    be swapped in at the next cycle without stopping playback.
+"""
+
+# Global setting for whether a playing gait reloads when its file changes
+HOT_RELOAD = True
+# Global setting for how often to check the file for changes (seconds)
+WATCH_INTERVAL = 0.5
+
+import os
+import threading
+from cache import load_timeline
+
+class GaitWatcher:
+    """
+    Polls a gait file from a background thread and prepares the new
+    version whenever the file changes.
+    """
+
+    def __init__(self, filename, prepare, interval=None):
+        """
+        Makes a watcher. Call start() to begin watching.
+            :param filename: is the gait file to watch.
+            :param prepare: is a function taking (timeline, steps) that returns whatever
+                playback needs to swap in. It runs in the background thread.
+            :param interval: is how often to check the file. Defaults to WATCH_INTERVAL.
+        """
+        self.filename = filename
+        self.prepare = prepare
+        self.interval = WATCH_INTERVAL if interval is None else interval
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+        self.pending = None
+        self.thread = None
+        self.last_stat = self.stat()
+
+    def stat(self):
+        """
+        Returns something that changes whenever the file is saved, or None if it's missing.
+        """
+        try:
+            info = os.stat(self.filename)
+        except OSError:
+            return None
+        return info.st_mtime_ns, info.st_size
+
+    def start(self):
+        """
+        Starts watching in a background thread.
+        """
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops watching and waits for the background thread to finish.
+        """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        """
+        Checks the file every interval until stopped. Runs in its own thread.
+        """
+        while not self.stopped.wait(self.interval):
+            current = self.stat()
+            if current is None or current == self.last_stat:
+                continue
+            self.last_stat = current
+
+            timeline, steps, errors = load_timeline(self.filename)
+            # keep playing the old version rather than an empty one
+            if not timeline:
+                print("\nReloaded file has no valid intervals. Keeping the old version.")
+                continue
+            if errors:
+                print("\nReloaded file has {} errors. Check it in the editor/visualizer.".format(len(errors)))
+
+            prepared = self.prepare(timeline, steps)
+            with self.lock:
+                self.pending = prepared
+
+    def take(self):
+        """
+        Returns the newest prepared version of the file and forgets it,
+        or None if the file hasn't changed since the last call.
+        """
+        with self.lock:
+            prepared, self.pending = self.pending, None
+        return prepared